@@ -113,7 +113,7 @@ class API:
 
             instance = ec2client.create_instance(
                 ec2_conn,
-                user_data=cloud_init.userdata(),
+                user_data=cloud_init.userdata(max_size=ud.MAX_USER_DATA_SIZE),
                 image_id=base_image_id,
                 instance_type='t2.small',
                 key=key,
@@ -10,8 +10,11 @@ import collections
 import functools
 import logging
 import math
+import multiprocessing
+import queue
 import random
 import re
+import threading
 import time
 
 from botocore import exceptions as botoexc
@@ -27,8 +30,15 @@ from treadmill.syscall import krb5
 
 from treadmill_aws import aws
 from treadmill_aws import awscontext
+from treadmill_aws import blackout
+from treadmill_aws import cache
 from treadmill_aws import hostmanager
 from treadmill_aws import ec2client
+from treadmill_aws import metrics
+from treadmill_aws import provisioning
+from treadmill_aws import spotinterruption
+from treadmill_aws import spotranking
+from treadmill_aws import userdata
 
 
 _LOGGER = logging.getLogger(__name__)
@@ -41,6 +51,18 @@ _SERVER_START_INTERVAL = 5 * 60
 
 _CREATE_HOST_MAX_TRIES = 3
 
+_ROTATION_POLL_INTERVAL = 30
+_ROTATION_UP_TIMEOUT = 15 * 60
+_ROTATION_DRAIN_TIMEOUT = 30 * 60
+
+LAUNCH_FAILURES_TOTAL = 'treadmill_aws_launch_failures_total'
+
+# Provisioning context is reloaded when modified (see provisioning), TTL
+# covers changes made bypassing the CLI.
+_PROVISIONING_CONTEXT_TTL = 10 * 60
+
+_PROVISIONING_CONTEXT = cache.TTLCache(_PROVISIONING_CONTEXT_TTL)
+
 
 class InstanceFeasibilityTracker:
     """Tracks instance creation failures."""
@@ -70,6 +92,10 @@ class InstanceFeasibilityTracker:
         self._excluded_subnets.add(subnet)
 
 
+class RotationError(Exception):
+    """Rotation wave failed, remaining waves are cancelled."""
+
+
 class ExpiredCredentialsError(Exception):
     """Error indicating that AWS credentials expired."""
     pass
@@ -111,6 +137,29 @@ def _no_exc(func):
     return wrapper
 
 
+def _worker_metrics(func):
+    """Decorator to return metrics collected in Pool worker with the result.
+
+    Metrics recorded in the worker process are not visible to the parent,
+    worker returns res, snapshot instead, parent merges the snapshot.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        """Wrapper function."""
+        in_worker = multiprocessing.current_process().name != 'MainProcess'
+        if in_worker:
+            # Drop data inherited from the parent (fork) or previous tasks.
+            metrics.GLOBAL.reset()
+        res = func(*args, **kwargs)
+        return res, metrics.GLOBAL.snapshot() if in_worker else None
+    return wrapper
+
+
+def _phase_timer(phase, **labels):
+    """Time autoscale phase."""
+    return metrics.GLOBAL.timer(metrics.PHASE_SECONDS, phase=phase, **labels)
+
+
 def _create_host(ipa_client, ec2_conn, hostname, instance_type, spot, subnets,
                  otp, tracker, **host_params):
     for subnet in subnets:
@@ -140,6 +189,13 @@ def _create_host(ipa_client, ec2_conn, hostname, instance_type, spot, subnets,
                 }
             except botoexc.ClientError as err:
                 err_code = err.response['Error']['Code']
+                metrics.GLOBAL.inc(
+                    LAUNCH_FAILURES_TOTAL,
+                    instance_type=instance_type,
+                    lifecycle='spot' if spot else 'on-demand',
+                    subnet=subnet,
+                    code=err_code
+                )
                 if err_code in ('SpotMaxPriceTooLow',
                                 'InsufficientInstanceCapacity'):
                     _LOGGER.info('Instance not feasible, trying next: %r', err)
@@ -160,29 +216,103 @@ def _create_host(ipa_client, ec2_conn, hostname, instance_type, spot, subnets,
     return None
 
 
-@_check_expired_credentials
-def _create_hosts(hostnames, instance_types, subnets, cell, partition,
-                  **host_params):
-    admin_srv = context.GLOBAL.admin.server()
+def _register_server(admin_srv, hostname, data):
+    """Create server object, update it if it already exists (idempotent)."""
+    try:
+        admin_srv.create(hostname, data)
+    except admin_exceptions.AlreadyExistsResult:
+        admin_srv.update(hostname, data)
+
+
+def _unregister_server(admin_srv, hostname):
+    """Delete server object, ignore if it does not exist (idempotent)."""
+    try:
+        admin_srv.delete(hostname)
+    except admin_exceptions.NoSuchObjectResult:
+        pass
+
+
+class _ServerWriter:
+    """Writes server objects to LDAP in a background thread.
+
+    Writes are queued and done while the caller continues with EC2/IPA
+    calls. Leaving the context waits for all queued writes, the first write
+    error is raised (unless the body failed already).
+    """
+
+    def __init__(self, admin_srv):
+        self.admin_srv = admin_srv
+        self._queue = queue.Queue()
+        self._errors = []
+        self._thread = threading.Thread(
+            name='ldap-writer', target=self._run, daemon=True
+        )
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._queue.put(None)
+        self._thread.join()
+        if exc_type is None and self._errors:
+            raise self._errors[0]
+        return False
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            phase, func, hostname, args, labels = item
+            try:
+                with _phase_timer(phase, **labels):
+                    func(self.admin_srv, hostname, *args)
+            except Exception as err:  # pylint: disable=broad-except
+                _LOGGER.exception('%s failed: %s', phase, hostname)
+                self._errors.append(err)
+
+    def register(self, hostname, data, **labels):
+        """Queue server object creation."""
+        self._queue.put(
+            ('ldap_create', _register_server, hostname, (data,), labels)
+        )
+
+    def unregister(self, hostname):
+        """Queue server object removal."""
+        self._queue.put(
+            ('ldap_delete', _unregister_server, hostname, (), {})
+        )
+
+
+def _launch_hosts(writer, hostnames, instance_types, subnets, cell,
+                  partition, interruption_rates=None, **host_params):
+    """Create hosts, queue server registration after each launch."""
     ipa_client = awscontext.GLOBAL.ipaclient
     ec2_conn = awscontext.GLOBAL.ec2
     subnets = subnets.copy()
     hosts_created = []
 
     tracker = InstanceFeasibilityTracker()
+    ranker = spotranking.InstanceRanker(
+        ec2_conn, tracker, instance_types, subnets,
+        interruption_rates=interruption_rates
+    )
 
     for hostname, try_spot, try_on_demand in hostnames:
         _LOGGER.info('Creating host %s, try spot: %s, try on-demand: %s',
                      hostname, try_spot, try_on_demand)
 
-        otp = hostmanager.create_otp(
-            ipa_client, hostname, host_params['hostgroups'],
-            nshostlocation=host_params['nshostlocation']
-        )
+        with _phase_timer('otp_enrollment', partition=partition):
+            otp = hostmanager.create_otp(
+                ipa_client, hostname, host_params['hostgroups'],
+                nshostlocation=host_params['nshostlocation']
+            )
 
         random.shuffle(subnets)
 
-        for instance_type, spot in instance_types:
+        # Rank for every host, tracker exclusions change as hosts are created.
+        for instance_type, spot in ranker.rank_instance_types():
             if spot and not try_spot:
                 continue
 
@@ -190,7 +320,8 @@ def _create_hosts(hostnames, instance_types, subnets, cell, partition,
                 continue
 
             host = _create_host(
-                ipa_client, ec2_conn, hostname, instance_type, spot, subnets,
+                ipa_client, ec2_conn, hostname, instance_type, spot,
+                ranker.rank_subnets(instance_type, spot, subnets),
                 otp, tracker, **host_params
             )
             if host:
@@ -198,7 +329,7 @@ def _create_hosts(hostnames, instance_types, subnets, cell, partition,
         else:
             raise Exception('Failed to create host %s' % hostname)
 
-        admin_srv.create(
+        writer.register(
             host['hostname'],
             {
                 'cell': cell,
@@ -206,37 +337,68 @@ def _create_hosts(hostnames, instance_types, subnets, cell, partition,
                 'data': {
                     'type': host['type'],
                     'lifecycle': host['lifecycle'],
+                    'subnet': host['subnet'],
                 },
-            }
+            },
+            partition=partition,
+            instance_type=host['type'],
+            lifecycle=host['lifecycle'],
+            subnet=host['subnet']
         )
         hosts_created.append(host)
     return hosts_created
 
 
+@_check_expired_credentials
+def _create_hosts(hostnames, instance_types, subnets, cell, partition,
+                  interruption_rates=None, **host_params):
+    admin_srv = context.GLOBAL.admin.server()
+    with _ServerWriter(admin_srv) as writer:
+        return _launch_hosts(
+            writer, hostnames, instance_types, subnets, cell, partition,
+            interruption_rates=interruption_rates, **host_params
+        )
+
+
 @_check_expired_credentials
 def _delete_hosts(hostnames):
     ec2_conn = awscontext.GLOBAL.ec2
     ipa_client = awscontext.GLOBAL.ipaclient
     admin_srv = context.GLOBAL.admin.server()
 
-    hostmanager.delete_hosts(
-        ipa_client=ipa_client,
-        ec2_conn=ec2_conn,
-        hostnames=hostnames
-    )
+    with _ServerWriter(admin_srv) as writer:
+        unregistered = set()
 
-    for hostname in hostnames:
-        admin_srv.delete(hostname)
+        def _unregister(batch):
+            for hostname in batch:
+                writer.unregister(hostname)
+                unregistered.add(hostname)
+
+        with _phase_timer('termination'):
+            hostmanager.delete_hosts(
+                ipa_client=ipa_client,
+                ec2_conn=ec2_conn,
+                hostnames=hostnames,
+                on_terminated=_unregister
+            )
+
+        # Not reported if termination stopped half way.
+        _unregister(
+            [hostname for hostname in hostnames
+             if hostname not in unregistered]
+        )
 
 
 @_no_exc
+@_worker_metrics
 def _create_hosts_no_exc(hostnames, instance_types, subnets, cell, partition,
-                         **host_params):
+                         interruption_rates=None, **host_params):
     return _create_hosts(hostnames, instance_types, subnets, cell, partition,
-                         **host_params)
+                         interruption_rates=interruption_rates, **host_params)
 
 
 @_no_exc
+@_worker_metrics
 def _delete_hosts_no_exc(hostnames):
     return _delete_hosts(hostnames)
 
@@ -294,24 +456,11 @@ def _instance_types(instance_types, spot_instance_types):
     return res
 
 
-@aws.profile
-@_check_expired_credentials
-def create_n_servers(count, partition=None,
-                     min_on_demand=None, max_on_demand=None, pool=None):
-    """Create new servers in the cell."""
-
-    partition = partition or '_default'  # FIXME: Import name from treadmill.
-
-    _LOGGER.info(
-        'Creating %s servers in %s partition, min on-demand: %s, max: %s',
-        count, partition, min_on_demand, max_on_demand
-    )
-
+def _load_provisioning_context(cell, partition, version):
+    """Load cell/partition provisioning data, resolve image name."""
     ec2_conn = awscontext.GLOBAL.ec2
-    ipa_domain = awscontext.GLOBAL.ipa_domain
 
     admin_cell = context.GLOBAL.admin.cell()
-    cell = context.GLOBAL.cell
     cell_data = admin_cell.get(cell)['data']
 
     admin_part = context.GLOBAL.admin.partition()
@@ -341,15 +490,6 @@ def create_n_servers(count, partition=None,
     spot_instance_types = partition_data.get(
         'spot_instance_types', instance_types
     )
-    spot_duration = partition_data.get('spot_duration')
-    subnets = partition_data.get('subnets', cell_data['subnets'])
-    secgroup_id = partition_data.get('secgroup', cell_data['secgroup'])
-    hostgroups = partition_data.get('hostgroups', cell_data['hostgroups'])
-    instance_profile = partition_data.get(
-        'instance_profile', cell_data['instance_profile']
-    )
-    disk_size = int(partition_data.get('disk_size', cell_data['disk_size']))
-    nshostlocation = cell_data['aws_account']
 
     instance_vars = {
         'treadmill_cell': cell,
@@ -358,9 +498,80 @@ def create_n_servers(count, partition=None,
         'treadmill_dns_domain': context.GLOBAL.dns_domain,
         'treadmill_isa': 'node',
         'treadmill_profile': 'aws',
-        'treadmill_krb_realm': krb5.get_host_realm(sysinfo.hostname())[0],
+        'treadmill_krb_realm': krb5.get_host_realm(
+            sysinfo.hostname()
+        )[0],
+    }
+
+    return {
+        'version': version,
+        'image_id': image_id,
+        'instance_types': _instance_types(
+            instance_types, spot_instance_types
+        ),
+        'spot_duration': partition_data.get('spot_duration'),
+        'subnets': partition_data.get('subnets', cell_data['subnets']),
+        'secgroup_id': partition_data.get('secgroup', cell_data['secgroup']),
+        'hostgroups': partition_data.get(
+            'hostgroups', cell_data['hostgroups']
+        ),
+        'instance_profile': partition_data.get(
+            'instance_profile', cell_data['instance_profile']
+        ),
+        'disk_size': int(
+            partition_data.get('disk_size', cell_data['disk_size'])
+        ),
+        'nshostlocation': cell_data['aws_account'],
+        'instance_vars': instance_vars,
+        # Rendered once, per host only hostname and otp are substituted.
+        'user_data_template': userdata.UserDataTemplate(instance_vars),
     }
 
+
+def _get_provisioning_context(cell, partition):
+    """Return cached provisioning context, reload if config was modified."""
+    version = provisioning.config_version(context.GLOBAL.zk.conn)
+    key = (cell, partition)
+
+    def _loader():
+        with _phase_timer('provisioning_context', partition=partition):
+            return _load_provisioning_context(cell, partition, version)
+
+    provisioning_context = _PROVISIONING_CONTEXT.get(key, _loader)
+    if provisioning_context['version'] != version:
+        _LOGGER.info('Provisioning config modified, reloading: %s', key)
+        _PROVISIONING_CONTEXT.invalidate(key)
+        provisioning_context = _PROVISIONING_CONTEXT.get(key, _loader)
+    return provisioning_context
+
+
+def clear_provisioning_context():
+    """Drop cached provisioning context."""
+    _PROVISIONING_CONTEXT.clear()
+
+
+@aws.profile
+@_check_expired_credentials
+def create_n_servers(count, partition=None,
+                     min_on_demand=None, max_on_demand=None, pool=None,
+                     interruption_rates=None):
+    """Create new servers in the cell.
+
+    Spot instance types and subnets with lower interruption rates (dict of
+    (instance type, subnet) -> rate) are tried first.
+    """
+
+    partition = partition or '_default'  # FIXME: Import name from treadmill.
+
+    _LOGGER.info(
+        'Creating %s servers in %s partition, min on-demand: %s, max: %s',
+        count, partition, min_on_demand, max_on_demand
+    )
+
+    ipa_domain = awscontext.GLOBAL.ipa_domain
+    cell = context.GLOBAL.cell
+    provisioning_context = _get_provisioning_context(cell, partition)
+
     tags = [
         {'Key': 'Cell', 'Value': cell},
         {'Key': 'Partition', 'Value': partition},
@@ -371,25 +582,25 @@ def create_n_servers(count, partition=None,
         min_on_demand=min_on_demand,
         max_on_demand=max_on_demand
     )
-    instance_types = _instance_types(
-        instance_types, spot_instance_types
-    )
+    instance_types = provisioning_context['instance_types']
+    subnets = provisioning_context['subnets']
     host_params = dict(
-        image_id=image_id,
+        image_id=provisioning_context['image_id'],
         count=1,
-        disk=disk_size,
+        disk=provisioning_context['disk_size'],
         domain=ipa_domain,
         key=None,
-        secgroup_ids=secgroup_id,
+        secgroup_ids=provisioning_context['secgroup_id'],
         role='node',
-        instance_vars=instance_vars,
-        instance_profile=instance_profile,
-        hostgroups=hostgroups,
+        instance_vars=provisioning_context['instance_vars'],
+        user_data_template=provisioning_context['user_data_template'],
+        instance_profile=provisioning_context['instance_profile'],
+        hostgroups=provisioning_context['hostgroups'],
         ip_address=None,
         eni=None,
         tags=tags,
-        spot_duration=spot_duration,
-        nshostlocation=nshostlocation,
+        spot_duration=provisioning_context['spot_duration'],
+        nshostlocation=provisioning_context['nshostlocation'],
     )
     if pool:
         func = functools.partial(
@@ -398,17 +609,21 @@ def create_n_servers(count, partition=None,
             subnets=subnets,
             cell=cell,
             partition=partition,
+            interruption_rates=interruption_rates,
             **host_params
         )
         hosts_created = []
         for res, err in pool.map(func, _split_list(hostnames, pool.workers)):
             if err:
                 raise err
-            hosts_created.extend(res)
+            hosts, worker_metrics = res
+            metrics.GLOBAL.merge(worker_metrics)
+            hosts_created.extend(hosts)
         return hosts_created
     else:
         return _create_hosts(
-            hostnames, instance_types, subnets, cell, partition, **host_params
+            hostnames, instance_types, subnets, cell, partition,
+            interruption_rates=interruption_rates, **host_params
         )
 
 
@@ -432,21 +647,261 @@ def delete_servers_by_name(servers, pool=None):
     _LOGGER.info('Deleting servers: %r', servers)
 
     zkclient = context.GLOBAL.zk.conn
-    for server in servers:
-        try:
-            presence.kill_node(zkclient, server)
-        except kazoo.exceptions.NoNodeError:
-            pass
+    with _phase_timer('zk_presence_removal'):
+        for server in servers:
+            try:
+                presence.kill_node(zkclient, server)
+            except kazoo.exceptions.NoNodeError:
+                pass
+            spotinterruption.remove(zkclient, server)
+            blackout.remove(zkclient, server)
 
     if pool:
         batches = _split_list(servers, pool.workers)
-        for _res, err in pool.map(_delete_hosts_no_exc, batches):
+        for res, err in pool.map(_delete_hosts_no_exc, batches):
             if err:
                 raise err
+            _res, worker_metrics = res
+            metrics.GLOBAL.merge(worker_metrics)
     else:
         _delete_hosts(servers)
 
 
+def _instance_tag(instance, key):
+    for tag in instance.get('Tags', []):
+        if tag['Key'] == key:
+            return tag['Value']
+    return None
+
+
+@aws.profile
+@_check_expired_credentials
+def reconcile_servers():
+    """Register running cell nodes missing in LDAP.
+
+    Covers servers left unregistered if the autoscaler stopped half way
+    through a batch. Instances launched less than _SERVER_START_INTERVAL ago
+    are skipped, they may still be registered by the batch creating them.
+    Registration is idempotent, returns list of registered hostnames.
+    """
+    cell = context.GLOBAL.cell
+    admin_srv = context.GLOBAL.admin.server()
+    ec2_conn = awscontext.GLOBAL.ec2
+
+    registered = {server['_id'] for server in admin_srv.list({'cell': cell})}
+    instances = ec2client.list_instances(
+        ec2_conn, tags={'Cell': cell, 'Role': 'node'}
+    )
+
+    now = time.time()
+    reconciled = []
+    with _ServerWriter(admin_srv) as writer:
+        for instance in instances:
+            hostname = _instance_tag(instance, 'Name')
+            if not hostname or hostname in registered:
+                continue
+
+            if now - instance['LaunchTime'].timestamp() < (
+                    _SERVER_START_INTERVAL):
+                continue
+
+            _LOGGER.warning('Registering unregistered server: %s', hostname)
+            writer.register(
+                hostname,
+                {
+                    'cell': cell,
+                    'partition': (
+                        _instance_tag(instance, 'Partition') or '_default'
+                    ),
+                    'data': {
+                        'type': instance['InstanceType'],
+                        'lifecycle': instance.get(
+                            'InstanceLifecycle', 'on-demand'
+                        ),
+                        'subnet': instance['SubnetId'],
+                    },
+                }
+            )
+            reconciled.append(hostname)
+
+    return reconciled
+
+
+def _select_rotation_victims(servers, count):
+    """Select servers to rotate: broken first, then least busy, oldest."""
+    broken = ('down', 'blackedout', 'frozen', 'interrupted')
+    servers = sorted(
+        servers,
+        key=lambda server: (
+            server['state'] not in broken,
+            server['num_apps'],
+            server['create_timestamp'],
+            server['name'],
+        )
+    )
+    return [server['name'] for server in servers[:count]]
+
+
+class _Wave:
+    """Rotation wave, replaces victims with new servers."""
+
+    def __init__(self, victims):
+        self.victims = victims
+        self.hostnames = []
+        self.phase = None
+        self.started = None
+        self.deadline = None
+
+    def enter(self, phase, timeout):
+        """Start wave phase."""
+        self.phase = phase
+        self.started = time.monotonic()
+        self.deadline = time.time() + timeout
+
+
+class _Rotation:
+    """Rotation waves of a partition.
+
+    Waves progress concurrently, but all AWS, LDAP and Zookeeper calls are
+    made from the calling thread: every poll interval the state is fetched
+    once and each active wave is moved to its next phase.
+    """
+
+    def __init__(self, partition, poll_interval, up_timeout, drain_timeout):
+        self.partition = partition
+        self.poll_interval = poll_interval
+        self.up_timeout = up_timeout
+        self.drain_timeout = drain_timeout
+
+    def servers(self):
+        """Return partition servers by name."""
+        _apps, servers = _get_state()
+        return {
+            server['name']: server
+            for server in servers.get(self.partition, [])
+        }
+
+    def _end_phase(self, wave):
+        """Record duration of the wave phase."""
+        metrics.GLOBAL.observe(
+            metrics.PHASE_SECONDS, time.monotonic() - wave.started,
+            phase='rotation_' + wave.phase, partition=self.partition
+        )
+
+    def start(self, wave):
+        """Create new servers of the wave."""
+        hosts = create_n_servers(len(wave.victims), self.partition)
+        wave.hostnames = [host['hostname'] for host in hosts]
+        wave.enter('up', self.up_timeout)
+
+    def step(self, wave, servers):
+        """Move wave to the next phase if ready, return True when done.
+
+        Victims are blacked out once the new servers are up and deleted
+        once drained. Raises RotationError on timeout, victims not drained
+        in time are left blacked out.
+        """
+        if wave.phase == 'up':
+            not_up = [
+                hostname for hostname in wave.hostnames
+                if (servers.get(hostname) or {}).get('state') != 'up'
+            ]
+            if not_up:
+                if time.time() >= wave.deadline:
+                    raise RotationError(
+                        'Servers not up, not deleting %r: %r' % (
+                            wave.victims, not_up
+                        )
+                    )
+                return False
+
+            self._end_phase(wave)
+            zkclient = context.GLOBAL.zk.conn
+            for victim in wave.victims:
+                blackout.put(zkclient, victim, 'rotation')
+            wave.enter('drain', self.drain_timeout)
+            return False
+
+        busy = [
+            victim for victim in wave.victims
+            if servers.get(victim) and servers[victim]['num_apps']
+        ]
+        if busy:
+            if time.time() >= wave.deadline:
+                raise RotationError(
+                    'Servers not drained, left blacked out: %r' % busy
+                )
+            return False
+
+        self._end_phase(wave)
+        delete_servers_by_name(wave.victims)
+        _LOGGER.info('Rotated %r -> %r', wave.victims, wave.hostnames)
+        return True
+
+
+def rotate_servers(count, partition=None, wave_size=1, max_surge=None,
+                   poll_interval=_ROTATION_POLL_INTERVAL,
+                   up_timeout=_ROTATION_UP_TIMEOUT,
+                   drain_timeout=_ROTATION_DRAIN_TIMEOUT):
+    """Rolling rotation of count servers in the partition.
+
+    Servers are replaced in waves of wave_size: new servers are created and
+    must come up before the old ones are blacked out, drained and deleted.
+    Waves overlap, with at most max_surge (default wave_size) new servers
+    above the partition size at any time. A failed wave cancels the waves
+    not yet started, waves in progress are completed. Returns list of
+    rotated (deleted) servers.
+    """
+    partition = partition or '_default'
+    max_surge = max_surge or wave_size
+    wave_size = min(wave_size, max_surge)
+    max_waves = max_surge // wave_size
+
+    _apps, servers = _get_state()
+    victims = _select_rotation_victims(servers.get(partition, []), count)
+    waves = collections.deque(
+        _Wave(victims[idx:idx + wave_size])
+        for idx in range(0, len(victims), wave_size)
+    )
+    _LOGGER.info('Rotating %s servers in %s partition, %s waves',
+                 len(victims), partition, len(waves))
+
+    rotation = _Rotation(partition, poll_interval, up_timeout, drain_timeout)
+    rotated = []
+    errors = []
+    active = []
+    while waves or active:
+        while waves and not errors and len(active) < max_waves:
+            wave = waves.popleft()
+            try:
+                rotation.start(wave)
+                active.append(wave)
+            except Exception as err:  # pylint: disable=broad-except
+                _LOGGER.error('Rotation wave failed: %s', err)
+                errors.append(err)
+
+        if errors:
+            waves.clear()
+        if not active:
+            break
+
+        time.sleep(poll_interval)
+        servers = rotation.servers()
+        for wave in list(active):
+            try:
+                if rotation.step(wave, servers):
+                    active.remove(wave)
+                    rotated.extend(wave.victims)
+            except Exception as err:  # pylint: disable=broad-except
+                _LOGGER.error('Rotation wave failed: %s', err)
+                errors.append(err)
+                active.remove(wave)
+
+    if errors:
+        raise errors[0]
+    return rotated
+
+
 def _query_stateapi():
     state_api = context.GLOBAL.state_api()
     apps_state = restclient.get(state_api, _SCHEDULER_APPS_URL).json()
@@ -454,8 +909,10 @@ def _query_stateapi():
     return apps_state, servers_state
 
 
-def _get_state():
-    apps_state, servers_state = _query_stateapi()
+def _get_state(interruptions=None):
+    interruptions = interruptions or {}
+    with _phase_timer('state_fetch'):
+        apps_state, servers_state = _query_stateapi()
     admin_srv = context.GLOBAL.admin.server()
     zkclient = context.GLOBAL.zk.conn
 
@@ -487,10 +944,11 @@ def _get_state():
         if server['cpu'] and server['mem'] and server['disk']:
             state_by_server[server['name']] = server['state']
 
-    servers = admin_srv.list(
-        {'cell': context.GLOBAL.cell},
-        get_operational_attrs=True
-    )
+    with _phase_timer('ldap_list'):
+        servers = admin_srv.list(
+            {'cell': context.GLOBAL.cell},
+            get_operational_attrs=True
+        )
     try:
         blackedout_servers = set(zkclient.get_children(z.BLACKEDOUT_SERVERS))
     except kazoo.client.NoNodeError:
@@ -514,12 +972,18 @@ def _get_state():
         if server_name in blackedout_servers:
             server_state = 'blackedout'
 
+        # Spot interruption notice, server will be gone in two minutes.
+        if server_name in interruptions:
+            server_state = 'interrupted'
+
         servers_by_partition[server['partition']].append({
             'name': server_name,
             'state': server_state,
             'create_timestamp': server_create_timestamp,
             'num_apps': num_apps_by_server[server_name],
             'lifecycle': server_data.get('lifecycle', 'on-demand'),
+            'type': server_data.get('type'),
+            'subnet': server_data.get('subnet'),
         })
 
         if server_state in ('blackedout', 'frozen'):
@@ -535,6 +999,11 @@ def _count(apps, servers):
     idle_servers = 0
 
     for server in servers:
+        # Apps on interrupted servers are about to be evicted, replace the
+        # capacity now rather than when they become pending.
+        if server['state'] == 'interrupted':
+            pending_apps += server['num_apps']
+
         if server['state'] in ('new', 'up'):
             if server['num_apps']:
                 busy_servers += 1
@@ -626,6 +1095,7 @@ def _scale_partition(server_app_ratio, idle_server_ttl,
             servers, ('up'), idle_server_ttl, max_extra_servers
         )
     extra_servers += _select_extra_servers(servers, ('down'))
+    extra_servers += _select_extra_servers(servers, ('interrupted',))
     extra_servers += _select_extra_servers(
         servers, ('blackedout', 'frozen')
     )[max_broken_servers:]
@@ -648,12 +1118,82 @@ def _update_idle_since(idle_servers_tracker, servers):
             idle_servers_tracker.pop(server_name, None)
 
 
+def _record_interruptions(interruption_tracker, interruptions,
+                          servers_by_partition):
+    """Record new interruptions, forget servers that are gone."""
+    servers = {
+        server['name']: server
+        for servers in servers_by_partition.values()
+        for server in servers
+    }
+    for hostname, notice in interruptions.items():
+        server = servers.get(hostname, {})
+        # Prefer type/subnet published by the node, fall back to LDAP.
+        instance_type = notice.get('instance_type') or server.get('type')
+        subnet = notice.get('subnet') or server.get('subnet')
+        if not instance_type:
+            _LOGGER.warning('Server %s interrupted, unknown type', hostname)
+            continue
+        if interruption_tracker.record_interruption(hostname, instance_type,
+                                                    subnet):
+            _LOGGER.warning('Server %s interrupted: %s, %s',
+                            hostname, instance_type, subnet)
+    interruption_tracker.prune(interruptions)
+
+
+def _create_partition_servers(new_servers, partition, servers,
+                              min_servers, max_on_demand_servers,
+                              pool=None, interruption_tracker=None):
+    """Create new partition servers, avoid types/subnets being interrupted.
+
+    Spot launches are recorded in the interruption tracker.
+    """
+    create_kwargs = {}
+    if interruption_tracker is not None:
+        create_kwargs['interruption_rates'] = interruption_tracker.rates()
+
+    if max_on_demand_servers is not None:
+        curr_cnt = len([
+            server for server in servers
+            if server['lifecycle'] == 'on-demand'
+        ])
+        _LOGGER.info('Current on-demand servers: %d', curr_cnt)
+        create_kwargs['min_on_demand'] = max(0, min_servers - curr_cnt)
+        create_kwargs['max_on_demand'] = max(
+            0, max_on_demand_servers - curr_cnt
+        )
+
+    hosts_created = create_n_servers(
+        new_servers, partition, pool=pool, **create_kwargs
+    )
+
+    if interruption_tracker is not None:
+        for host in hosts_created:
+            if host['lifecycle'] == 'spot':
+                interruption_tracker.record_launch(
+                    host['type'], host['subnet']
+                )
+    return hosts_created
+
+
 def scale(default_server_app_ratio, default_idle_server_ttl,
           pool=None,
-          idle_servers_tracker=None):
-    """Autoscale cell capacity."""
+          idle_servers_tracker=None,
+          interruptions=None,
+          interruption_tracker=None):
+    """Autoscale cell capacity.
+
+    Interruptions are spot interruption notices by server name, interrupted
+    servers are replaced and deleted without waiting for them to go down.
+    """
     _LOGGER.info('Getting cell state')
-    apps_by_partition, servers_by_partition = _get_state()
+    interruptions = interruptions or {}
+    apps_by_partition, servers_by_partition = _get_state(interruptions)
+
+    if interruption_tracker is not None:
+        _record_interruptions(
+            interruption_tracker, interruptions, servers_by_partition
+        )
 
     _LOGGER.info('Getting cell partitions')
     cell = context.GLOBAL.admin.cell().get(context.GLOBAL.cell)
@@ -693,29 +1233,19 @@ def scale(default_server_app_ratio, default_idle_server_ttl,
 
             _update_idle_since(idle_servers_tracker[partition_name], servers)
 
-            new_servers, extra_servers = _scale_partition(
-                server_app_ratio, idle_server_ttl,
-                min_servers, max_servers, max_broken_servers,
-                apps, servers
-            )
+            with _phase_timer('partition_decision', partition=partition_name):
+                new_servers, extra_servers = _scale_partition(
+                    server_app_ratio, idle_server_ttl,
+                    min_servers, max_servers, max_broken_servers,
+                    apps, servers
+                )
 
             if new_servers > 0:
-                if max_on_demand_servers is None:
-                    create_n_servers(new_servers, partition_name, pool=pool)
-                else:
-                    curr_cnt = len([
-                        server for server in servers
-                        if server['lifecycle'] == 'on-demand'
-                    ])
-                    _LOGGER.info('Current on-demand servers: %d', curr_cnt)
-                    min_on_demand = max(0, min_servers - curr_cnt)
-                    max_on_demand = max(0, max_on_demand_servers - curr_cnt)
-                    create_n_servers(
-                        new_servers, partition_name,
-                        min_on_demand=min_on_demand,
-                        max_on_demand=max_on_demand,
-                        pool=pool
-                    )
+                _create_partition_servers(
+                    new_servers, partition_name, servers,
+                    min_servers, max_on_demand_servers,
+                    pool=pool, interruption_tracker=interruption_tracker
+                )
             if extra_servers:
                 delete_servers_by_name(extra_servers, pool=pool)
         except ExpiredCredentialsError:
@@ -725,3 +1255,7 @@ def scale(default_server_app_ratio, default_idle_server_ttl,
                               partition_name, err)
 
     return idle_servers_tracker
+
+
+metrics.GLOBAL.describe(LAUNCH_FAILURES_TOTAL,
+                        'Number of failed instance launch attempts.')
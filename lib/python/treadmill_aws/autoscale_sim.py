@@ -0,0 +1,843 @@
+"""Offline autoscaler simulator and benchmark harness.
+
+Runs autoscale.scale against in-memory EC2, IPA, LDAP and Zookeeper fakes
+with a virtual clock. Workload is either synthetic (apps arriving and
+leaving over time) or replayed from recorded /scheduler/apps and
+/scheduler/servers snapshots. Instances boot after a modelled delay and
+launches can fail with capacity errors.
+
+The report contains time-to-capacity (pending time of each app), node-hours
+and per-cycle CPU time, so scaling policy and performance changes can be
+compared without a live cell:
+
+    python -m treadmill_aws.autoscale_sim [scenario.json]
+"""
+
+import collections
+import contextlib
+import itertools
+import json
+import logging
+import random
+import sys
+import time
+import types
+
+from botocore import exceptions as botoexc
+
+from treadmill.admin import exc as admin_exceptions
+
+from treadmill_aws import autoscale
+from treadmill_aws import hostmanager
+from treadmill_aws import ipaclient
+from treadmill_aws import spotranking
+
+
+_LOGGER = logging.getLogger(__name__)
+
+_CELL = 'sim'
+_DOMAIN = 'sim.example.com'
+
+_DEFAULT_CELL_DATA = {
+    'image': 'ami-00000000',
+    'size': 'm5.large',
+    'subnets': ['subnet-a', 'subnet-b', 'subnet-c'],
+    'secgroup': 'sg-00000000',
+    'hostgroups': ['nodes'],
+    'instance_profile': 'node',
+    'disk_size': '100',
+    'aws_account': 'sim',
+}
+
+
+class SimClock:
+    """Virtual clock, replaces time module in simulated code."""
+
+    def __init__(self, start=1500000000.0):
+        self.now = start
+
+    def time(self):
+        """Return current virtual time."""
+        return self.now
+
+    def sleep(self, seconds):
+        """Advance virtual time."""
+        self.now += seconds
+
+    @staticmethod
+    def monotonic():
+        """Return real monotonic time (used for latency metrics)."""
+        return time.monotonic()
+
+
+@contextlib.contextmanager
+def _patch(target, **attrs):
+    """Temporarily replace target attributes."""
+    saved = {name: getattr(target, name) for name in attrs}
+    for name, value in attrs.items():
+        setattr(target, name, value)
+    try:
+        yield
+    finally:
+        for name, value in saved.items():
+            setattr(target, name, value)
+
+
+def _client_error(code, operation):
+    """Return botocore client error with given code."""
+    return botoexc.ClientError(
+        {'Error': {'Code': code, 'Message': code}}, operation
+    )
+
+
+class FakeEC2:
+    """In-memory EC2 client with modelled boot delay and capacity errors.
+    """
+
+    def __init__(self, clock, rng, boot_delay=(60, 120), exhausted=None,
+                 capacity_error_rate=0.0, spot_prices=None):
+        self.meta = types.SimpleNamespace(region_name='sim-1')
+        self.spot_prices = spot_prices or {}
+        self.clock = clock
+        self.rng = rng
+        self.boot_delay = boot_delay
+        self.exhausted = set(exhausted or [])
+        self.capacity_error_rate = capacity_error_rate
+        self.instances = collections.OrderedDict()
+        self.calls = collections.Counter()
+        self._ids = itertools.count(1)
+
+    def run_instances(self, **kwargs):
+        """Launch single instance."""
+        self.calls['RunInstances'] += 1
+        instance_type = kwargs['InstanceType']
+        spot = 'InstanceMarketOptions' in kwargs
+        subnet = kwargs['NetworkInterfaces'][0].get('SubnetId')
+        lifecycle = 'spot' if spot else 'on-demand'
+
+        if (instance_type, lifecycle, subnet) in self.exhausted or (
+                self.capacity_error_rate and
+                self.rng.random() < self.capacity_error_rate):
+            raise _client_error('InsufficientInstanceCapacity',
+                                'RunInstances')
+
+        seq = next(self._ids)
+        tags = {
+            tag['Key']: tag['Value']
+            for spec in kwargs.get('TagSpecifications', [])
+            for tag in spec['Tags']
+        }
+        instance = {
+            'InstanceId': 'i-{:017x}'.format(seq),
+            'InstanceType': instance_type,
+            'SubnetId': subnet,
+            'PrivateIpAddress': '10.{}.{}.{}'.format(
+                (seq >> 16) & 0xff, (seq >> 8) & 0xff, seq & 0xff
+            ),
+            'Tags': [{'Key': k, 'Value': v} for k, v in tags.items()],
+            'State': {'Name': 'running'},
+            'LaunchTime': self.clock.time(),
+            'BootedAt': self.clock.time() + self.rng.uniform(
+                *self.boot_delay
+            ),
+        }
+        if spot:
+            instance['InstanceLifecycle'] = 'spot'
+        self.instances[instance['InstanceId']] = instance
+        return {'Instances': [dict(instance)]}
+
+    @staticmethod
+    def _zone(subnet):
+        """Return (AZ, AZ id) of the subnet, e.g. subnet-a -> sim-1a."""
+        suffix = subnet.split('-')[-1]
+        return 'sim-1{}'.format(suffix), 'sim1-az-{}'.format(suffix)
+
+    def describe_subnets(self, SubnetIds=None, Filters=None):
+        """Return subnets with their availability zones."""
+        # pylint: disable=invalid-name
+        del Filters
+        self.calls['DescribeSubnets'] += 1
+        return {'Subnets': [
+            {'SubnetId': subnet,
+             'AvailabilityZone': self._zone(subnet)[0],
+             'AvailabilityZoneId': self._zone(subnet)[1]}
+            for subnet in SubnetIds or []
+        ]}
+
+    def describe_spot_price_history(self, InstanceTypes, **_kwargs):
+        """Return configured spot prices (same in all zones)."""
+        # pylint: disable=invalid-name
+        self.calls['DescribeSpotPriceHistory'] += 1
+        return {'SpotPriceHistory': [
+            {'InstanceType': instance_type,
+             'AvailabilityZone': zone,
+             'SpotPrice': str(self.spot_prices.get(instance_type, 0.05))}
+            for instance_type in InstanceTypes
+            for zone in ('sim-1a', 'sim-1b', 'sim-1c')
+        ]}
+
+    def get_spot_placement_scores(self, InstanceTypes, **_kwargs):
+        """Return low score for zones where all spot types are exhausted."""
+        # pylint: disable=invalid-name
+        self.calls['GetSpotPlacementScores'] += 1
+        exhausted_zones = set.intersection(*[
+            {
+                self._zone(subnet)[1]
+                for exhausted_type, lifecycle, subnet in self.exhausted
+                if exhausted_type == instance_type and lifecycle == 'spot'
+            }
+            for instance_type in InstanceTypes
+        ])
+        return {'SpotPlacementScores': [
+            {'AvailabilityZoneId': zone_id,
+             'Score': 1 if zone_id in exhausted_zones else 9}
+            for zone_id in ('sim1-az-a', 'sim1-az-b', 'sim1-az-c')
+        ]}
+
+    def describe_instances(self, InstanceIds=None, Filters=None):
+        """Return instances matching ids and (name, state) filters."""
+        # pylint: disable=invalid-name
+        self.calls['DescribeInstances'] += 1
+        filters = {f['Name']: set(f['Values']) for f in Filters or []}
+        matching = []
+        for instance in self.instances.values():
+            if InstanceIds and instance['InstanceId'] not in InstanceIds:
+                continue
+            states = filters.get('instance-state-name')
+            if states and instance['State']['Name'] not in states:
+                continue
+            names = filters.get('tag:Name')
+            if names and self.hostname(instance) not in names:
+                continue
+            matching.append(dict(instance))
+        return {'Reservations': [{'Instances': matching}]}
+
+    def terminate_instances(self, InstanceIds, DryRun=False):
+        """Terminate instances."""
+        # pylint: disable=invalid-name
+        del DryRun
+        self.calls['TerminateInstances'] += 1
+        for instance_id in InstanceIds:
+            self.instances[instance_id]['State'] = {'Name': 'terminated'}
+
+    @staticmethod
+    def hostname(instance):
+        """Return instance Name tag."""
+        for tag in instance['Tags']:
+            if tag['Key'] == 'Name':
+                return tag['Value']
+        return None
+
+    def running(self):
+        """Return running instances by hostname."""
+        return {
+            self.hostname(instance): instance
+            for instance in self.instances.values()
+            if instance['State']['Name'] == 'running'
+        }
+
+
+class FakeIPA:
+    """In-memory IPA client."""
+
+    def __init__(self):
+        self.hosts = set()
+        self.calls = collections.Counter()
+
+    def enroll_host(self, hostname, **_kwargs):
+        """Enroll host, return OTP."""
+        self.calls['host_add'] += 1
+        self.hosts.add(hostname)
+        return {'randompassword': 'otp-{}'.format(hostname)}
+
+    def unenroll_host(self, hostname):
+        """Unenroll host."""
+        self.calls['host_del'] += 1
+        if hostname not in self.hosts:
+            raise ipaclient.NotFoundError(hostname)
+        self.hosts.discard(hostname)
+
+    def hostgroup_add_member(self, _hostgroup, _host):
+        """Add host to hostgroup."""
+        self.calls['hostgroup_add_member'] += 1
+
+    def get_dns_record(self, idnsname):
+        """DNS records are not modelled."""
+        self.calls['dnsrecord_show'] += 1
+        raise ipaclient.NotFoundError(idnsname)
+
+    def __getattr__(self, name):
+        """Accept any other (DNS) call."""
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        def _call(*_args, **_kwargs):
+            self.calls[name] += 1
+            return {}
+        return _call
+
+
+class _FakeServerAdmin:
+    """In-memory LDAP server objects."""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.servers = collections.OrderedDict()
+
+    def create(self, hostname, data):
+        """Create server."""
+        if hostname in self.servers:
+            raise admin_exceptions.AlreadyExistsResult(hostname)
+        entry = dict(data)
+        entry['_id'] = hostname
+        entry['_create_timestamp'] = self.clock.time()
+        self.servers[hostname] = entry
+
+    def update(self, hostname, data):
+        """Update server."""
+        self.servers[hostname].update(data)
+
+    def delete(self, hostname):
+        """Delete server."""
+        if hostname not in self.servers:
+            raise admin_exceptions.NoSuchObjectResult(hostname)
+        del self.servers[hostname]
+
+    def get(self, hostname, **_kwargs):
+        """Get server."""
+        try:
+            return dict(self.servers[hostname])
+        except KeyError:
+            raise admin_exceptions.NoSuchObjectResult(hostname)
+
+    def list(self, attrs, **_kwargs):
+        """List servers matching attributes."""
+        return [
+            dict(server) for server in self.servers.values()
+            if all(server.get(key) == value
+                   for key, value in attrs.items() if value is not None)
+        ]
+
+
+class FakeAdmin:
+    """In-memory LDAP admin (cell, partitions and servers)."""
+
+    def __init__(self, clock, cell_data, partitions):
+        self.cell_data = cell_data
+        self.partitions = partitions
+        self._server = _FakeServerAdmin(clock)
+
+    def cell(self):
+        """Return cell admin."""
+        admin = self
+
+        class _Cell:
+            """Cell admin."""
+
+            @staticmethod
+            def get(_cell, **_kwargs):
+                """Get cell."""
+                return {
+                    '_id': _CELL,
+                    'data': dict(admin.cell_data),
+                    'partitions': [
+                        {'_id': name, 'data': data}
+                        for name, data in admin.partitions.items()
+                    ],
+                }
+
+        return _Cell()
+
+    def partition(self):
+        """Return partition admin."""
+        admin = self
+
+        class _Partition:
+            """Partition admin."""
+
+            @staticmethod
+            def get(partition_cell, **_kwargs):
+                """Get partition."""
+                name, _cell = partition_cell
+                if name not in admin.partitions:
+                    raise admin_exceptions.NoSuchObjectResult(name)
+                return {'_id': name, 'data': admin.partitions[name]}
+
+        return _Partition()
+
+    def server(self):
+        """Return server admin."""
+        return self._server
+
+
+class FakeZk:
+    """Minimal in-memory Zookeeper client."""
+
+    def __init__(self):
+        self.nodes = {}
+
+    def get_children(self, path, watch=None):
+        """Return children of the node."""
+        del watch
+        prefix = path.rstrip('/') + '/'
+        return sorted({
+            node[len(prefix):].split('/')[0]
+            for node in self.nodes if node.startswith(prefix)
+        })
+
+    def get(self, path, watch=None):
+        """Return node data."""
+        del watch
+        return self.nodes[path], None
+
+    def exists(self, path, watch=None):
+        """Check if node exists."""
+        del watch
+        return path in self.nodes
+
+    def create(self, path, value=b'', makepath=False, **_kwargs):
+        """Create node."""
+        del makepath
+        self.nodes[path] = value
+        return path
+
+    def delete(self, path, recursive=False):
+        """Delete node."""
+        for node in list(self.nodes):
+            if node == path or (recursive and node.startswith(path + '/')):
+                del self.nodes[node]
+
+
+class SimCell:
+    """Simulated cell: servers boot, scheduler places pending apps."""
+
+    def __init__(self, clock, ec2, admin, apps_per_server=4):
+        self.clock = clock
+        self.ec2 = ec2
+        self.admin = admin
+        self.apps_per_server = apps_per_server
+        # instance name -> {'partition':, 'arrived':, 'server':}
+        self.apps = collections.OrderedDict()
+        self.pending_times = []
+        self.node_hours = 0.0
+        self._last_tick = clock.time()
+
+    def add_app(self, name, partition):
+        """Add pending app."""
+        self.apps[name] = {
+            'partition': partition,
+            'arrived': self.clock.time(),
+            'server': None,
+        }
+
+    def remove_app(self, name):
+        """Remove app."""
+        self.apps.pop(name, None)
+
+    def _up_servers(self):
+        """Return names of servers that booted and are registered."""
+        running = self.ec2.running()
+        now = self.clock.time()
+        return [
+            name for name in self.admin.server().servers
+            if name in running and running[name]['BootedAt'] <= now
+        ]
+
+    def tick(self):
+        """Account node hours, place pending apps on servers with room."""
+        now = self.clock.time()
+        self.node_hours += (
+            len(self.ec2.running()) * (now - self._last_tick) / 3600.0
+        )
+        self._last_tick = now
+
+        up_servers = set(self._up_servers())
+        servers = self.admin.server().servers
+        load = collections.Counter()
+        for app in self.apps.values():
+            if app['server'] and app['server'] not in up_servers:
+                # Server went away, app is pending again.
+                app['server'] = None
+                app['arrived'] = now
+            if app['server']:
+                load[app['server']] += 1
+
+        for app in self.apps.values():
+            if app['server']:
+                continue
+            for server in sorted(up_servers):
+                if servers[server]['partition'] != app['partition']:
+                    continue
+                if load[server] < self.apps_per_server:
+                    app['server'] = server
+                    load[server] += 1
+                    self.pending_times.append(now - app['arrived'])
+                    break
+
+    def pending(self):
+        """Return number of pending apps."""
+        return len([app for app in self.apps.values() if not app['server']])
+
+    def state(self):
+        """Return (apps, servers) state in state API format."""
+        apps_state = {
+            'columns': ['instance', 'partition', 'server'],
+            'data': [
+                [name, app['partition'], app['server']]
+                for name, app in self.apps.items()
+            ],
+        }
+        servers_state = {
+            'columns': ['name', 'state', 'cpu', 'mem', 'disk'],
+            'data': [
+                [name, 'up', 100, 100, 100] for name in self._up_servers()
+            ],
+        }
+        return apps_state, servers_state
+
+
+def synthetic_workload(partition, waves, duration=3600):
+    """Return workload events: waves is list of (time offset, app count).
+
+    Each app runs for duration seconds.
+    """
+    events = []
+    seq = itertools.count()
+    for offset, count in waves:
+        names = [
+            'proid.app#{:010d}'.format(next(seq)) for _ in range(count)
+        ]
+        events.append((offset, 'add', partition, names))
+        events.append((offset + duration, 'remove', partition, names))
+    return sorted(events, key=lambda event: event[0])
+
+
+def replay_workload(snapshots):
+    """Return workload events from recorded /scheduler/apps snapshots.
+
+    snapshots is a list of {'time': offset, 'apps': <apps state>} dicts,
+    apps present in a snapshot but not in the previous one are added, apps
+    missing from the snapshot are removed.
+    """
+    events = []
+    previous = {}
+    for snapshot in sorted(snapshots, key=lambda snap: snap['time']):
+        apps_state = snapshot['apps']
+        col_idx = {
+            name: idx for idx, name in enumerate(apps_state['columns'])
+        }
+        current = {
+            row[col_idx['instance']]: row[col_idx['partition']]
+            for row in apps_state['data']
+        }
+        added = collections.defaultdict(list)
+        for name, partition in current.items():
+            if name not in previous:
+                added[partition].append(name)
+        removed = collections.defaultdict(list)
+        for name, partition in previous.items():
+            if name not in current:
+                removed[partition].append(name)
+        for partition, names in removed.items():
+            events.append((snapshot['time'], 'remove', partition, names))
+        for partition, names in added.items():
+            events.append((snapshot['time'], 'add', partition, names))
+        previous = current
+    return events
+
+
+def _percentile(values, pct):
+    """Return percentile (nearest rank) of the values."""
+    if not values:
+        return None
+    values = sorted(values)
+    idx = min(len(values) - 1, max(0, int(round(pct * len(values))) - 1))
+    return values[idx]
+
+
+class Simulation:
+    """Autoscaler simulation."""
+
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, partitions, workload, cell_data=None,
+                 initial_servers=None, boot_delay=(60, 120), exhausted=None,
+                 capacity_error_rate=0.0, spot_prices=None, apps_per_server=4,
+                 server_app_ratio=0.5, idle_server_ttl=300,
+                 interval=60, tick=5, seed=0):
+        self.clock = SimClock()
+        self.rng = random.Random(seed)
+        self.ec2 = FakeEC2(self.clock, self.rng, boot_delay=boot_delay,
+                           exhausted=exhausted,
+                           capacity_error_rate=capacity_error_rate,
+                           spot_prices=spot_prices)
+        self.ipa = FakeIPA()
+        self.zk = FakeZk()
+        self.admin = FakeAdmin(
+            self.clock, cell_data or dict(_DEFAULT_CELL_DATA), partitions
+        )
+        self.cell = SimCell(self.clock, self.ec2, self.admin,
+                            apps_per_server=apps_per_server)
+        self.workload = collections.deque(
+            sorted(workload, key=lambda event: event[0])
+        )
+        self.server_app_ratio = server_app_ratio
+        self.idle_server_ttl = idle_server_ttl
+        self.interval = interval
+        self.tick = tick
+        self.cycle_cpu = []
+        self.start = self.clock.time()
+
+        for server in initial_servers or []:
+            self._add_initial_server(server)
+
+    def _add_initial_server(self, server):
+        """Add already running server (e.g. from /scheduler/servers)."""
+        partition = server.get('partition', '_default')
+        response = self.ec2.run_instances(
+            InstanceType=self.admin.cell_data['size'],
+            NetworkInterfaces=[{'SubnetId': None}],
+            TagSpecifications=[{'Tags': [
+                {'Key': 'Name', 'Value': server['name']},
+            ]}],
+        )
+        instance_id = response['Instances'][0]['InstanceId']
+        self.ec2.instances[instance_id]['BootedAt'] = self.clock.time()
+        self.admin.server().create(server['name'], {
+            'cell': _CELL,
+            'partition': partition,
+            'data': {'lifecycle': 'on-demand'},
+        })
+
+    def _apply_workload(self):
+        """Apply workload events that are due."""
+        now = self.clock.time() - self.start
+        while self.workload and self.workload[0][0] <= now:
+            _offset, action, partition, names = self.workload.popleft()
+            for name in names:
+                if action == 'add':
+                    self.cell.add_app(name, partition)
+                else:
+                    self.cell.remove_app(name)
+
+    @contextlib.contextmanager
+    def _patched(self):
+        """Replace autoscaler dependencies with simulated ones."""
+        sim_context = types.SimpleNamespace(
+            GLOBAL=types.SimpleNamespace(
+                cell=_CELL,
+                admin=self.admin,
+                zk=types.SimpleNamespace(conn=self.zk),
+                ldap=types.SimpleNamespace(url=['ldap://sim:22389']),
+                ldap_suffix='dc=sim',
+                dns_domain=_DOMAIN,
+                state_api=lambda: None,
+            )
+        )
+        sim_awscontext = types.SimpleNamespace(
+            GLOBAL=types.SimpleNamespace(
+                ec2=self.ec2,
+                ipaclient=self.ipa,
+                ipa_domain=_DOMAIN,
+            )
+        )
+        with _patch(
+            autoscale,
+            context=sim_context,
+            awscontext=sim_awscontext,
+            time=self.clock,
+            random=self.rng,
+            krb5=types.SimpleNamespace(
+                get_host_realm=lambda _hostname: ['SIM.EXAMPLE.COM']
+            ),
+            presence=types.SimpleNamespace(
+                kill_node=lambda _zkclient, _server: None
+            ),
+            _query_stateapi=self.cell.state,
+        ), _patch(hostmanager, time=self.clock):
+            yield
+
+    def run(self, duration):
+        """Run simulation for duration (virtual seconds), return report."""
+        end = self.clock.time() + duration
+        spotranking.clear_cache()
+        autoscale.clear_provisioning_context()
+        next_cycle = self.clock.time()
+        idle_servers_tracker = collections.defaultdict(dict)
+        with self._patched():
+            while self.clock.time() < end:
+                self._apply_workload()
+                self.cell.tick()
+                if self.clock.time() >= next_cycle:
+                    cpu_start = time.process_time()
+                    autoscale.scale(
+                        self.server_app_ratio, self.idle_server_ttl,
+                        idle_servers_tracker=idle_servers_tracker
+                    )
+                    self.cycle_cpu.append(time.process_time() - cpu_start)
+                    next_cycle += self.interval
+                self.clock.sleep(self.tick)
+        return self.report()
+
+    def report(self):
+        """Return simulation report."""
+        pending_times = self.cell.pending_times
+        return {
+            'apps_placed': len(pending_times),
+            'apps_pending': self.cell.pending(),
+            'time_to_capacity': {
+                'mean': (
+                    sum(pending_times) / len(pending_times)
+                    if pending_times else None
+                ),
+                'p50': _percentile(pending_times, 0.5),
+                'p95': _percentile(pending_times, 0.95),
+                'max': max(pending_times) if pending_times else None,
+            },
+            'node_hours': self.cell.node_hours,
+            'servers': len(self.admin.server().servers),
+            'instances_launched': len(self.ec2.instances),
+            'cycles': len(self.cycle_cpu),
+            'cycle_cpu': {
+                'mean': (
+                    sum(self.cycle_cpu) / len(self.cycle_cpu)
+                    if self.cycle_cpu else None
+                ),
+                'max': max(self.cycle_cpu) if self.cycle_cpu else None,
+            },
+            'ec2_calls': dict(self.ec2.calls),
+            'ipa_calls': dict(self.ipa.calls),
+        }
+
+
+def _autoscale_partition(min_servers=0, max_servers=100,
+                         max_on_demand_servers=None, **kwargs):
+    """Return partition data with autoscale configuration."""
+    data = {
+        'autoscale': {'min_servers': min_servers, 'max_servers': max_servers},
+    }
+    if max_on_demand_servers is not None:
+        data['autoscale']['max_on_demand_servers'] = max_on_demand_servers
+    data.update(kwargs)
+    return data
+
+
+# Benchmark scenarios: name -> (simulation kwargs, duration).
+BENCHMARKS = {
+    'burst': (
+        dict(
+            partitions={'part': _autoscale_partition(max_servers=200)},
+            workload=synthetic_workload('part', [(0, 400)], duration=1800),
+        ),
+        3600,
+    ),
+    'waves': (
+        dict(
+            partitions={'part': _autoscale_partition(min_servers=2)},
+            workload=synthetic_workload(
+                'part', [(0, 40), (600, 80), (1200, 20)], duration=900
+            ),
+        ),
+        3600,
+    ),
+    'capacity-errors': (
+        dict(
+            partitions={
+                'part': _autoscale_partition(
+                    max_servers=100,
+                    instance_types=['m5.large', 'm5.xlarge'],
+                    spot_instance_types=['m5.large'],
+                ),
+            },
+            workload=synthetic_workload('part', [(0, 200)], duration=1800),
+            exhausted={('m5.large', 'on-demand', 'subnet-a')},
+            capacity_error_rate=0.2,
+        ),
+        3600,
+    ),
+    'spot': (
+        dict(
+            partitions={
+                'part': _autoscale_partition(
+                    max_servers=100,
+                    max_on_demand_servers=0,
+                    instance_types=['m5.large'],
+                    spot_instance_types=['m5.large', 'm5.xlarge', 'c5.large'],
+                ),
+            },
+            workload=synthetic_workload('part', [(0, 200)], duration=1800),
+            exhausted={
+                ('m5.large', 'spot', 'subnet-a'),
+                ('m5.large', 'spot', 'subnet-b'),
+                ('m5.large', 'spot', 'subnet-c'),
+                ('m5.xlarge', 'spot', 'subnet-a'),
+            },
+            spot_prices={'m5.large': 0.04, 'm5.xlarge': 0.08,
+                         'c5.large': 0.05},
+        ),
+        3600,
+    ),
+}
+
+
+def run_benchmarks(names=None):
+    """Run benchmark scenarios, return reports by scenario name."""
+    reports = {}
+    for name in names or sorted(BENCHMARKS):
+        kwargs, duration = BENCHMARKS[name]
+        reports[name] = Simulation(**kwargs).run(duration)
+    return reports
+
+
+def load_scenario(path):
+    """Load recorded scenario.
+
+    File contains JSON with 'partitions' (name -> partition data),
+    'snapshots' (list of {'time': offset, 'apps': <apps state>}), optional
+    'servers' (initial /scheduler/servers state), 'duration' and any other
+    Simulation keyword arguments.
+    """
+    with open(path, encoding='utf-8') as f:
+        scenario = json.load(f)
+
+    # JSON has no tuples, (type, lifecycle, subnet) entries are lists.
+    if 'exhausted' in scenario:
+        scenario['exhausted'] = [
+            tuple(entry) for entry in scenario['exhausted']
+        ]
+
+    initial_servers = []
+    servers_state = scenario.pop('servers', None)
+    if servers_state:
+        col_idx = {
+            name: idx for idx, name in enumerate(servers_state['columns'])
+        }
+        for row in servers_state['data']:
+            initial_servers.append({
+                'name': row[col_idx['name']],
+                'partition': (
+                    row[col_idx['partition']]
+                    if 'partition' in col_idx else '_default'
+                ),
+            })
+
+    duration = scenario.pop('duration', 3600)
+    workload = replay_workload(scenario.pop('snapshots'))
+    return Simulation(
+        workload=workload, initial_servers=initial_servers, **scenario
+    ), duration
+
+
+def main(argv=None):
+    """Run recorded scenario (if given) or benchmark suite, print report."""
+    argv = sys.argv[1:] if argv is None else argv
+    logging.basicConfig(level=logging.WARNING)
+    if argv:
+        simulation, duration = load_scenario(argv[0])
+        reports = {argv[0]: simulation.run(duration)}
+    else:
+        reports = run_benchmarks()
+    print(json.dumps(reports, indent=4, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,11 @@
 """Common AWS helper functions.
 """
-import functools
 import logging
-import time
 
 from datetime import datetime
 
+from treadmill_aws import tracing
+
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -86,13 +86,5 @@ def datetime_from_suffix(word, base=16, symbol=None):
 
 
 def profile(func):
-    """Decorator to profile a function."""
-    @functools.wraps(func)
-    def wrapper(*args, **kwargs):
-        """Wrapper function."""
-        start_time = time.time()
-        res = func(*args, **kwargs)
-        exec_time = time.time() - start_time
-        _LOGGER.debug('%s exec time: %s', func.__name__, exec_time)
-        return res
-    return wrapper
+    """Decorator to profile a function (see treadmill_aws.tracing)."""
+    return tracing.trace(func)
@@ -1,12 +1,14 @@
-"""Global AWS context."""
+"""Global AWS context.
 
-import logging
+boto3 and the IPA client are imported on first use, commands not talking
+to AWS/IPA do not pay for the imports.
+"""
 
-import boto3
+import logging
 
 from treadmill import sysinfo
 
-from treadmill_aws import ipaclient
+from treadmill_aws import awsmetrics
 
 
 def _set_boto_logging(level=logging.WARNING):
@@ -36,8 +38,6 @@ class AWSContext:
         self.region_name = None
         self.aws_profile = None
 
-        _set_boto_logging()
-
     @property
     def session(self):
         """Lazily establishes AWS session.
@@ -45,10 +45,14 @@ class AWSContext:
         if self._session:
             return self._session
 
+        import boto3
+
+        _set_boto_logging()
         self._session = boto3.Session(
             region_name=self.region_name,
             profile_name=self.aws_profile,
         )
+        awsmetrics.BotoMetrics().register(self._session.events)
         return self._session
 
     @property
@@ -83,6 +87,8 @@ class AWSContext:
         if self._ipaclient:
             return self._ipaclient
 
+        from treadmill_aws import ipaclient
+
         self._ipaclient = ipaclient.IPAClient(certs=self.ipa_certs,
                                               domain=self.ipa_domain)
         return self._ipaclient
@@ -0,0 +1,203 @@
+"""Per AWS API call metrics collected with botocore event hooks.
+"""
+
+import logging
+import time
+
+from treadmill_aws import metrics
+
+
+_LOGGER = logging.getLogger(__name__)
+
+API_CALLS_TOTAL = 'treadmill_aws_api_calls_total'
+API_CALL_SECONDS = 'treadmill_aws_api_call_seconds'
+API_REQUESTS_TOTAL = 'treadmill_aws_api_requests_total'
+API_RETRIES_TOTAL = 'treadmill_aws_api_retries_total'
+API_THROTTLES_TOTAL = 'treadmill_aws_api_throttles_total'
+API_ERRORS_TOTAL = 'treadmill_aws_api_errors_total'
+
+# Error codes botocore retry handlers treat as throttling.
+_THROTTLE_ERROR_CODES = frozenset([
+    'Throttling',
+    'ThrottlingException',
+    'ThrottledException',
+    'RequestThrottledException',
+    'TooManyRequestsException',
+    'ProvisionedThroughputExceededException',
+    'TransactionInProgressException',
+    'RequestLimitExceeded',
+    'BandwidthLimitExceeded',
+    'LimitExceededException',
+    'RequestThrottled',
+    'SlowDown',
+    'PriorRequestNotComplete',
+    'EC2ThrottledException',
+])
+
+_CONTEXT_START_TIME = 'treadmill_aws_start_time'
+
+
+def _service_operation(event_name):
+    """Parse service and operation from <event>.<service>.<operation>."""
+    _event, service, operation = event_name.split('.', 2)
+    return service, operation
+
+
+class BotoMetrics:
+    """Botocore event handlers recording API call metrics."""
+
+    def __init__(self, registry=None):
+        self.registry = registry or metrics.GLOBAL
+
+    def register(self, events):
+        """Register handlers with botocore (session) event emitter.
+
+        Clients copy the session event emitter when created, handlers need
+        to be registered before any client is created.
+        """
+        events.register('before-parameter-build', self.before_call)
+        events.register('before-send', self.before_send)
+        events.register('needs-retry', self.needs_retry)
+        events.register('after-call', self.after_call)
+        events.register('after-call-error', self.after_call_error)
+
+    def before_call(self, event_name, context=None, **_kwargs):
+        """Start timing the call (including all retries).
+
+        Hooked on before-parameter-build rather than before-call, as the
+        latter stops at the first handler that returns a response.
+        """
+        if context is not None:
+            context[_CONTEXT_START_TIME] = time.monotonic()
+        service, operation = _service_operation(event_name)
+        self.registry.inc(
+            API_CALLS_TOTAL, service=service, operation=operation
+        )
+
+    def before_send(self, event_name, **_kwargs):
+        """Count HTTP requests (one per attempt)."""
+        service, operation = _service_operation(event_name)
+        self.registry.inc(
+            API_REQUESTS_TOTAL, service=service, operation=operation
+        )
+
+    def needs_retry(self, event_name, response=None, **_kwargs):
+        """Count throttled attempts, never influences retry decision."""
+        if response is None:
+            return None
+
+        _http, parsed = response
+        code = parsed.get('Error', {}).get('Code')
+        if code in _THROTTLE_ERROR_CODES:
+            service, operation = _service_operation(event_name)
+            self.registry.inc(
+                API_THROTTLES_TOTAL, service=service, operation=operation
+            )
+        return None
+
+    def after_call(self, event_name, http_response=None, parsed=None,
+                   context=None, **_kwargs):
+        """Record call latency, retries and errors."""
+        service, operation = _service_operation(event_name)
+        self._observe(service, operation, context)
+
+        parsed = parsed or {}
+        retries = parsed.get('ResponseMetadata', {}).get('RetryAttempts')
+        if retries:
+            self.registry.inc(
+                API_RETRIES_TOTAL, retries,
+                service=service, operation=operation
+            )
+
+        if http_response is not None and http_response.status_code >= 300:
+            code = parsed.get('Error', {}).get('Code', 'Unknown')
+            self.registry.inc(
+                API_ERRORS_TOTAL,
+                service=service, operation=operation, code=code
+            )
+
+    def after_call_error(self, event_name, exception=None, context=None,
+                         **_kwargs):
+        """Record latency and error of call that failed without response."""
+        service, operation = _service_operation(event_name)
+        self._observe(service, operation, context)
+        self.registry.inc(
+            API_ERRORS_TOTAL,
+            service=service, operation=operation,
+            code=type(exception).__name__
+        )
+
+    def _observe(self, service, operation, context):
+        """Record call latency."""
+        if not context or _CONTEXT_START_TIME not in context:
+            return
+        self.registry.observe(
+            API_CALL_SECONDS,
+            time.monotonic() - context.pop(_CONTEXT_START_TIME),
+            service=service, operation=operation
+        )
+
+
+def summary(registry=None):
+    """Return per service/operation summary as list of dicts."""
+    registry = registry or metrics.GLOBAL
+    snapshot = registry.snapshot()
+
+    by_operation = {}
+
+    def _entry(key):
+        labels = dict(key)
+        op_key = (labels['service'], labels['operation'])
+        if op_key not in by_operation:
+            by_operation[op_key] = {
+                'service': op_key[0],
+                'operation': op_key[1],
+                'calls': 0,
+                'requests': 0,
+                'retries': 0,
+                'throttles': 0,
+                'errors': 0,
+                'time': 0.0,
+            }
+        return by_operation[op_key]
+
+    for name, field in ((API_CALLS_TOTAL, 'calls'),
+                        (API_REQUESTS_TOTAL, 'requests'),
+                        (API_RETRIES_TOTAL, 'retries'),
+                        (API_THROTTLES_TOTAL, 'throttles'),
+                        (API_ERRORS_TOTAL, 'errors')):
+        for key, value in snapshot['counters'].get(name, {}).items():
+            _entry(key)[field] += value
+
+    for key, (_counts, _count, total) in snapshot['histograms'].get(
+            API_CALL_SECONDS, {}).items():
+        _entry(key)['time'] += total
+
+    return [by_operation[key] for key in sorted(by_operation)]
+
+
+def format_summary(registry=None):
+    """Format summary as text table."""
+    lines = ['{:<12} {:<36} {:>6} {:>6} {:>6} {:>6} {:>6} {:>9}'.format(
+        'service', 'operation',
+        'calls', 'reqs', 'retry', 'thrtl', 'err', 'time(s)'
+    )]
+    for entry in summary(registry):
+        lines.append(
+            '{service:<12} {operation:<36} {calls:>6} {requests:>6} '
+            '{retries:>6} {throttles:>6} {errors:>6} {time:>9.3f}'.format(
+                **entry
+            )
+        )
+    return '\n'.join(lines)
+
+
+metrics.GLOBAL.describe(API_CALLS_TOTAL, 'Number of AWS API calls.')
+metrics.GLOBAL.describe(API_CALL_SECONDS,
+                        'AWS API call latency, including retries (seconds).')
+metrics.GLOBAL.describe(API_REQUESTS_TOTAL,
+                        'Number of AWS API HTTP requests (attempts).')
+metrics.GLOBAL.describe(API_RETRIES_TOTAL, 'Number of AWS API call retries.')
+metrics.GLOBAL.describe(API_THROTTLES_TOTAL,
+                        'Number of throttled AWS API attempts.')
+metrics.GLOBAL.describe(API_ERRORS_TOTAL, 'Number of failed AWS API calls.')
@@ -0,0 +1,29 @@
+"""Server blackout in Zookeeper.
+
+Scheduler moves apps off blacked out servers. Used by the spot interruption
+agent and by server rotation.
+"""
+
+import logging
+import time
+
+from treadmill import zknamespace as z
+from treadmill import zkutils
+
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def put(zkclient, hostname, reason):
+    """Blackout server."""
+    _LOGGER.info('Blackout server %s: %s', hostname, reason)
+    zkutils.put(
+        zkclient,
+        z.path.blackedout_server(hostname),
+        {'since': int(time.time()), 'reason': reason}
+    )
+
+
+def remove(zkclient, hostname):
+    """Remove server blackout (server has been deleted)."""
+    zkutils.ensure_deleted(zkclient, z.path.blackedout_server(hostname))
@@ -0,0 +1,41 @@
+"""Simple thread safe cache with time based expiry."""
+
+import threading
+import time
+
+
+class TTLCache:
+    """Cache of values loaded on demand, expiring after ttl seconds."""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, loader):
+        """Return cached value, load it with loader() if missing/expired."""
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > now:
+                return entry[1]
+
+        value = loader()
+        self.put(key, value)
+        return value
+
+    def put(self, key, value, ttl=None):
+        """Cache value, for ttl seconds if given instead of default ttl."""
+        expires = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires, value)
+
+    def invalidate(self, key):
+        """Drop cached value."""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """Drop all cached values."""
+        with self._lock:
+            self._data.clear()
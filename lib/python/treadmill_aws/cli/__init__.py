@@ -6,9 +6,11 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import atexit
 import csv
 import collections
 import re
+import sys
 
 import click
 
@@ -16,6 +18,8 @@ from treadmill import cli
 from treadmill import utils
 
 from treadmill_aws import awscontext
+from treadmill_aws import awsmetrics
+from treadmill_aws import tracing
 
 
 # Regex matching subnet-id
@@ -40,6 +44,13 @@ _INSTANCE_ID_RE = r'^i-[0-9a-fA-F]+$'
 _TAGS_RE = r'^([^=]+=[^=]+)(,[^=]+=[^=]+)*$'
 
 
+def _print_aws_metrics():
+    """Print AWS API calls summary (and traces if enabled) to stderr."""
+    print(awsmetrics.format_summary(), file=sys.stderr)
+    if tracing.GLOBAL.enabled:
+        print(tracing.GLOBAL.dump_json(), file=sys.stderr)
+
+
 def handle_context_opt(ctx, param, value):
     """Handle eager CLI options to configure context.
 
@@ -69,6 +80,9 @@ def handle_context_opt(ctx, param, value):
     if opt == 'ipa_domain':
         awscontext.GLOBAL.ipa_domain = value
 
+    if opt == 'aws_metrics':
+        atexit.register(_print_aws_metrics)
+
     return value
 
 
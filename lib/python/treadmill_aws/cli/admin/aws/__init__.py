@@ -6,7 +6,7 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
-import botocore
+import botocore.exceptions
 import click
 
 from treadmill import cli
@@ -14,7 +14,7 @@ from treadmill import cli
 import treadmill_aws
 
 AWS_EXCEPTIONS = [
-    (botocore.errorfactory.ClientError, None),
+    (botocore.exceptions.ClientError, None),
 ]
 
 ON_AWS_EXCEPTIONS = cli.handle_exceptions(AWS_EXCEPTIONS)
@@ -44,6 +44,11 @@ def init():
                   callback=treadmill_aws.cli.handle_context_opt,
                   is_eager=True,
                   expose_value=False)
+    @click.option('--aws-metrics', is_flag=True, default=False,
+                  help='Print AWS API calls summary on exit.',
+                  callback=treadmill_aws.cli.handle_context_opt,
+                  is_eager=True,
+                  expose_value=False)
     def aws():
         """Manage AWS"""
         pass
@@ -128,13 +128,31 @@ def init():
         '--key',
         help='SSH key'
     )
+    @click.option(
+        '--include-store',
+        help='Move user data parts exceeding size limit to #include URLs: '
+             's3://bucket/prefix or local directory (with --include-url).'
+    )
+    @click.option(
+        '--include-url',
+        help='Base URL the local --include-store directory is served as.'
+    )
     @click.argument('image', required=True, type=str)
     @aws_cli.admin.aws.ON_AWS_EXCEPTIONS
     def create(base_image, base_image_account, userdata, instance_profile,
-               secgroup, subnet, image, key):
+               secgroup, subnet, image, key, include_store, include_url):
         """Create image"""
         ec2_conn = awscontext.GLOBAL.ec2
 
+        store = None
+        if include_store and include_store.startswith('s3://'):
+            bucket, _sep, prefix = include_store[len('s3://'):].partition('/')
+            store = ud.S3Store(awscontext.GLOBAL.s3, bucket, prefix)
+        elif include_store:
+            if not include_url:
+                raise click.UsageError('--include-url is required.')
+            store = ud.DirectoryStore(include_store, include_url)
+
         cloud_init = ud.CloudInit()
         for filename in userdata:
             with io.open(filename, 'rb') as f:
@@ -157,9 +175,17 @@ def init():
                  'Tags': [{'Key': 'Name',
                            'Value': 'ImageBuild-{}'.format(image)}]}]
 
+        user_data, report = cloud_init.build(store=store)
+        click.echo(
+            'User data: {size}/{max_size} bytes (raw: {raw_size}, gzip '
+            'level: {compress_level}), duplicates skipped: {duplicates}, '
+            'moved to #include: {offloaded}'.format(**report),
+            err=True
+        )
+
         instance = ec2client.create_instance(
             ec2_conn,
-            user_data=cloud_init.userdata(),
+            user_data=user_data,
             image_id=base_image_id,
             instance_type='t2.small',
             key=key,
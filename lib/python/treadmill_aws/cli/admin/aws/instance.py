@@ -7,7 +7,6 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import click
-import yaml
 
 from treadmill import cli
 
@@ -172,6 +171,8 @@ def init():
         subnet_id = aws_cli.admin.subnet_id(ec2_conn, subnet)
 
         if data:
+            import yaml
+
             instance_vars = yaml.load(stream=data)
         else:
             instance_vars = {}
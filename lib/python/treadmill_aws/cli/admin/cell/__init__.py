@@ -10,15 +10,11 @@ import logging
 import time
 
 import click
-import jinja2
 import six
 
 from treadmill import admin
 from treadmill import cli
 from treadmill import context
-from treadmill import yamlwrapper as yaml
-from treadmill.api import instance
-from treadmill.scheduler import masterapi
 from treadmill import sysinfo
 from treadmill.syscall import krb5
 
@@ -58,6 +54,9 @@ class CellCtx:
 
 def render_template(name, ctx):
     """Render named template."""
+    import jinja2
+    from treadmill import yamlwrapper as yaml
+
     jinja_env = jinja2.Environment(loader=jinja2.PackageLoader(__name__))
     template = jinja_env.get_template(name)
     return yaml.load(template.render(**ctx.__dict__))
@@ -14,6 +14,8 @@ from treadmill import admin
 from treadmill import context
 from treadmill import cli
 
+from treadmill_aws import provisioning
+
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -117,6 +119,7 @@ def init():
 
         if modified:
             admin_cell.update(context.GLOBAL.cell, {'data': data})
+            provisioning.notify_changed(context.GLOBAL.zk.conn)
         cli.out(formatter(data))
 
     return configure_data_cmd
@@ -15,6 +15,8 @@ from treadmill import context
 from treadmill import cli
 from treadmill.admin import exc as admin_exceptions
 
+from treadmill_aws import provisioning
+
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -134,6 +136,7 @@ def init():
 
         if modified:
             admin_part.update([partition, cell], {'data': data})
+            provisioning.notify_changed(context.GLOBAL.zk.conn)
         cli.out(formatter(data))
 
     return configure_partition_cmd
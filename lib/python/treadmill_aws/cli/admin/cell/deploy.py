@@ -19,6 +19,7 @@ import treadmill_aws
 from treadmill_aws import awscontext
 from treadmill_aws import ec2client
 from treadmill_aws import hostmanager
+from treadmill_aws import zkrollout
 
 
 _LOGGER = logging.getLogger(__name__)
@@ -83,6 +84,10 @@ def init():
                 cli.out('Not enough healthy Zookeepers to rotate')
                 return
 
+            if not zkrollout.quorum_leader(masters):
+                cli.out('Zookeeper ensemble not in sync, not rotating')
+                return
+
             cli.out(hostmanager.rotate_zk(ec2_conn=ec2_conn,
                                           instance_profile=instance_profile,
                                           ipa_client=ipa_client,
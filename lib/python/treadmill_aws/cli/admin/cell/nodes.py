@@ -22,6 +22,10 @@ from treadmill_aws import autoscale
 
 _LOGGER = logging.getLogger(__name__)
 
+_DEFAULT_UP_TIMEOUT = 15 * 60
+
+_DEFAULT_DRAIN_TIMEOUT = 30 * 60
+
 
 def init():
     """Admin Cell CLI module"""
@@ -47,6 +51,11 @@ def init():
                   callback=treadmill_aws.cli.handle_context_opt,
                   is_eager=True,
                   expose_value=False)
+    @click.option('--aws-metrics', is_flag=True, default=False,
+                  help='Print AWS API calls summary on exit.',
+                  callback=treadmill_aws.cli.handle_context_opt,
+                  is_eager=True,
+                  expose_value=False)
     def nodes_grp():
         """Configure cell nodes."""
 
@@ -93,13 +102,33 @@ def init():
     @nodes_grp.command(name='rotate')
     @click.option('--count', type=int, help='Target node count.', default=1)
     @click.option('--partition', help='Target partition')
-    def rotate_cmd(count, partition):
-        """Rotate nodes, deleting old nodes and starting new."""
+    @click.option('--wave-size', type=click.IntRange(min=1), default=1,
+                  help='Number of nodes replaced in each wave.')
+    @click.option('--max-surge', type=click.IntRange(min=1),
+                  help='Max number of new nodes above partition size '
+                       '(default: wave size).')
+    @click.option('--up-timeout', type=int,
+                  default=_DEFAULT_UP_TIMEOUT,
+                  help='Time to wait for new nodes to be up (seconds).')
+    @click.option('--drain-timeout', type=int,
+                  default=_DEFAULT_DRAIN_TIMEOUT,
+                  help='Time to wait for apps to move off old nodes '
+                       '(seconds).')
+    def rotate_cmd(count, partition, wave_size, max_surge, up_timeout,
+                   drain_timeout):
+        """Rotate nodes, replacing old nodes with new in rolling waves."""
         if partition in ('-', '_default'):
             partition = None
 
-        autoscale.create_n_servers(count, partition)
-        autoscale.delete_n_servers(count, partition)
+        rotated = autoscale.rotate_servers(
+            count, partition,
+            wave_size=wave_size,
+            max_surge=max_surge,
+            up_timeout=up_timeout,
+            drain_timeout=drain_timeout
+        )
+        for hostname in rotated:
+            print(hostname)
 
     @nodes_grp.command(name='delete')
     @click.option('--servers', type=cli.LIST)
@@ -107,8 +136,15 @@ def init():
         """Delete servers by name."""
         autoscale.delete_servers_by_name(servers)
 
+    @nodes_grp.command(name='reconcile')
+    def reconcile_cmd():
+        """Register running nodes missing in LDAP."""
+        for hostname in autoscale.reconcile_servers():
+            print(hostname)
+
     del scale_cmd
     del rotate_cmd
     del delete_cmd
+    del reconcile_cmd
 
     return nodes_grp
@@ -19,6 +19,7 @@ import treadmill_aws
 from treadmill_aws import awscontext
 from treadmill_aws import ec2client
 from treadmill_aws import hostmanager
+from treadmill_aws import zkrollout
 
 
 _LOGGER = logging.getLogger(__name__)
@@ -48,6 +49,11 @@ def init():
                   callback=treadmill_aws.cli.handle_context_opt,
                   is_eager=True,
                   expose_value=False)
+    @click.option('--aws-metrics', is_flag=True, default=False,
+                  help='Print AWS API calls summary on exit.',
+                  callback=treadmill_aws.cli.handle_context_opt,
+                  is_eager=True,
+                  expose_value=False)
     def zk_grp():
         """Manage cell ZooKeeper servers."""
 
@@ -143,7 +149,39 @@ def init():
         )
         cli.out('Created: %s', hostname)
 
+    @click.option('--cell', required=True, envvar='TREADMILL_CELL')
+    @click.option('--instance-profile', help='EC2 instance profile')
+    @click.option('--image', help='Image (default: cell image)')
+    @click.option('--admin-port', type=int,
+                  help='Zookeeper AdminServer port (default: use four '
+                       'letter words on client port).')
+    @click.option('--timeout', type=int, default=20 * 60,
+                  help='Time to wait for replaced server to rejoin '
+                       '(seconds).')
+    @zk_grp.command(name='rollout')
+    def rollout_cmd(cell, instance_profile, image, admin_port, timeout):
+        """Replace all cell ZooKeeper servers, keeping quorum."""
+        ec2_conn = awscontext.GLOBAL.ec2
+        ipa_client = awscontext.GLOBAL.ipaclient
+
+        admin_cell = admin.Cell(context.GLOBAL.ldap.conn)
+        cell_obj = admin_cell.get(cell, dirty=True)
+        masters = cell_obj['masters']
+
+        try:
+            zkrollout.rollout_ensemble(
+                ec2_conn, ipa_client, masters,
+                image=image or cell_obj['data']['image'],
+                instance_profile=instance_profile,
+                admin_port=admin_port,
+                timeout=timeout,
+                on_replaced=lambda hostname: cli.out('Replaced: %s', hostname)
+            )
+        except zkrollout.ZkRolloutError as err:
+            cli.bad_exit('%s', err)
+
     del create_cmd
     del rotate_cmd
+    del rollout_cmd
 
     return zk_grp
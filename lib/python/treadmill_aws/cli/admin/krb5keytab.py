@@ -17,7 +17,6 @@ import pwd
 import time
 
 import click
-import dns.resolver
 
 import treadmill
 from treadmill import sysinfo
@@ -170,6 +169,8 @@ def init():
         if not krb5keytab_server:
             krb5keytab_server = []
             domain = awscontext.GLOBAL.ipa_domain
+            import dns.resolver
+
             try:
                 srvrecs = dns.resolver.query(
                     '_ipakeytab._tcp.{}'.format(domain), 'SRV'
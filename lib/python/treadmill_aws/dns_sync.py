@@ -6,29 +6,129 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import collections
+import concurrent.futures
+import fnmatch
+import functools
 import glob
 import io
+import json
 import logging
 import os
+import queue
+import re
 import socket
+import threading
+import time
 
+from treadmill import dirwatch
+from treadmill import fs
 from treadmill import utils
 from treadmill import yamlwrapper as yaml
 
+from treadmill_aws import aws
+from treadmill_aws import cache
+
 
 _LOGGER = logging.getLogger(__name__)
 
 DEFAULT_WEIGHT = 10
 DEFAULT_PRIORITY = 10
 
+# Changes are coalesced until there are no new ones for _DEBOUNCE seconds
+# (but no longer than _MAX_DELAY).
+_DEBOUNCE = 0.2
+_MAX_DELAY = 2
+
+# Full resync, recovers from missed events (e.g. inotify queue overflow).
+_RESYNC_INTERVAL = 10 * 60
+
+# Max concurrent DNS lookups, resolved hosts are remembered for _RESOLVE_TTL.
+_RESOLVE_WORKERS = 16
+_RESOLVE_TTL = 10 * 60
+
+# Cells starting together share single zone scan.
+_SNAPSHOT_TTL = 60
+
+# Checkpoint format version, checkpoints of other versions are ignored.
+_CHECKPOINT_VERSION = 1
+
+
+def _srv_host(srv_rec):
+    """Return target host of srv record."""
+    _weight, _priority, _port, host = srv_rec.split()
+    return host.rstrip('.')
+
+
+def zone_srv_records(records):
+    """Return {host: {(idnsname, srv record)}} of zone records."""
+    by_host = collections.defaultdict(set)
+    for rec in records:
+        if 'srvrecord' not in rec:
+            continue
+
+        srv_rec_name = rec['idnsname'][0]
+        for srv_rec in rec['srvrecord']:
+            by_host[_srv_host(srv_rec)].add((srv_rec_name, srv_rec))
+
+    return dict(by_host)
+
+
+class ZoneSnapshot:
+    """Zone srv records, loaded once for all cells syncing the zone."""
+
+    def __init__(self, ipaclient, zone, ttl=_SNAPSHOT_TTL):
+        self.ipaclient = ipaclient
+        self.zone = zone
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._records = None
+        self._loaded_at = 0
+
+    def records(self):
+        """Return {host: srv records}, zone is scanned if expired."""
+        with self._lock:
+            if self._records is None or (
+                    time.time() - self._loaded_at > self.ttl):
+                self._records = zone_srv_records(
+                    self.ipaclient.list_dns_records(dns_zone=self.zone)
+                )
+                self._loaded_at = time.time()
+            return self._records
+
+
+@functools.lru_cache(maxsize=None)
+def _instance_regex(app_pattern):
+    """Return compiled regex matching app instance names of app pattern."""
+    return re.compile(fnmatch.translate(app_pattern + '#[0-9]*'))
+
+
+def _cell_servers(fs_root):
+    """Return names of cell servers in the Zk mirror."""
+    servers_glob = glob.glob(os.path.join(fs_root, 'servers', '*'))
+    return set(map(os.path.basename, servers_glob))
+
 
 class DnsSync:
-    """Syncronizes DNS with Zk mirror on disk."""
+    """Syncronizes DNS with Zk mirror on disk.
+
+    If checkpoint file is given, applied state is saved there together with
+    the zone SOA serial read after the changes. On start, the checkpoint is
+    used as is if the zone serial did not change.
 
-    def __init__(self, ipaclient, cell, zone, fs_root, scopes):
+    Cells syncing the same zone share the zone snapshot, only one of them
+    (gc_stale) removes records of hosts that no longer exist.
+    """
+
+    def __init__(self, ipaclient, cell, zone, fs_root, scopes,
+                 checkpoint=None, snapshot=None, gc_stale=True):
         self.ipaclient = ipaclient
         self.cell = cell
         self.fs_root = os.path.realpath(fs_root)
+        self.checkpoint = checkpoint
+        self.snapshot = snapshot
+        self.gc_stale = gc_stale
+        self.peers = []
 
         self.state = None
         self.servers = set()
@@ -38,6 +138,26 @@ class DnsSync:
         }
         self.scopes.update(scopes)
         self.zone = zone
+        self.resolver = socket.gethostbyname
+        self.resolve_workers = _RESOLVE_WORKERS
+        self._resolved = cache.TTLCache(_RESOLVE_TTL)
+
+        # Incremental sync state (rebuilt by sync):
+        # - appgroup name -> (alias, scope, pattern, endpoints)
+        # - appgroup name -> {endpoint file: srv record}
+        # - endpoint file -> names of appgroups matching it
+        # - proid -> names of appgroups with the proid pattern
+        # - srv record -> number of appgroup endpoints producing it
+        # - (proid, endpoint) -> {endpoint file name: (instance, proto)}
+        # - endpoint file -> ((inode, mtime), content)
+        self._appgroups = {}
+        self._appgroup_records = {}
+        self._endpoint_index = collections.defaultdict(set)
+        self._appgroups_by_proid = collections.defaultdict(set)
+        self._target = collections.Counter()
+        self._changed = set()
+        self._endpoint_files = collections.defaultdict(dict)
+        self._endpoint_content = {}
 
     def _srv_rsrc(self, name, scope, proto, endpoint, hostport):
         """Return tuple of resource endpoint/payload."""
@@ -71,75 +191,230 @@ class DnsSync:
             )
         )
 
-    def _current_records(self):
-        """Return all records found in DNS for the given cell."""
-        all_records = self.ipaclient.list_dns_records(dns_zone=self.zone)
-        current = set()
-        for rec in all_records:
-            if 'srvrecord' not in rec:
-                continue
+    def _resolves(self, host):
+        """Check if host resolves (memoized)."""
+        def _loader():
+            try:
+                self.resolver(host)
+                return True
+            except socket.error:
+                return False
+
+        return self._resolved.get(host, _loader)
+
+    def _unresolvable(self, hosts):
+        """Return hosts that do not resolve, resolved concurrently."""
+        hosts = sorted(hosts)
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.resolve_workers) as executor:
+            resolves = list(executor.map(self._resolves, hosts))
+        return {host for host, ok in zip(hosts, resolves) if not ok}
+
+    def _zone_records(self):
+        """Return zone srv records by host, from snapshot if shared."""
+        if self.snapshot:
+            return self.snapshot.records()
+        return zone_srv_records(
+            self.ipaclient.list_dns_records(dns_zone=self.zone)
+        )
+
+    @aws.profile
+    def _current_records(self, known=frozenset()):
+        """Return all records found in DNS for the given cell.
 
-            srv_rec_name = rec['idnsname'][0]
-
-            for srv_rec in rec['srvrecord']:
-                _wei, _prio, port, host = srv_rec.split()
-
-                # There is no way to tell if the old record pointing to host
-                # that is no longer there belonged to the cell. There is no
-                # point keeping srv records pointing to hosts that no longer
-                # exist, so we GC for everyone.
-                try:
-                    socket.gethostbyname(host)
-                except socket.error:
-                    _LOGGER.info(
-                        'Stale record - host does not exist: %s %s:%s',
-                        srv_rec_name,
-                        host,
-                        port
-                    )
-                    current.add((srv_rec_name, srv_rec))
-                    continue
-
-                # skip records that do not belong to the cell.
-                host = host.rstrip('.')
-                if host not in self.servers:
-                    _LOGGER.debug('Skip non-cell record: %s %s:%s',
-                                  srv_rec_name, host, port)
-                    continue
+        Known records (previously applied by the cell) still in DNS are kept
+        without checking their hosts.
+        """
+        by_host = self._zone_records()
 
+        current = set()
+        for host in self.servers:
+            current.update(by_host.get(host, ()))
+        for record in known:
+            if record in by_host.get(_srv_host(record[1]), ()):
+                current.add(record)
+
+        if not self.gc_stale:
+            return current
+
+        # There is no way to tell if the old record pointing to host that is
+        # no longer there belonged to the cell. There is no point keeping srv
+        # records pointing to hosts that no longer exist, so we GC for
+        # everyone. Cell servers exist, only other hosts are resolved.
+        # Records of other cells in the zone are not stale. Peers run in
+        # other threads, their servers are read from their fs_root.
+        servers = set(self.servers)
+        for peer in self.peers:
+            servers.update(_cell_servers(peer.fs_root))
+        unknown_hosts = {
+            host for host, records in by_host.items()
+            if host not in servers and not records <= known
+        }
+        for host in self._unresolvable(unknown_hosts):
+            for srv_rec_name, srv_rec in sorted(by_host[host]):
+                _LOGGER.info(
+                    'Stale record - host does not exist: %s %s',
+                    srv_rec_name,
+                    srv_rec
+                )
                 current.add((srv_rec_name, srv_rec))
 
         return current
 
+    def _load_checkpoint(self):
+        """Return checkpointed (serial, records), None if not usable."""
+        if not self.checkpoint:
+            return None
+
+        try:
+            with io.open(self.checkpoint) as f:
+                data = json.load(f)
+        except (IOError, ValueError) as err:
+            _LOGGER.info('Checkpoint not loaded: %s, %r', self.checkpoint, err)
+            return None
+
+        if (data.get('version'), data.get('cell'), data.get('zone')) != (
+                _CHECKPOINT_VERSION, self.cell, self.zone):
+            _LOGGER.info('Checkpoint does not match, ignored: %s',
+                         self.checkpoint)
+            return None
+
+        return data['serial'], {tuple(record) for record in data['records']}
+
+    def _save_checkpoint(self):
+        """Save applied state with current zone serial."""
+        if not self.checkpoint:
+            return
+
+        data = {
+            'version': _CHECKPOINT_VERSION,
+            'cell': self.cell,
+            'zone': self.zone,
+            'serial': self.ipaclient.get_dns_zone_serial(self.zone),
+            'records': sorted(self.state),
+        }
+        try:
+            fs.write_safe(
+                self.checkpoint,
+                lambda f: json.dump(data, f),
+                mode='w',
+                permission=0o644
+            )
+        except OSError:
+            _LOGGER.exception('Unable to save checkpoint: %s', self.checkpoint)
+
+    def _initial_records(self):
+        """Return current records, from checkpoint if zone did not change."""
+        checkpoint = self._load_checkpoint()
+        if not checkpoint:
+            return self._current_records()
+
+        serial, records = checkpoint
+        if serial == self.ipaclient.get_dns_zone_serial(self.zone):
+            _LOGGER.info('Zone not changed since checkpoint, serial: %s',
+                         serial)
+            return records
+
+        _LOGGER.info('Zone changed since checkpoint, serial: %s', serial)
+        return self._current_records(known=records)
+
+    def _index_endpoint(self, proid, filename, exists):
+        """Add (or remove) endpoint file to (from) endpoint index."""
+        if filename.startswith('.') or filename.count(':') != 2:
+            return False
+
+        instance, proto, endpoint = filename.split(':')
+        key = (proid, endpoint)
+        if exists:
+            self._endpoint_files[key][filename] = (instance, proto)
+        elif key in self._endpoint_files:
+            self._endpoint_files[key].pop(filename, None)
+            if not self._endpoint_files[key]:
+                del self._endpoint_files[key]
+        return True
+
+    def _scan_endpoints(self):
+        """Rebuild endpoint index, one pass over endpoint directories."""
+        self._endpoint_files.clear()
+        endpoints_dir = os.path.join(self.fs_root, 'endpoints')
+        try:
+            with os.scandir(endpoints_dir) as entries:
+                proid_dirs = [
+                    entry for entry in entries
+                    if not entry.name.startswith('.') and entry.is_dir()
+                ]
+        except FileNotFoundError:
+            proid_dirs = []
+
+        paths = set()
+        for proid_dir in proid_dirs:
+            with os.scandir(proid_dir.path) as entries:
+                for entry in entries:
+                    if self._index_endpoint(proid_dir.name, entry.name, True):
+                        paths.add(entry.path)
+
+        # Forget content of removed endpoint files.
+        for path in set(self._endpoint_content) - paths:
+            del self._endpoint_content[path]
+
+    def _read_endpoint(self, path):
+        """Return endpoint file content (None if removed).
+
+        Content is cached by (inode, mtime), zk2fs replaces files on change.
+        """
+        try:
+            stat = os.stat(path)
+            version = (stat.st_ino, stat.st_mtime_ns)
+            cached = self._endpoint_content.get(path)
+            if cached and cached[0] == version:
+                return cached[1]
+
+            with io.open(path) as f:
+                content = f.read()
+        except (IOError, OSError):
+            self._endpoint_content.pop(path, None)
+            return None
+
+        self._endpoint_content[path] = (version, content)
+        return content
+
+    def _srv_record(self, alias, scope, endpoint, path):
+        """Return srv record of the endpoint file (None if removed)."""
+        _app, proto, _endpoint = os.path.basename(path).split(':')
+        hostport = self._read_endpoint(path)
+        if hostport is None:
+            _LOGGER.info('Endpoint removed: %s', path)
+            return None
+        return self._srv_rsrc(alias, scope, proto, endpoint, hostport)
+
     def _srv_records(self, alias, scope, pattern, endpoint):
-        """Return srv records matched by pattern."""
-        result = set()
+        """Return srv records matched by pattern, by endpoint file."""
+        result = {}
 
         proid, app_pattern = pattern.split('.', 1)
-        glob_pattern = os.path.join(self.fs_root, 'endpoints', proid,
-                                    app_pattern + '#[0-9]*:*:' + endpoint)
-        matching = glob.glob(glob_pattern)
+        match = _instance_regex(app_pattern).match
+        proid_dir = os.path.join(self.fs_root, 'endpoints', proid)
+        files = self._endpoint_files.get((proid, endpoint), {})
+        matching = [
+            os.path.join(proid_dir, filename)
+            for filename, (instance, _proto) in files.items()
+            if match(instance)
+        ]
         _LOGGER.debug('matching: %r', matching)
 
-        for match in matching:
-            _app, proto, _endpoint = match.split(':')
-            try:
-                with io.open(match) as f:
-                    hostport = f.read()
-                    srv_rec_rsrc = self._srv_rsrc(alias, scope, proto,
-                                                  endpoint, hostport)
-                    if srv_rec_rsrc:
-                        result.add(srv_rec_rsrc)
-            except IOError:
-                _LOGGER.info('Endpoint removed: %s', match)
+        for path in matching:
+            srv_rec_rsrc = self._srv_record(alias, scope, endpoint, path)
+            if srv_rec_rsrc:
+                result[path] = srv_rec_rsrc
 
         return result
 
-    def _match_appgroup(self, appgroup):
-        """For all endpoints that match the appgroup, add to target state."""
+    @staticmethod
+    def _parse_appgroup(appgroup):
+        """Return (alias, scope, pattern, endpoints) of dns appgroup."""
         _LOGGER.debug('appgroup: %r', appgroup)
         if appgroup['group-type'] != 'dns':
-            return set()
+            return None
 
         data = utils.equals_list2dict(appgroup.get('data'))
         _LOGGER.debug('data: %r', data)
@@ -148,53 +423,188 @@ class DnsSync:
         alias = data.get('alias')
         if not alias:
             _LOGGER.error('No alias supplied for %r', appgroup)
-            return set()
+            return None
 
         scope = data.get('scope', 'cell')
-
-        result = set()
-        for endpoint in appgroup['endpoints']:
-            srvs = self._srv_records(
-                alias, scope, appgroup['pattern'], endpoint
-            )
+        return (alias, scope, appgroup['pattern'], appgroup['endpoints'])
+
+    def _load_appgroup(self, path):
+        """Load appgroup file, return None if deleted or not dns."""
+        try:
+            with io.open(path) as f:
+                appgroup = yaml.load(stream=f)
+        except IOError:
+            _LOGGER.info('Appgroup deleted: %s', path)
+            return None
+        return self._parse_appgroup(appgroup)
+
+    def _add_record(self, record):
+        self._target[record] += 1
+        self._changed.add(record)
+
+    def _remove_record(self, record):
+        self._target[record] -= 1
+        if not self._target[record]:
+            del self._target[record]
+        self._changed.add(record)
+
+    def _set_endpoint_record(self, name, path, record):
+        """Set (replace) srv record appgroup has for the endpoint file."""
+        records = self._appgroup_records[name]
+        old = records.pop(path, None)
+        if old:
+            self._remove_record(old)
+            self._endpoint_index[path].discard(name)
+            if not self._endpoint_index[path]:
+                del self._endpoint_index[path]
+        if record:
+            records[path] = record
+            self._add_record(record)
+            self._endpoint_index[path].add(name)
+
+    def _set_appgroup(self, name, appgroup):
+        """Set (replace, or remove if None) appgroup and its srv records."""
+        old = self._appgroups.pop(name, None)
+        if old:
+            for path in list(self._appgroup_records[name]):
+                self._set_endpoint_record(name, path, None)
+            del self._appgroup_records[name]
+            proid = old[2].split('.', 1)[0]
+            self._appgroups_by_proid[proid].discard(name)
+
+        if not appgroup:
+            return
+
+        alias, scope, pattern, endpoints = appgroup
+        self._appgroups[name] = appgroup
+        self._appgroup_records[name] = {}
+        self._appgroups_by_proid[pattern.split('.', 1)[0]].add(name)
+        for endpoint in endpoints:
+            srvs = self._srv_records(alias, scope, pattern, endpoint)
             _LOGGER.debug('srvs: %r', srvs)
-            result.update(srvs)
-
-        return result
-
+            for path, record in srvs.items():
+                self._set_endpoint_record(name, path, record)
+
+    def _match_endpoint(self, name, path):
+        """Return endpoint name if appgroup matches endpoint file."""
+        _alias, _scope, pattern, endpoints = self._appgroups[name]
+        _proid, app_pattern = pattern.split('.', 1)
+        instance, _proto, endpoint = os.path.basename(path).split(':')
+        if endpoint in endpoints and _instance_regex(app_pattern).match(
+                instance):
+            return endpoint
+        return None
+
+    @aws.profile
     def _target_records(self):
         """Returns target state as defined by zk mirror on file system."""
-        target_records = set()
+        self._appgroups.clear()
+        self._appgroup_records.clear()
+        self._endpoint_index.clear()
+        self._appgroups_by_proid.clear()
+        self._target.clear()
+        self._scan_endpoints()
+
         appgroups_pattern = os.path.join(self.fs_root, 'app-groups', '*')
         for appgroup_f in glob.glob(appgroups_pattern):
             _LOGGER.debug('appgroup_f: %r', appgroup_f)
             if appgroup_f.startswith('.'):
                 continue
-            try:
-                with io.open(appgroup_f) as f:
-                    appgroup = yaml.load(stream=f)
-                    target_records.update(self._match_appgroup(appgroup))
-            except IOError:
-                _LOGGER.info('Appgroup deleted: %s', appgroup_f)
+            self._set_appgroup(
+                os.path.basename(appgroup_f), self._load_appgroup(appgroup_f)
+            )
 
+        self._changed.clear()
+        target_records = set(self._target)
         _LOGGER.debug('target_records: %r', target_records)
         return target_records
 
+    def appgroup_changed(self, path):
+        """Appgroup file created, modified or deleted."""
+        name = os.path.basename(path)
+        if name.startswith('.'):
+            return
+        self._set_appgroup(name, self._load_appgroup(path))
+
+    def endpoint_changed(self, path):
+        """Endpoint file created, modified or deleted."""
+        filename = os.path.basename(path)
+        proid = os.path.basename(os.path.dirname(path))
+        if not self._index_endpoint(proid, filename, os.path.exists(path)):
+            return
+
+        names = self._appgroups_by_proid.get(proid, set())
+        names = names | self._endpoint_index.get(path, set())
+        for name in names:
+            endpoint = self._match_endpoint(name, path)
+            record = None
+            if endpoint:
+                alias, scope, _pattern, _endpoints = self._appgroups[name]
+                record = self._srv_record(alias, scope, endpoint, path)
+            self._set_endpoint_record(name, path, record)
+
+    def server_changed(self, path):
+        """Server file created or deleted."""
+        server = os.path.basename(path)
+        if os.path.exists(path):
+            self.servers.add(server)
+        else:
+            self.servers.discard(server)
+
+    def flush(self):
+        """Apply srv record changes since last sync/flush to DNS."""
+        if self.state is None:
+            self.sync()
+            return
+
+        changed, self._changed = self._changed, set()
+        add = {
+            record for record in changed
+            if record in self._target and record not in self.state
+        }
+        delete = {
+            record for record in changed
+            if record not in self._target and record in self.state
+        }
+        if add or delete:
+            self._apply(add, delete)
+            self._save_checkpoint()
+
+    def _apply(self, add, delete):
+        """Apply srv record changes to DNS in batches, update state.
+
+        Failed changes are retried by the next full sync.
+        """
+        for idnsname, rec in sorted(delete):
+            _LOGGER.info('del: %s %s', idnsname, rec)
+        for idnsname, rec in sorted(add):
+            _LOGGER.info('add: %s %s', idnsname, rec)
+
+        errors = self.ipaclient.update_dns_records(
+            'srvrecord', add=sorted(add), delete=sorted(delete),
+            dns_zone=self.zone
+        )
+        for (idnsname, rec), err in sorted(errors.items()):
+            _LOGGER.error('Update failed: %s %s, %s', idnsname, rec, err)
+
+        self.state.difference_update(delete - set(errors))
+        self.state.update(add - set(errors))
+
     def _update_cell_servers(self):
         """Update list of servers that belong to the cell."""
-        servers_glob = glob.glob(os.path.join(self.fs_root, 'servers', '*'))
-        self.servers = set(map(os.path.basename, servers_glob))
+        self.servers = _cell_servers(self.fs_root)
 
         _LOGGER.debug('Cell servers:')
         for server in sorted(self.servers):
             _LOGGER.debug('%s', server)
 
+    @aws.profile
     def sync(self):
         """Syncronizes current and target state."""
         self._update_cell_servers()
 
         if self.state is None:
-            self.state = self._current_records()
+            self.state = self._initial_records()
 
         _LOGGER.debug('Current state:')
         for record in sorted(self.state):
@@ -211,13 +621,137 @@ class DnsSync:
 
         if not (extra or missing):
             _LOGGER.info('DNS is up to date.')
-
-        for idnsname, record in extra:
-            _LOGGER.info('del: %s %s', idnsname, record)
-            self.ipaclient.delete_dns_record('srvrecord', idnsname, record)
-
-        for idnsname, record in missing:
-            _LOGGER.info('add: %s %s', idnsname, record)
-            self.ipaclient.add_dns_record('srvrecord', idnsname, record)
-
-        self.state = target
+        else:
+            self._apply(missing, extra)
+
+        self._save_checkpoint()
+
+    def _watch(self):
+        """Return dirwatch of appgroups, endpoints and servers.
+
+        Directories not yet created by zk2fs are picked up once they
+        appear in fs_root.
+        """
+        watch = dirwatch.DirWatcher()
+        endpoints_dir = os.path.join(self.fs_root, 'endpoints')
+        appgroups_dir = os.path.join(self.fs_root, 'app-groups')
+        servers_dir = os.path.join(self.fs_root, 'servers')
+        watch_dirs = (appgroups_dir, servers_dir, endpoints_dir)
+
+        def _add_dir(path):
+            """Watch new directory, files might be there before watch."""
+            watch.add_dir(path)
+            for filename in os.listdir(path):
+                _on_changed(os.path.join(path, filename))
+
+        def _on_changed(path):
+            parent = os.path.dirname(path)
+            if path in watch_dirs:
+                if os.path.isdir(path):
+                    _add_dir(path)
+            elif parent == appgroups_dir:
+                self.appgroup_changed(path)
+            elif parent == servers_dir:
+                self.server_changed(path)
+            elif parent == endpoints_dir:
+                # New proid directory.
+                if os.path.isdir(path):
+                    _add_dir(path)
+            elif os.path.dirname(parent) == endpoints_dir:
+                self.endpoint_changed(path)
+
+        watch.on_created = _on_changed
+        watch.on_modified = _on_changed
+        watch.on_deleted = _on_changed
+
+        missing = [path for path in watch_dirs if not os.path.isdir(path)]
+        if missing:
+            _LOGGER.info('Not synced yet, waiting for: %r', missing)
+            watch.add_dir(self.fs_root)
+        for watch_dir in watch_dirs:
+            if watch_dir not in missing:
+                watch.add_dir(watch_dir)
+
+        try:
+            proid_dirs = os.listdir(endpoints_dir)
+        except FileNotFoundError:
+            proid_dirs = []
+        for proid_dir in proid_dirs:
+            if os.path.isdir(os.path.join(endpoints_dir, proid_dir)):
+                watch.add_dir(os.path.join(endpoints_dir, proid_dir))
+
+        return watch
+
+    def run(self, debounce=_DEBOUNCE, max_delay=_MAX_DELAY,
+            resync_interval=_RESYNC_INTERVAL):
+        """Sync DNS on file system changes (inotify), incrementally.
+
+        Changes are coalesced over the debounce window, then only srv records
+        affected by them are updated.
+        """
+        # Watch first, changes made during full sync are not missed.
+        watch = self._watch()
+        self.sync()
+        synced_at = time.time()
+
+        while True:
+            timeout = max(0, synced_at + resync_interval - time.time())
+            if watch.wait_for_events(timeout):
+                watch.process_events()
+                deadline = time.time() + max_delay
+                while time.time() < deadline and watch.wait_for_events(
+                        debounce):
+                    watch.process_events()
+                self.flush()
+
+            if time.time() - synced_at >= resync_interval:
+                self.sync()
+                synced_at = time.time()
+
+
+def cell_syncs(ipaclient, cells, scopes=None, checkpoint=None):
+    """Return DnsSync of each cell, cells of the same zone share snapshot.
+
+    Cells is {cell: (zone, fs_root)}, checkpoint files are suffixed with the
+    cell name.
+    """
+    zones = collections.defaultdict(list)
+    snapshots = {}
+    for cell, (zone, fs_root) in sorted(cells.items()):
+        if zone not in snapshots:
+            snapshots[zone] = ZoneSnapshot(ipaclient, zone)
+        zones[zone].append(DnsSync(
+            ipaclient, cell, zone, fs_root, scopes or {},
+            checkpoint=checkpoint and '{}.{}'.format(checkpoint, cell),
+            snapshot=snapshots[zone],
+            gc_stale=not zones[zone]
+        ))
+
+    syncs = []
+    for zone_syncs in zones.values():
+        zone_syncs[0].peers = zone_syncs[1:]
+        syncs.extend(zone_syncs)
+    return syncs
+
+
+def run_all(syncs, **kwargs):
+    """Run DnsSync of several cells, each in its own thread.
+
+    Does not return, error in any of them is raised.
+    """
+    errors = queue.Queue()
+
+    def _run(sync):
+        try:
+            sync.run(**kwargs)
+        except Exception as err:  # pylint: disable=broad-except
+            _LOGGER.exception('DNS sync failed: %s', sync.cell)
+            errors.put(err)
+
+    for sync in syncs:
+        threading.Thread(
+            target=_run, args=(sync,), name='dns-sync-' + sync.cell,
+            daemon=True
+        ).start()
+
+    raise errors.get()
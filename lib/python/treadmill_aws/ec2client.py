@@ -1,6 +1,7 @@
 """AWS client connectors and helper functions.
 """
 
+import datetime
 import logging
 import types
 
@@ -76,6 +77,7 @@ def create_instance(ec2_conn, user_data, image_id, instance_type,
     return response
 
 
+@aws.profile
 def list_instances(ec2_conn, ids=None, tags=None, hostnames=None, state=None,
                    spot=None):
     """List EC2 instances based on search criteria."""
@@ -113,6 +115,7 @@ def list_instances(ec2_conn, ids=None, tags=None, hostnames=None, state=None,
     return instances
 
 
+@aws.profile
 def list_spot_requests(ec2_conn):
     """Returns a list of object-like spot instance requests
         # sir.status:
@@ -154,6 +157,37 @@ def list_spot_requests(ec2_conn):
     return requests
 
 
+@aws.profile
+def list_spot_prices(ec2_conn, instance_types,
+                     product_description='Linux/UNIX'):
+    """List current spot prices of instance types (one per AZ)."""
+    args = {
+        'InstanceTypes': instance_types,
+        'ProductDescriptions': [product_description],
+        'StartTime': datetime.datetime.utcnow(),
+    }
+    prices = []
+    while True:
+        response = ec2_conn.describe_spot_price_history(**args)
+        prices.extend(response['SpotPriceHistory'])
+        if not response.get('NextToken'):
+            return prices
+        args['NextToken'] = response['NextToken']
+
+
+@aws.profile
+def list_spot_placement_scores(ec2_conn, instance_types, region,
+                               target_capacity=1):
+    """List spot placement scores (1-10) per availability zone id."""
+    return ec2_conn.get_spot_placement_scores(
+        InstanceTypes=instance_types,
+        TargetCapacity=target_capacity,
+        SingleAvailabilityZone=True,
+        RegionNames=[region],
+    )['SpotPlacementScores']
+
+
+@aws.profile
 def get_instance(ec2_conn, ids=None, tags=None, hostnames=None, state=None):
     """Get single instance matching criteria.
 
@@ -173,6 +207,7 @@ def get_instance(ec2_conn, ids=None, tags=None, hostnames=None, state=None):
     return instances.pop(0)
 
 
+@aws.profile
 def delete_instances(ec2_conn, ids=None, tags=None, hostnames=None,
                      state=None):
     """Delete instances matching criteria."""
@@ -188,6 +223,7 @@ def delete_instances(ec2_conn, ids=None, tags=None, hostnames=None,
         )
 
 
+@aws.profile
 def start_instances(ec2_conn, ids=None, tags=None, hostnames=None,
                     state=None):
     """Start instances matching criteria."""
@@ -203,6 +239,7 @@ def start_instances(ec2_conn, ids=None, tags=None, hostnames=None,
         )
 
 
+@aws.profile
 def stop_instances(ec2_conn, ids=None, tags=None, hostnames=None,
                    state=None):
     """Stop instances matching criteria."""
@@ -218,6 +255,7 @@ def stop_instances(ec2_conn, ids=None, tags=None, hostnames=None,
         )
 
 
+@aws.profile
 def list_images(ec2_conn, ids=None, tags=None, owners=None, name=None):
     """List images."""
     if not owners:
@@ -240,6 +278,7 @@ def list_images(ec2_conn, ids=None, tags=None, owners=None, name=None):
     ).get('Images', [])
 
 
+@aws.profile
 def get_image(ec2_conn, ids=None, tags=None, owners=None, name=None):
     """Get single image matching criteria.
 
@@ -264,6 +303,7 @@ def get_image(ec2_conn, ids=None, tags=None, owners=None, name=None):
     return image
 
 
+@aws.profile
 def delete_images(ec2_conn, ids=None, tags=None, owners=None, name=None):
     """Delete (unregister) AMI images."""
     images = list_images(
@@ -283,6 +323,7 @@ def delete_images(ec2_conn, ids=None, tags=None, owners=None, name=None):
         ec2_conn.deregister_image(ImageId=image['ImageId'])
 
 
+@aws.profile
 def list_secgroups(ec2_conn, ids=None, tags=None, names=None):
     """List security groups."""
     filters = []
@@ -302,6 +343,7 @@ def list_secgroups(ec2_conn, ids=None, tags=None, names=None):
     ).get('SecurityGroups', [])
 
 
+@aws.profile
 def get_secgroup(ec2_conn, ids=None, tags=None, names=None):
     """Get single security group matching criteria.
 
@@ -317,6 +359,7 @@ def get_secgroup(ec2_conn, ids=None, tags=None, names=None):
     return group
 
 
+@aws.profile
 def list_subnets(ec2_conn, ids=None, tags=None):
     """List subnets."""
     filters = []
@@ -332,6 +375,7 @@ def list_subnets(ec2_conn, ids=None, tags=None):
     ).get('Subnets', [])
 
 
+@aws.profile
 def get_subnet(ec2_conn, ids=None, tags=None):
     """Get single subnet matching criteria.
 
@@ -347,6 +391,7 @@ def get_subnet(ec2_conn, ids=None, tags=None):
     return subnet
 
 
+@aws.profile
 def list_vpcs(ec2_conn, ids=None, tags=None):
     """List VPCs."""
     filters = []
@@ -362,6 +407,7 @@ def list_vpcs(ec2_conn, ids=None, tags=None):
     ).get('Vpcs', [])
 
 
+@aws.profile
 def get_vpc(ec2_conn, ids=None, tags=None):
     """Get single VPC matching criteria.
 
@@ -377,6 +423,7 @@ def get_vpc(ec2_conn, ids=None, tags=None):
     return vpc
 
 
+@aws.profile
 def get_snapshot(ec2_conn, name=None, ids=None, tags=None):
     """Get single snapshot matching criteria.
 
@@ -394,6 +441,7 @@ def get_snapshot(ec2_conn, name=None, ids=None, tags=None):
     raise aws.NotUniqueError('More than one snapshot matches criteria.')
 
 
+@aws.profile
 def list_snapshots(ec2_conn, name=None, ids=None, tags=None):
     """List Snapshots."""
 
@@ -6,8 +6,6 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
-import yaml
-
 from treadmill.formatter import tablefmt
 
 
@@ -190,6 +188,8 @@ def _fmt_attached_policies(policies):
 
 
 def _fmt_policy_version(policy_version):
+    import yaml
+
     return yaml.dump(policy_version, default_flow_style=False, indent=4)
 
 
@@ -1,6 +1,8 @@
 """AWS specific garbage collector plugins."""
 
+import functools
 import logging
+import threading
 
 from treadmill import context
 from treadmill.admin import exc as admin_exceptions
@@ -11,10 +13,91 @@ from treadmill_aws import ipaclient
 
 _LOGGER = logging.getLogger(__name__)
 
-# FIXME: Use aws_account from the cell data instead.
-_ACCOUNT = awscontext.GLOBAL.iam.list_account_aliases().get(
-    'AccountAliases'
-).pop()
+
+@functools.lru_cache(maxsize=None)
+def _account():
+    """Return cell AWS account, account alias if not set in cell data."""
+    try:
+        cell = context.GLOBAL.admin.cell().get(context.GLOBAL.cell)
+        account = cell['data'].get('aws_account')
+        if account:
+            return account
+    except (context.ContextError, admin_exceptions.NoSuchObjectResult):
+        _LOGGER.info('Cell data not available: %s', context.GLOBAL.cell)
+
+    return awscontext.GLOBAL.iam.list_account_aliases().get(
+        'AccountAliases'
+    ).pop()
+
+
+# Reverse zone name -> (SOA serial, {hostname: reverse record}).
+_REVERSE_ZONES = {}
+_REVERSE_ZONES_LOCK = threading.Lock()
+
+
+def _reverse_records(zone_name, dns_records, prefix, ipa_domain):
+    """Return {hostname: reverse record} of cell PTR records in zone."""
+    servers = {}
+    for dns_record in dns_records:
+        idnsname = dns_record['idnsname'][0]
+        if 'ptrrecord' not in dns_record:
+            continue
+        ptrrecord = dns_record['ptrrecord'][0]
+        hostname = ptrrecord
+        if hostname.endswith('.'):
+            hostname = hostname[:-1]
+        if ((hostname.startswith(prefix) and
+             hostname.endswith(ipa_domain))):
+            servers[hostname] = (idnsname, zone_name, ptrrecord)
+    return servers
+
+
+def _scan_reverse_zones(ipa_client, prefix, ipa_domain):
+    """Return {hostname: reverse record} of all reverse zones.
+
+    Zones are fetched in JSON-RPC batches, zones with SOA serial unchanged
+    since the previous scan are not fetched again.
+    """
+    dns_zones = ipa_client.list_dns_zones('.in-addr.arpa.')
+    with _REVERSE_ZONES_LOCK:
+        serials = {}
+        changed = []
+        for dns_zone in dns_zones:
+            zone_name = dns_zone['idnsname'][0]
+            serial = dns_zone.get('idnssoaserial', [None])[0]
+            serials[zone_name] = serial
+            cached = _REVERSE_ZONES.get(zone_name)
+            if serial is None or not cached or cached[0] != serial:
+                changed.append(zone_name)
+
+        _LOGGER.info('Reverse zones: %d, changed: %d',
+                     len(serials), len(changed))
+        results = ipa_client.batch([
+            ('dnsrecord_find', [zone_name], {'sizelimit': 0})
+            for zone_name in changed
+        ])
+        for zone_name, result in zip(changed, results):
+            if isinstance(result, ipaclient.IPAError):
+                _LOGGER.error('Error listing %s: %r', zone_name, result)
+                _REVERSE_ZONES.pop(zone_name, None)
+                continue
+            if result.get('truncated'):
+                _LOGGER.warning('Results truncated: %s', zone_name)
+            _REVERSE_ZONES[zone_name] = (
+                serials[zone_name],
+                _reverse_records(
+                    zone_name, result['result'], prefix, ipa_domain
+                )
+            )
+
+        # Forget removed zones.
+        for zone_name in set(_REVERSE_ZONES) - set(serials):
+            del _REVERSE_ZONES[zone_name]
+
+        servers = {}
+        for _serial, zone_servers in _REVERSE_ZONES.values():
+            servers.update(zone_servers)
+        return servers
 
 
 class LDAP:
@@ -45,7 +128,7 @@ class IPA:
         """List servers in IPA."""
         _LOGGER.info('Fetching server list from IPA')
         ipa_client = awscontext.GLOBAL.ipaclient
-        return set(ipa_client.list_hosts(nshostlocation=_ACCOUNT))
+        return set(ipa_client.list_hosts(nshostlocation=_account()))
 
     @staticmethod
     def delete(hostname):
@@ -80,23 +163,7 @@ class DNS:
                 servers[hostname] = None
 
         # Check records in all reverse zones.
-        reverse = {}
-        dns_zones = ipa_client.list_dns_zones('.in-addr.arpa.')
-        for dns_zone in dns_zones:
-            zone_name = dns_zone['idnsname'][0]
-            dns_records = ipa_client.list_dns_records(dns_zone=zone_name)
-            for dns_record in dns_records:
-                idnsname = dns_record['idnsname'][0]
-                if 'ptrrecord' not in dns_record:
-                    continue
-                ptrrecord = dns_record['ptrrecord'][0]
-                hostname = ptrrecord
-                if hostname.endswith('.'):
-                    hostname = hostname[:-1]
-                if ((hostname.startswith(prefix) and
-                     hostname.endswith(ipa_domain))):
-                    servers[hostname] = (idnsname, zone_name, ptrrecord)
-
+        servers.update(_scan_reverse_zones(ipa_client, prefix, ipa_domain))
         return servers
 
     @staticmethod
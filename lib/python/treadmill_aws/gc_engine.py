@@ -0,0 +1,418 @@
+"""Garbage collector engine.
+
+Every cycle lists servers known to the plugins, waits for the grace
+period, takes a single EC2 snapshot and deletes servers that have no
+instance, rate limited per plugin.
+
+Plugins run concurrently, one thread each: calls of a single plugin are
+never concurrent, as plugins use shared LDAP and IPA connections.
+
+The generational collector instead deletes orphans only after they were
+observed missing several times, checking only known orphans in between
+full listings.
+"""
+
+import collections
+import concurrent.futures
+import io
+import json
+import logging
+import threading
+import time
+
+import jmespath
+
+from treadmill import fs
+
+
+_LOGGER = logging.getLogger(__name__)
+
+_INSTANCE_NAME = jmespath.compile(
+    "Reservations[].Instances[].[Tags[?Key=='Name'].Value][][]"
+)
+
+# Max deletes per second, per plugin.
+_DELETE_RATE = 10
+
+# Max values of single describe_instances filter.
+_FILTER_VALUES = 200
+
+_OBSERVATIONS = 3
+_MIN_AGE = 30 * 60
+_FULL_INTERVAL = 60 * 60
+
+# Candidates file format version, other versions are ignored.
+_STATE_VERSION = 1
+
+
+def ec2_hostnames(ec2_conn, hostnames=None):
+    """Return a set of all ec2 instance hostnames (paginated).
+
+    If hostnames are given, only instances with these names are looked up.
+    """
+    paginator = ec2_conn.get_paginator('describe_instances')
+    if hostnames is None:
+        queries = [{}]
+    else:
+        hostnames = sorted(hostnames)
+        queries = [
+            {'Filters': [{
+                'Name': 'tag:Name',
+                'Values': hostnames[idx:idx + _FILTER_VALUES],
+            }]}
+            for idx in range(0, len(hostnames), _FILTER_VALUES)
+        ]
+
+    found = set()
+    for query in queries:
+        for page in paginator.paginate(**query):
+            found.update(_INSTANCE_NAME.search(page))
+    return found
+
+
+class RateLimiter:
+    """Spaces calls at least 1/rate seconds apart (thread safe)."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self._lock = threading.Lock()
+        self._next = 0
+
+    def wait(self):
+        """Wait for the next slot."""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class GarbageCollector:
+    """Runs garbage collection cycles of the plugins."""
+
+    def __init__(self, plugins, ec2_conn, rates=None):
+        self.plugins = plugins
+        self.ec2_conn = ec2_conn
+        rates = rates or {}
+        self._limiters = {
+            name: RateLimiter(rates.get(name, _DELETE_RATE))
+            for name in plugins
+        }
+
+    def _list(self, name):
+        """List plugin servers, return (servers, seconds)."""
+        start = time.monotonic()
+        servers = self.plugins[name].list()
+        return servers, time.monotonic() - start
+
+    def list_servers(self, report):
+        """List servers of all plugins concurrently (thread per plugin).
+
+        Plugins failing to list are skipped in the cycle.
+        """
+        servers = {}
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=max(len(self.plugins), 1)) as executor:
+            futures = {
+                executor.submit(self._list, name): name
+                for name in self.plugins
+            }
+            for future in concurrent.futures.as_completed(futures):
+                name = futures[future]
+                try:
+                    servers[name], seconds = future.result()
+                except Exception:  # pylint: disable=broad-except
+                    _LOGGER.exception('%s list failed', name.upper())
+                    report['plugins'][name]['list_failed'] = True
+                    continue
+                report['plugins'][name]['listed'] = len(servers[name])
+                report['plugins'][name]['list_seconds'] = seconds
+        return servers
+
+    def _delete(self, name, servers):
+        """Delete (server, data) from plugin in order, rate limited.
+
+        Returns (deleted servers, number of failed deletes).
+        """
+        plugin = self.plugins[name]
+        deleted = []
+        failed = 0
+        for server, data in servers:
+            self._limiters[name].wait()
+            try:
+                if data is None:
+                    plugin.delete(server)
+                else:
+                    plugin.delete(server, data)
+                deleted.append(server)
+            except Exception:  # pylint: disable=broad-except
+                _LOGGER.exception('%s delete failed: %s', name.upper(), server)
+                failed += 1
+        return deleted, failed
+
+    def _delete_all(self, deletes, report):
+        """Delete (name, server, data), plugins concurrently, return deleted.
+        """
+        by_plugin = collections.defaultdict(list)
+        for name, server, data in deletes:
+            by_plugin[name].append((server, data))
+        if not by_plugin:
+            return set()
+
+        deleted = set()
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=len(by_plugin)) as executor:
+            futures = {
+                executor.submit(self._delete, name, servers): name
+                for name, servers in by_plugin.items()
+            }
+            for future in concurrent.futures.as_completed(futures):
+                name = futures[future]
+                plugin_deleted, failed = future.result()
+                report['plugins'][name]['deleted'] += len(plugin_deleted)
+                report['plugins'][name]['failed'] += failed
+                deleted.update((name, server) for server in plugin_deleted)
+        return deleted
+
+    def delete_servers(self, servers, instances, report):
+        """Delete servers with no instance."""
+        deletes = []
+        for name, plugin_servers in sorted(servers.items()):
+            stale = sorted(set(plugin_servers) - instances)
+            report['plugins'][name]['stale'] = len(stale)
+            _LOGGER.info('%s cleanup started, stale: %d',
+                         name.upper(), len(stale))
+            for server in stale:
+                data = None
+                if isinstance(plugin_servers, dict):
+                    data = plugin_servers[server]
+                deletes.append((name, server, data))
+        self._delete_all(deletes, report)
+
+    def _report(self):
+        """Return empty cycle report."""
+        return {
+            'plugins': {
+                name: {
+                    'listed': 0,
+                    'list_seconds': 0,
+                    'list_failed': False,
+                    'stale': 0,
+                    'deleted': 0,
+                    'failed': 0,
+                }
+                for name in self.plugins
+            },
+        }
+
+    def cycle(self, grace):
+        """Run single cycle, return report with counts and timings.
+
+        Servers are listed before the grace period, so servers registered
+        ahead of their instance launch are not deleted.
+        """
+        report = self._report()
+
+        start = time.monotonic()
+        servers = self.list_servers(report)
+        report['list_seconds'] = time.monotonic() - start
+
+        _LOGGER.info('Snoozing for %d seconds', grace)
+        time.sleep(grace)
+
+        _LOGGER.info('Fetching valid instances from AWS')
+        start = time.monotonic()
+        instances = ec2_hostnames(self.ec2_conn)
+        report['instances'] = len(instances)
+        report['snapshot_seconds'] = time.monotonic() - start
+        _LOGGER.debug('%d valid instances found', len(instances))
+
+        start = time.monotonic()
+        self.delete_servers(servers, instances, report)
+        report['delete_seconds'] = time.monotonic() - start
+
+        _log_report(report)
+        return report
+
+    def run(self, interval):
+        """Run cycles forever."""
+        while True:
+            self.cycle(interval)
+
+
+class GenerationalCollector(GarbageCollector):
+    """Mark and sweep garbage collector.
+
+    Orphans (servers with no instance) become candidates, remembered with
+    first seen time and number of observations. Candidates are deleted once
+    observed missing the given number of times and older than min_age.
+
+    Plugins and EC2 are fully listed every full_interval, other cycles only
+    look up instances of the candidates.
+    """
+
+    def __init__(self, plugins, ec2_conn, state_file=None,
+                 observations=_OBSERVATIONS, min_age=_MIN_AGE,
+                 full_interval=_FULL_INTERVAL, **kwargs):
+        super().__init__(plugins, ec2_conn, **kwargs)
+        self.state_file = state_file
+        self.observations = observations
+        self.min_age = min_age
+        self.full_interval = full_interval
+        self.candidates = {name: {} for name in plugins}
+        self.last_full = None
+        self._load()
+
+    def _load(self):
+        """Load candidates from state file."""
+        if not self.state_file:
+            return
+        try:
+            with io.open(self.state_file) as f:
+                state = json.load(f)
+        except (IOError, ValueError) as err:
+            _LOGGER.info('GC state not loaded: %s, %r', self.state_file, err)
+            return
+        if state.get('version') != _STATE_VERSION:
+            _LOGGER.info('GC state version mismatch, ignored: %s',
+                         self.state_file)
+            return
+
+        self.last_full = state['last_full']
+        for name, candidates in state['candidates'].items():
+            if name in self.candidates:
+                self.candidates[name] = candidates
+
+    def _save(self):
+        """Save candidates to state file."""
+        if not self.state_file:
+            return
+        state = {
+            'version': _STATE_VERSION,
+            'last_full': self.last_full,
+            'candidates': self.candidates,
+        }
+        try:
+            fs.write_safe(
+                self.state_file,
+                lambda f: json.dump(state, f),
+                mode='w',
+                permission=0o644
+            )
+        except OSError:
+            _LOGGER.exception('Unable to save GC state: %s', self.state_file)
+
+    def _observe(self, name, orphans, now):
+        """Update plugin candidates with orphans observed in full mark.
+
+        Candidates no longer orphans (or no longer listed) are dropped.
+        """
+        candidates = {}
+        for server, data in orphans.items():
+            candidate = self.candidates[name].get(server)
+            if candidate:
+                candidate['seen'] += 1
+                candidate['data'] = data
+            else:
+                candidate = {'first_seen': now, 'seen': 1, 'data': data}
+            candidates[server] = candidate
+        self.candidates[name] = candidates
+
+    def mark(self, report, now):
+        """List plugins and EC2, update all candidates."""
+        servers = self.list_servers(report)
+
+        start = time.monotonic()
+        instances = ec2_hostnames(self.ec2_conn)
+        report['instances'] = len(instances)
+        report['snapshot_seconds'] = time.monotonic() - start
+
+        for name, plugin_servers in servers.items():
+            if not isinstance(plugin_servers, dict):
+                plugin_servers = dict.fromkeys(plugin_servers)
+            self._observe(name, {
+                server: data for server, data in plugin_servers.items()
+                if server not in instances
+            }, now)
+        self.last_full = now
+
+    def verify(self, report):
+        """Look up instances of the candidates only."""
+        hostnames = {
+            server
+            for candidates in self.candidates.values()
+            for server in candidates
+        }
+
+        start = time.monotonic()
+        instances = ec2_hostnames(self.ec2_conn, hostnames)
+        report['instances'] = len(instances)
+        report['snapshot_seconds'] = time.monotonic() - start
+
+        for candidates in self.candidates.values():
+            for server in list(candidates):
+                if server in instances:
+                    del candidates[server]
+                else:
+                    candidates[server]['seen'] += 1
+
+    def sweep(self, report, now):
+        """Delete candidates observed missing long enough."""
+        deletes = []
+        for name, candidates in sorted(self.candidates.items()):
+            report['plugins'][name]['stale'] = len(candidates)
+            for server, candidate in sorted(candidates.items()):
+                if (candidate['seen'] >= self.observations and
+                        now - candidate['first_seen'] >= self.min_age):
+                    deletes.append((name, server, candidate['data']))
+
+        for name, server in self._delete_all(deletes, report):
+            del self.candidates[name][server]
+
+    def cycle(self, grace=None):
+        """Run single mark (or verify) and sweep cycle, return report."""
+        del grace
+        report = self._report()
+        now = time.time()
+
+        start = time.monotonic()
+        if (self.last_full is None or
+                now - self.last_full >= self.full_interval):
+            self.mark(report, now)
+            report['full'] = True
+        else:
+            self.verify(report)
+            report['full'] = False
+        report['list_seconds'] = time.monotonic() - start
+
+        start = time.monotonic()
+        self.sweep(report, now)
+        report['delete_seconds'] = time.monotonic() - start
+
+        self._save()
+        _log_report(report)
+        return report
+
+    def run(self, interval):
+        """Run cycles forever, interval apart."""
+        while True:
+            self.cycle()
+            _LOGGER.info('Snoozing for %d seconds', interval)
+            time.sleep(interval)
+
+
+def _log_report(report):
+    """Log cycle report."""
+    for name, plugin_report in sorted(report['plugins'].items()):
+        _LOGGER.info(
+            '%s cleanup completed, listed: %d, stale: %d, deleted: %d, '
+            'failed: %d', name.upper(), plugin_report['listed'],
+            plugin_report['stale'], plugin_report['deleted'],
+            plugin_report['failed']
+        )
+    _LOGGER.info(
+        'GC cycle: instances: %d, list: %.1fs, ec2 snapshot: %.1fs, '
+        'delete: %.1fs', report['instances'], report['list_seconds'],
+        report['snapshot_seconds'], report['delete_seconds']
+    )
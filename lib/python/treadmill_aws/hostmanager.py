@@ -3,7 +3,6 @@
 import logging
 import random
 import time
-import yaml
 
 from treadmill import admin
 from treadmill import context
@@ -14,6 +13,8 @@ from treadmill_aws import aws
 from treadmill_aws import awscontext
 from treadmill_aws import ec2client
 from treadmill_aws import ipaclient
+from treadmill_aws import metrics
+from treadmill_aws import userdata
 
 
 _LOGGER = logging.getLogger(__name__)
@@ -36,16 +37,12 @@ def _instance_tags(hostname, role, tags=None):
     }]
 
 
-def _instance_user_data(hostname, otp, instance_vars):
-    """Return instance user data (common instance vars + hostname and otp)."""
-
-    key_value_pairs = instance_vars.copy()
-    key_value_pairs['hostname'] = hostname
-    key_value_pairs['otp'] = otp
-
-    return "#cloud-config\n" + yaml.dump(
-        key_value_pairs, default_flow_style=False, default_style='\''
-    )
+def _tag_value(tags, key):
+    """Return value of the tag with given key (None if not present)."""
+    for tag in tags or []:
+        if tag['Key'] == key:
+            return tag['Value']
+    return None
 
 
 def _configure_dns(ipa_client, hostname, domain, ipaddr):
@@ -138,11 +135,16 @@ def create_host(ec2_conn, ipa_client, image_id, count, domain,
                 instance_vars, role=None, instance_profile=None,
                 hostgroups=None, hostname=None, ip_address=None,
                 eni=None, key=None, tags=None, spot=False, spot_duration=None,
-                nshostlocation=None, otp=None, ipa_enroll=True):
+                nshostlocation=None, otp=None, ipa_enroll=True,
+                user_data_template=None):
     """Adds host defined in manifest to IPA, then adds the OTP from the
        IPA reply to the manifest and creates EC2 instance.
+       user_data_template (userdata.UserDataTemplate) is rendered from
+       instance_vars if not given.
     """
     instance_vars = instance_vars or {}
+    if user_data_template is None:
+        user_data_template = userdata.UserDataTemplate(instance_vars)
 
     if role is None:
         role = 'generic'
@@ -164,6 +166,13 @@ def create_host(ec2_conn, ipa_client, image_id, count, domain,
     if spot and spot_duration:
         instance_params['spot_duration'] = spot_duration
 
+    metric_labels = dict(
+        partition=_tag_value(tags, 'Partition'),
+        instance_type=instance_type,
+        lifecycle='spot' if spot else 'on-demand',
+        subnet=subnet,
+    )
+
     hosts_created = []
     for _ in range(count):
         host = generate_hostname(domain=domain, hostname=hostname)
@@ -176,37 +185,46 @@ def create_host(ec2_conn, ipa_client, image_id, count, domain,
                 nshostlocation=nshostlocation
             )
 
-        instance_user_data = _instance_user_data(host, otp, instance_vars)
+        instance_user_data = user_data_template.render(
+            hostname=host, otp=otp
+        )
         instance_tags = _instance_tags(host, role, tags)
 
         _LOGGER.info(
             'Creating EC2 instance %s in subnet %s: %r %r %r',
             host, subnet, instance_vars, instance_tags, instance_params
         )
-        aws_response = ec2client.create_instance(
-            ec2_conn,
-            subnet_id=subnet,
-            user_data=instance_user_data,
-            tags=instance_tags,
-            **instance_params
-        )
+        with metrics.GLOBAL.timer(metrics.PHASE_SECONDS,
+                                  phase='run_instances', **metric_labels):
+            aws_response = ec2client.create_instance(
+                ec2_conn,
+                subnet_id=subnet,
+                user_data=instance_user_data,
+                tags=instance_tags,
+                **instance_params
+            )
         instance_ip = aws_response['Instances'][0].get('PrivateIpAddress')
         if instance_ip:
-            _configure_dns(ipa_client=ipa_client,
-                           hostname=host,
-                           domain=domain,
-                           ipaddr=instance_ip)
+            with metrics.GLOBAL.timer(metrics.PHASE_SECONDS,
+                                      phase='dns_config', **metric_labels):
+                _configure_dns(ipa_client=ipa_client,
+                               hostname=host,
+                               domain=domain,
+                               ipaddr=instance_ip)
 
         hosts_created.append(host)
     return hosts_created
 
 
-def delete_hosts(ec2_conn, ipa_client, hostnames, ipa_delete=True):
+def delete_hosts(ec2_conn, ipa_client, hostnames, ipa_delete=True,
+                 on_terminated=None):
     """ Unenrolls hosts from IPA and AWS
         Removes any A or PTR records left by the host post-deletion
         EC2 imposes a maximum limit on the number of instances that can be
         selected using filters (200); delete instances in batches of
         _EC2_DELETE_BATCH
+        on_terminated is called with each batch of hostnames once their
+        instances are terminated
     """
     _LOGGER.debug('Delete instances: %r', hostnames)
     hostnames_left = hostnames[:]
@@ -216,6 +234,8 @@ def delete_hosts(ec2_conn, ipa_client, hostnames, ipa_delete=True):
         batch = hostnames_left[:_EC2_DELETE_BATCH]
         hostnames_left = hostnames_left[_EC2_DELETE_BATCH:]
         ec2client.delete_instances(ec2_conn=ec2_conn, hostnames=batch)
+        if on_terminated:
+            on_terminated(batch)
 
     if not ipa_delete:
         return
@@ -364,7 +384,8 @@ def rotate_zk(ec2_conn, ec2_instances, instance_profile, ipa_client, masters):
                       old_master=old_master)
 
 
-def replace_zk(ec2_conn, instance_profile, ipa_client, master, old_master):
+def replace_zk(ec2_conn, instance_profile, ipa_client, master, old_master,
+               image_id=None):
     """ Delete and recreate oldest Zookeeper in quorum """
     # Remove server
     delete_hosts(ec2_conn, ipa_client, [master['hostname']])
@@ -375,4 +396,5 @@ def replace_zk(ec2_conn, instance_profile, ipa_client, master, old_master):
                      ipa_client=ipa_client,
                      master=master,
                      instance_type=old_master.get('InstanceType', None),
-                     subnet_id=old_master.get('SubnetId', None))
+                     subnet_id=old_master.get('SubnetId', None),
+                     image_id=image_id)
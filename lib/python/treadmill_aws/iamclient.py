@@ -2,7 +2,10 @@
 
 from treadmill import exc
 
+from treadmill_aws import aws
 
+
+@aws.profile
 def create_user(iam_conn, user_name, path):
     """Create IAM user.
     """
@@ -15,6 +18,7 @@ def create_user(iam_conn, user_name, path):
         raise exc.FoundError(str(err))
 
 
+@aws.profile
 def delete_user(iam_conn, user_name):
     """Delete IAM user.
     """
@@ -24,6 +28,7 @@ def delete_user(iam_conn, user_name):
         raise exc.NotFoundError(str(err))
 
 
+@aws.profile
 def list_users(iam_conn, path_prefix):
     """List IAM users."""
 
@@ -45,6 +50,7 @@ def list_users(iam_conn, path_prefix):
     return users
 
 
+@aws.profile
 def list_groups_for_user(iam_conn, user_name):
     """List groups for IAM user."""
 
@@ -66,6 +72,7 @@ def list_groups_for_user(iam_conn, user_name):
     return groups
 
 
+@aws.profile
 def remove_user_from_group(iam_conn, user_name, group_name):
     """Remove IAM user from group."""
 
@@ -73,6 +80,7 @@ def remove_user_from_group(iam_conn, user_name, group_name):
                                     GroupName=group_name)
 
 
+@aws.profile
 def get_user(iam_conn, user_name):
     """Get IAM user information.
     """
@@ -82,6 +90,7 @@ def get_user(iam_conn, user_name):
         raise exc.NotFoundError(str(err))
 
 
+@aws.profile
 def put_user_policy(iam_conn, user_name, policy_name, policy_document):
     """Put user policy."""
 
@@ -91,6 +100,7 @@ def put_user_policy(iam_conn, user_name, policy_name, policy_document):
         PolicyDocument=policy_document)
 
 
+@aws.profile
 def delete_user_policy(iam_conn, user_name, policy_name):
     """Delete user policy."""
 
@@ -99,6 +109,7 @@ def delete_user_policy(iam_conn, user_name, policy_name):
         PolicyName=policy_name)
 
 
+@aws.profile
 def list_user_policies(iam_conn, user_name):
     """List user policies"""
 
@@ -121,6 +132,7 @@ def list_user_policies(iam_conn, user_name):
     return policies
 
 
+@aws.profile
 def attach_user_policy(iam_conn, user_name, policy_arn):
     """Attach user policies"""
     try:
@@ -132,6 +144,7 @@ def attach_user_policy(iam_conn, user_name, policy_arn):
         raise exc.NotFoundError(str(err))
 
 
+@aws.profile
 def detach_user_policy(iam_conn, user_name, policy_arn):
     """Detach user policies"""
 
@@ -144,6 +157,7 @@ def detach_user_policy(iam_conn, user_name, policy_arn):
         raise exc.NotFoundError(str(err))
 
 
+@aws.profile
 def list_attached_user_policies(iam_conn, user_name):
     """List attached user policies"""
 
@@ -166,6 +180,7 @@ def list_attached_user_policies(iam_conn, user_name):
     return policies
 
 
+@aws.profile
 def create_role(iam_conn,
                 role_name,
                 path,
@@ -189,6 +204,7 @@ def create_role(iam_conn,
         raise exc.FoundError(str(err))
 
 
+@aws.profile
 def update_role(iam_conn, role_name, max_session_duration):
     """Update IAM role.
     """
@@ -201,6 +217,7 @@ def update_role(iam_conn, role_name, max_session_duration):
         raise exc.NotFoundError(str(err))
 
 
+@aws.profile
 def delete_role(iam_conn, role_name):
     """Delete IAM role."""
     try:
@@ -209,6 +226,7 @@ def delete_role(iam_conn, role_name):
         raise exc.NotFoundError(str(err))
 
 
+@aws.profile
 def list_roles(iam_conn, path_prefix):
     """List IAM roles."""
 
@@ -230,6 +248,7 @@ def list_roles(iam_conn, path_prefix):
     return roles
 
 
+@aws.profile
 def get_role(iam_conn, role_name):
     """Return role by name."""
     try:
@@ -238,6 +257,7 @@ def get_role(iam_conn, role_name):
         raise exc.NotFoundError(str(err))
 
 
+@aws.profile
 def update_assume_role_policy(iam_conn, role_name, policy_document):
     """Update assume role policy."""
     try:
@@ -248,6 +268,7 @@ def update_assume_role_policy(iam_conn, role_name, policy_document):
         raise exc.NotFoundError(str(err))
 
 
+@aws.profile
 def put_role_policy(iam_conn, role_name, policy_name, policy_document):
     """Put role policy."""
 
@@ -257,6 +278,7 @@ def put_role_policy(iam_conn, role_name, policy_name, policy_document):
         PolicyDocument=policy_document)
 
 
+@aws.profile
 def delete_role_policy(iam_conn, role_name, policy_name):
     """Delete role policy."""
 
@@ -265,6 +287,7 @@ def delete_role_policy(iam_conn, role_name, policy_name):
         PolicyName=policy_name)
 
 
+@aws.profile
 def list_role_policies(iam_conn, role_name):
     """List role policies"""
 
@@ -287,6 +310,7 @@ def list_role_policies(iam_conn, role_name):
     return policies
 
 
+@aws.profile
 def attach_role_policy(iam_conn, role_name, policy_arn):
     """Attach role policies"""
     try:
@@ -298,6 +322,7 @@ def attach_role_policy(iam_conn, role_name, policy_arn):
         raise exc.NotFoundError(str(err))
 
 
+@aws.profile
 def detach_role_policy(iam_conn, role_name, policy_arn):
     """Detach role policies"""
 
@@ -310,6 +335,7 @@ def detach_role_policy(iam_conn, role_name, policy_arn):
         raise exc.NotFoundError(str(err))
 
 
+@aws.profile
 def list_attached_role_policies(iam_conn, role_name):
     """List attached role policies"""
 
@@ -24,6 +24,8 @@ from treadmill import authz
 from treadmill import gssapiprotocol
 from treadmill import utils
 
+from treadmill_aws import aws
+
 _LOGGER = logging.getLogger(__name__)
 
 
@@ -118,6 +120,7 @@ class IPA525Server(gssapiprotocol.GSSAPILineServer):
         else:
             raise authz.AuthorizationError(['Not authorized.'])
 
+    @aws.profile
     def _get_ticket(self, request, lifetime):
         name, inst, realm = _parse_name(request)
         tmpdir = tempfile.mkdtemp(prefix='ipa525-')
@@ -158,6 +161,7 @@ class IPA525Server(gssapiprotocol.GSSAPILineServer):
         shutil.rmtree(tmpdir)
         return response
 
+    @aws.profile
     def _process_request(self, request):
         """Process request, returns json response."""
         requestor = self.peer()
@@ -1,6 +1,7 @@
 """FreeIPA API wrapper to manage IPA hosts, dns records and users."""
 
 import logging
+import threading
 
 import requests
 import requests_kerberos
@@ -8,13 +9,20 @@ import requests_kerberos
 from treadmill import dnsutils
 
 from treadmill_aws import noproxy
+from treadmill_aws import tracing
 
 
 _LOGGER = logging.getLogger(__name__)
-_KERBEROS_AUTH = requests_kerberos.HTTPKerberosAuth()
 _API_VERSION = '2.28'
 _DEFAULT_TTL = 5
 
+# Max number of calls in a single batch request.
+_BATCH_SIZE = 100
+
+# Record changes rejected because zone already is in the desired state:
+# EmptyModlist (record exists) and AttrValueNotFound (record not there).
+_NOOP_ERRORS = (4202, 4026)
+
 
 def get_ipa_urls_from_dns(domain):
     """Looks up IPA servers from DNS SRV records."""
@@ -52,8 +60,11 @@ def get_ipa_urls_from_dns(domain):
 # for code 4002 (DuplicateEntry) and 4001 (NotFound)
 
 class IPAError(Exception):
-    """IPA Client exceptions."""
-    pass
+    """IPA Client exceptions, code is the IPA error code if known."""
+
+    def __init__(self, *args, code=None):
+        super().__init__(*args)
+        self.code = code
 
 
 class AuthenticationError(IPAError):
@@ -111,23 +122,26 @@ def check_response(response):
         return
 
     err = response_obj['error']
-    code = err['code']
+    raise ipa_error(err['code'], err['message'])
+
+
+def ipa_error(code, message):
+    """Return exception matching IPA error code."""
     if 1000 <= code <= 1999:
-        raise AuthenticationError(err['message'])
+        return AuthenticationError(message, code=code)
     if 2000 <= code <= 2999:
-        raise AuthorizationError(err['message'])
+        return AuthorizationError(message, code=code)
     if 3000 <= code <= 3999:
-        raise InvocationError(err['message'])
+        return InvocationError(message, code=code)
     if code == 4001:
-        raise NotFoundError(err['message'])
+        return NotFoundError(message, code=code)
     if code == 4002:
-        raise AlreadyExistsError(err['message'])
+        return AlreadyExistsError(message, code=code)
     if 4000 <= code <= 4999:
-        raise ExecutionError(err['message'])
+        return ExecutionError(message, code=code)
     if 5000 <= code <= 5999:
-        raise GenericError(err['message'])
-
-    raise IPAError('Unknown error.')
+        return GenericError(message, code=code)
+    return IPAError(message, code=code)
 
 
 class IPAClient:
@@ -137,6 +151,18 @@ class IPAClient:
         self.certs = certs
         self.domain = domain
         self.ipa_urls = get_ipa_urls_from_dns(self.domain)
+        # Connections and IPA session cookie are reused between calls, per
+        # thread (sessions and Kerberos auth are not thread safe).
+        self._local = threading.local()
+
+    def _session(self):
+        """Return HTTP session of the calling thread."""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.auth = requests_kerberos.HTTPKerberosAuth()
+            self._local.session = session
+        return session
 
     def _call(self, method_name, args, options=None):
         """Format JSON payload and submit it to IPA server.
@@ -154,22 +180,24 @@ class IPAClient:
             'id': 0,
         }
 
-        for ipa_url in self.ipa_urls:
-            try:
-                return self._post(ipa_url, payload)
-            except requests.exceptions.ConnectionError:
-                _LOGGER.exception('Connection error: %s, trying next', ipa_url)
-        raise Exception('Connection error: %r' % self.ipa_urls)
+        with tracing.span('ipaclient.{}'.format(method_name)):
+            for ipa_url in self.ipa_urls:
+                try:
+                    return self._post(ipa_url, payload)
+                except requests.exceptions.ConnectionError:
+                    _LOGGER.exception(
+                        'Connection error: %s, trying next', ipa_url
+                    )
+            raise Exception('Connection error: %r' % self.ipa_urls)
 
     def _post(self, ipa_url, payload):
         """Submit formatted JSON payload to IPA server and check response.
            Uses requests_kerberos module for Kerberos authentication with IPA.
         """
         with noproxy.NoProxy() as _proxy:
-            response = requests.post(
+            response = self._session().post(
                 '{}/session/json'.format(ipa_url),
                 json=payload,
-                auth=_KERBEROS_AUTH,
                 headers={'referer': ipa_url},
                 proxies={'http': None, 'https': None},
                 verify=self.certs
@@ -212,6 +240,12 @@ class IPAClient:
         options = {'sizelimit': 0}
         return self._call('dnszone_find', args, options)['result']
 
+    def get_dns_zone_serial(self, dns_zone=None):
+        """Return DNS zone SOA serial."""
+        dns_zone = dns_zone or self.domain
+        result = self._call('dnszone_show', [dns_zone])['result']
+        return int(result['idnssoaserial'][0])
+
     def add_dns_record(self, record_type, idnsname, record, dns_zone=None,
                        ttl=_DEFAULT_TTL):
         """Add new DNS record to IPA server."""
@@ -241,6 +275,56 @@ class IPAClient:
         options = {'sizelimit': 0}
         return self._call('dnsrecord_find', args, options)['result']
 
+    def batch(self, calls):
+        """Submit calls in JSON-RPC batch requests, return list of results.
+
+        Calls are (method_name, args, options) tuples. Result of a failed
+        call is the IPAError, it is not raised.
+        """
+        results = []
+        for idx in range(0, len(calls), _BATCH_SIZE):
+            batch = [
+                {'method': method_name, 'params': [args, options or {}]}
+                for method_name, args, options in calls[idx:idx + _BATCH_SIZE]
+            ]
+            response = self._call('batch', batch)
+            for result in response['results']:
+                if result.get('error'):
+                    results.append(
+                        ipa_error(result['error_code'], result['error'])
+                    )
+                else:
+                    results.append(result)
+        return results
+
+    def update_dns_records(self, record_type, add=(), delete=(),
+                           dns_zone=None, ttl=_DEFAULT_TTL):
+        """Delete and add DNS records using batch requests.
+
+        Records are (idnsname, record) tuples. Returns {record: error} of
+        changes that failed.
+        """
+        dns_zone = dns_zone or self.domain
+        changes = [(record, 'dnsrecord_del', {record_type: record[1]})
+                   for record in delete]
+        changes.extend(
+            (record, 'dnsrecord_add', {record_type: record[1], 'dnsttl': ttl})
+            for record in add
+        )
+        results = self.batch([
+            (method_name, [dns_zone, record[0]], options)
+            for record, method_name, options in changes
+        ])
+
+        errors = {}
+        for (record, _method, _options), result in zip(changes, results):
+            if not isinstance(result, IPAError):
+                continue
+            if result.code in _NOOP_ERRORS:
+                continue
+            errors[record] = result
+        return errors
+
     def get_dns_record(self, idnsname):
         """Show details about DNS record from IPA user."""
         args = [self.domain, idnsname]
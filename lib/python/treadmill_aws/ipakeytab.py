@@ -7,6 +7,7 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import base64
+import contextlib
 import grp
 import io
 import json
@@ -16,23 +17,177 @@ import os
 import re
 import shutil
 import socket
+import subprocess
 import tempfile
+import threading
+import time
 
 from twisted.internet import reactor
 from twisted.internet import protocol
 from twisted.internet import task
+from twisted.internet import threads
+from twisted.python import threadpool
 
 from treadmill import gssapiprotocol
 from treadmill import subproc
 from treadmill import utils
 
+from treadmill_aws import aws
+
 _LOGGER = logging.getLogger(__name__)
 _SERVICE_BLACKLIST = ['admin', 'host', 'root']
 _TICKET_REFRESH_INTERVAL = 60 * 60 * 2
 
-
-def run_server(port, realm, admin, admin_group):
-    """Runs IPA keytab server."""
+# Generated keytabs are cached, kvno is verified if not checked recently.
+_CACHE_TTL = 10 * 60
+_KVNO_INTERVAL = 30
+_CACHE_SWEEP_INTERVAL = 60
+
+_KVNO_RE = re.compile(r'^Key: vno (\d+)', re.MULTILINE)
+
+# Requests waiting for a worker, over the limit clients are told to retry.
+_MAX_QUEUE = 32
+_REQUEST_TIMEOUT = 60
+
+
+def _get_admin_tickets(admin):
+    """get/refresh admin tickets."""
+    adminktdir = tempfile.mkdtemp(prefix="ipakeytab-admin-")
+    adminkt = "%s/krb5kt_%s" % (adminktdir, admin)
+    subproc.check_call(['kadmin.local',
+                        'ktadd',
+                        '-k',
+                        adminkt,
+                        '-norandkey',
+                        admin])
+    subproc.check_call(['kinit',
+                        '-k',
+                        '-t',
+                        adminkt,
+                        admin])
+    shutil.rmtree(adminktdir)
+
+
+def _principal_kvno(principal):
+    """Return principal key version number, None if there is no principal."""
+    try:
+        output = subproc.check_output(['kadmin.local', 'getprinc', principal])
+    except subprocess.CalledProcessError:
+        return None
+    match = _KVNO_RE.search(output)
+    return int(match.group(1)) if match else None
+
+
+class KeytabCache:
+    """Generated keytabs (base64 encoded) by principal.
+
+    Keytabs are kept in process memory only. Entries expire after ttl and
+    are regenerated if principal kvno changed, expired entries are dropped
+    by sweep(). Generation is serialized per principal, concurrent requests
+    wait for the first one and share its result.
+    """
+
+    def __init__(self, ttl=_CACHE_TTL, kvno_interval=_KVNO_INTERVAL,
+                 kvno=_principal_kvno):
+        self.ttl = ttl
+        self.kvno_interval = kvno_interval
+        self._kvno = kvno
+        self._entries = {}
+        # principal -> [lock, number of requests using it]
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def _principal_lock(self, principal):
+        """Serialize requests of principal, lock is dropped once unused."""
+        with self._lock:
+            lock_users = self._locks.setdefault(
+                principal, [threading.Lock(), 0]
+            )
+            lock_users[1] += 1
+        try:
+            with lock_users[0]:
+                yield
+        finally:
+            with self._lock:
+                lock_users[1] -= 1
+                if not lock_users[1]:
+                    del self._locks[principal]
+
+    def _cached(self, principal, now):
+        """Return cached keytab if still valid."""
+        entry = self._entries.get(principal)
+        if not entry or now - entry['loaded_at'] >= self.ttl:
+            return None
+
+        if now - entry['verified_at'] >= self.kvno_interval:
+            if self._kvno(principal) != entry['kvno']:
+                _LOGGER.info('Key version of [%s] changed', principal)
+                return None
+            entry['verified_at'] = now
+
+        return entry['keytab']
+
+    def get(self, principal, generate):
+        """Return keytab of principal, generate(principal) if not cached."""
+        with self._principal_lock(principal):
+            now = time.time()
+            keytab = self._cached(principal, now)
+            if keytab is not None:
+                _LOGGER.info('Keytab for [%s] served from cache', principal)
+                return keytab
+
+            with self._lock:
+                self._entries.pop(principal, None)
+            # Read before generating, a concurrent key change causes extra
+            # regeneration, not stale keytab. New principals read after.
+            kvno = self._kvno(principal)
+            keytab = generate(principal)
+            if kvno is None:
+                kvno = self._kvno(principal)
+
+            if self.ttl > 0:
+                with self._lock:
+                    self._entries[principal] = {
+                        'keytab': keytab,
+                        'kvno': kvno,
+                        'loaded_at': now,
+                        'verified_at': now,
+                    }
+            return keytab
+
+    def sweep(self):
+        """Drop expired entries."""
+        now = time.time()
+        with self._lock:
+            expired = [
+                principal for principal, entry in self._entries.items()
+                if now - entry['loaded_at'] >= self.ttl
+            ]
+            for principal in expired:
+                del self._entries[principal]
+        if expired:
+            _LOGGER.debug('Expired keytabs dropped: %d', len(expired))
+
+
+def _failure(why, principal=None, retry=False):
+    """Return failure response."""
+    result = {'why': why}
+    if principal:
+        result['principal'] = principal
+    if retry:
+        result['retry'] = True
+    return {'status': 'failure', 'result': result}
+
+
+def run_server(port, realm, admin, admin_group, workers=None,
+               max_queue=_MAX_QUEUE, timeout=_REQUEST_TIMEOUT,
+               cache_ttl=_CACHE_TTL, kvno_interval=_KVNO_INTERVAL):
+    """Runs IPA keytab server.
+
+    Requests are processed (kadmin/ipa subprocesses) in a pool of worker
+    threads, default one per CPU, the reactor only does the GSSAPI I/O.
+    """
     # TODO: pylint complains the function is too long, need to refactor.
     #
     # pylint: disable=R0915
@@ -60,30 +215,8 @@ def run_server(port, realm, admin, admin_group):
             self.realm = realm
             self.admin = admin
             self.admin_group = admin_group
-
-            if self.admin:
-                fd, krb5cc = tempfile.mkstemp(prefix='krb5cc_ipakeytab_')
-                os.close(fd)
-                os.environ['KRB5CCNAME'] = 'FILE:%s' % krb5cc
-                task.LoopingCall(
-                    self._get_admin_tickets).start(_TICKET_REFRESH_INTERVAL)
-
-        def _get_admin_tickets(self):
-            """get/refresh admin tickets."""
-            adminktdir = tempfile.mkdtemp(prefix="ipakeytab-admin-")
-            adminkt = "%s/krb5kt_%s" % (adminktdir, self.admin)
-            subproc.check_call(['kadmin.local',
-                                'ktadd',
-                                '-k',
-                                adminkt,
-                                '-norandkey',
-                                admin])
-            subproc.check_call(['kinit',
-                                '-k',
-                                '-t',
-                                adminkt,
-                                admin])
-            shutil.rmtree(adminktdir)
+            self._responded = False
+            self._timer = None
 
         def _validate_request_service(self, request):
             name, inst, realm = _parse_name(request)
@@ -202,6 +335,7 @@ def run_server(port, realm, admin, admin_group):
                 # request is for user keytab
                 self._authorize_user_request(requestor, request)
 
+        @aws.profile
         def _get_keytab_entries(self, request):
             name, inst, realm = _parse_name(request)
             tmpktdir = tempfile.mkdtemp(prefix="ipakeytab-")
@@ -242,7 +376,53 @@ def run_server(port, realm, admin, admin_group):
             shutil.rmtree(tmpktdir)
             return kt_entries
 
+        def _process(self, requestor, request):
+            """Validate, authorize and generate keytab, return response.
+
+            Runs in worker thread.
+            """
+            try:
+                self._validate_request(request)
+                self._authorize(requestor, request)
+                keytab_entries = self.factory.keytabs.get(
+                    request, self._get_keytab_entries
+                )
+                result = {}
+                result['keytab_entries'] = keytab_entries
+                result['principal'] = request
+                response = {}
+                response['status'] = "success"
+                response['result'] = result
+            except ValueError as err:
+                _LOGGER.error(repr(err))
+                response = _failure(str(err), request)
+            except Exception as err:  # pylint: disable=W0703
+                _LOGGER.exception('Unknown exception')
+                response = _failure("internal server error")
+            return response
+
+        def _respond(self, response):
+            """Send response (once) and close the connection."""
+            if self._responded:
+                return
+            self._responded = True
+            if self._timer and self._timer.active():
+                self._timer.cancel()
+
+            response_string = json.dumps(response)
+            self.write(response_string.encode('utf-8'))
+            self.transport.loseConnection()
+
+        def _timed_out(self, request):
+            _LOGGER.error('Request for [%s] timed out', request)
+            self._respond(_failure('request timed out', request, retry=True))
+
+        def _failed(self, failure):
+            _LOGGER.error('Unknown exception: %s', failure.getTraceback())
+            self._respond(_failure("internal server error"))
+
         @utils.exit_on_unhandled
+        @aws.profile
         def got_line(self, data):
             """Process ipakeytab request.
 
@@ -268,45 +448,86 @@ def run_server(port, realm, admin, admin_group):
                 request,
                 requestor)
 
-            try:
-                self._validate_request(request)
-                self._authorize(requestor, request)
-                keytab_entries = self._get_keytab_entries(request)
-                result = {}
-                result['keytab_entries'] = keytab_entries
-                result['principal'] = request
-                response = {}
-                response['status'] = "success"
-                response['result'] = result
-            except ValueError as err:
-                _LOGGER.error(repr(err))
-                result = {}
-                result['why'] = str(err)
-                result['principal'] = request
-                response = {}
-                response['status'] = "failure"
-                response['result'] = result
-            except Exception as err:  # pylint: disable=W0703
-                _LOGGER.exception('Unknown exception')
-                response = {}
-                response['status'] = "failure"
-                response['result'] = {'why': "internal server error"}
+            work = self.factory.submit(self._process, requestor, request)
+            if work is None:
+                _LOGGER.warning(
+                    'Server busy, rejecting request for [%s]', request
+                )
+                self._respond(_failure(
+                    'server busy, try again later', request, retry=True
+                ))
+                return
 
-            response_string = json.dumps(response)
-            self.write(response_string.encode('utf-8'))
-            self.transport.loseConnection()
+            self._timer = reactor.callLater(
+                timeout, self._timed_out, request
+            )
+            work.addCallbacks(self._respond, self._failed)
 
     class IPAKeytabServerFactory(protocol.Factory):
-        """IPAKeytabServer factory."""
+        """IPAKeytabServer factory, owns the worker pool."""
 
         def __init__(self, realm, admin, admin_group):
             protocol.Factory.__init__(self)
             self.realm = realm
             self.admin = admin
             self.admin_group = admin_group
+            self.workers = workers or os.cpu_count() or 1
+            self.pending = 0
+            self.keytabs = KeytabCache(cache_ttl, kvno_interval)
+            self.pool = threadpool.ThreadPool(
+                minthreads=0, maxthreads=self.workers, name='ipakeytab'
+            )
+            self.pool.start()
+            reactor.addSystemEventTrigger(
+                'during', 'shutdown', self.pool.stop
+            )
+            task.LoopingCall(self.keytabs.sweep).start(
+                _CACHE_SWEEP_INTERVAL, now=False
+            )
+
+            if self.admin:
+                fd, krb5cc = tempfile.mkstemp(prefix='krb5cc_ipakeytab_')
+                os.close(fd)
+                os.environ['KRB5CCNAME'] = 'FILE:%s' % krb5cc
+                # Tickets are needed before serving, refreshed in the pool.
+                _get_admin_tickets(self.admin)
+                task.LoopingCall(self._refresh_admin_tickets).start(
+                    _TICKET_REFRESH_INTERVAL, now=False
+                )
+
+        def _refresh_admin_tickets(self):
+            work = threads.deferToThreadPool(
+                reactor, self.pool, _get_admin_tickets, self.admin
+            )
+            work.addErrback(
+                lambda failure: _LOGGER.error(
+                    'Admin tickets refresh failed: %s', failure.getTraceback()
+                )
+            )
+            return work
+
+        def submit(self, func, *args):
+            """Run func in the worker pool, return deferred result.
+
+            Returns None if too many requests are pending already.
+            """
+            if self.pending >= self.workers + max_queue:
+                return None
+
+            self.pending += 1
+
+            def _done(result):
+                self.pending -= 1
+                return result
+
+            work = threads.deferToThreadPool(reactor, self.pool, func, *args)
+            work.addBoth(_done)
+            return work
 
         def buildProtocol(self, addr):  # pylint: disable=C0103
-            return IPAKeytabServer(self.realm, self.admin, self.admin_group)
+            server = IPAKeytabServer(self.realm, self.admin, self.admin_group)
+            server.factory = self
+            return server
 
     _LOGGER.info('IPA Keytab server starting')
     _LOGGER.info('Listening on port %d', port)
@@ -315,6 +536,9 @@ def run_server(port, realm, admin, admin_group):
     if admin_group:
         _LOGGER.info('IPA Keytab server admin group is [%s]', admin_group)
 
+    _LOGGER.info('Request timeout: %ss, max queued requests: %d',
+                 timeout, max_queue)
+
     if 'KRB5_KTNAME' in os.environ:
         _LOGGER.info('KRB5_KTNAME is set to %s', os.environ['KRB5_KTNAME'])
 
@@ -0,0 +1,293 @@
+"""In-process latency metrics with Prometheus text format export.
+"""
+
+import bisect
+import collections
+import contextlib
+import io
+import logging
+import os
+import tempfile
+import threading
+import time
+
+
+_LOGGER = logging.getLogger(__name__)
+
+# Latency buckets (seconds), upper bounds, +Inf is implicit.
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0,
+)
+
+# Latency of provisioning phases, labelled by phase (and partition, instance
+# type, lifecycle, subnet where applicable).
+PHASE_SECONDS = 'treadmill_aws_phase_seconds'
+
+
+class Histogram:
+    """Cumulative histogram of observed values."""
+
+    __slots__ = (
+        'buckets',
+        'counts',
+        'count',
+        'total',
+    )
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        """Record single observation."""
+        idx = bisect.bisect_left(self.buckets, value)
+        if idx < len(self.counts):
+            self.counts[idx] += 1
+        self.count += 1
+        self.total += value
+
+    def merge(self, counts, count, total):
+        """Merge raw histogram data (e.g. collected in another process)."""
+        for idx, value in enumerate(counts):
+            self.counts[idx] += value
+        self.count += count
+        self.total += total
+
+
+def _labels_key(labels):
+    """Convert labels dict into hashable, sorted key."""
+    return tuple(sorted(
+        (name, str(value)) for name, value in labels.items()
+        if value is not None
+    ))
+
+
+def _escape(value):
+    """Escape label value according to Prometheus text format."""
+    return value.replace(
+        '\\', '\\\\'
+    ).replace(
+        '\n', '\\n'
+    ).replace(
+        '"', '\\"'
+    )
+
+
+def _format_labels(labels_key, extra=None):
+    """Format labels as {name="value",...}."""
+    items = list(labels_key)
+    if extra:
+        items.append(extra)
+    if not items:
+        return ''
+    return '{%s}' % ','.join(
+        '{}="{}"'.format(name, _escape(value)) for name, value in items
+    )
+
+
+class Registry:
+    """Thread-safe registry of labelled histograms and counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = collections.defaultdict(dict)
+        self._counters = collections.defaultdict(collections.Counter)
+        self._help = {}
+
+    def describe(self, name, help_text):
+        """Set help text of the metric."""
+        self._help[name] = help_text
+
+    def inc(self, name, value=1, **labels):
+        """Increment counter with given labels."""
+        key = _labels_key(labels)
+        with self._lock:
+            self._counters[name][key] += value
+
+    def observe(self, name, value, **labels):
+        """Record observation of the metric with given labels."""
+        key = _labels_key(labels)
+        with self._lock:
+            histogram = self._histograms[name].get(key)
+            if histogram is None:
+                histogram = self._histograms[name][key] = Histogram()
+            histogram.observe(value)
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        """Time the block and record elapsed time (seconds).
+
+        Labels can be updated inside the block, e.g. once the subnet where
+        the instance was created is known:
+
+            with registry.timer('foo_seconds', subnet=None) as labels:
+                ...
+                labels['subnet'] = subnet
+        """
+        start_time = time.monotonic()
+        try:
+            yield labels
+        finally:
+            self.observe(name, time.monotonic() - start_time, **labels)
+
+    def snapshot(self):
+        """Return picklable copy of all collected data."""
+        with self._lock:
+            return {
+                'histograms': {
+                    name: {
+                        key: (list(hist.counts), hist.count, hist.total)
+                        for key, hist in by_labels.items()
+                    }
+                    for name, by_labels in self._histograms.items()
+                },
+                'counters': {
+                    name: dict(by_labels)
+                    for name, by_labels in self._counters.items()
+                },
+            }
+
+    def merge(self, snapshot):
+        """Merge snapshot collected by another registry."""
+        if not snapshot:
+            return
+        with self._lock:
+            for name, by_labels in snapshot['histograms'].items():
+                for key, (counts, count, total) in by_labels.items():
+                    histogram = self._histograms[name].get(key)
+                    if histogram is None:
+                        histogram = self._histograms[name][key] = Histogram()
+                    histogram.merge(counts, count, total)
+            for name, by_labels in snapshot['counters'].items():
+                self._counters[name].update(by_labels)
+
+    def reset(self):
+        """Drop all collected data."""
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def to_dict(self):
+        """Render all metrics as JSON serializable dict."""
+        snapshot = self.snapshot()
+        return {
+            'histograms': {
+                name: [
+                    {
+                        'labels': dict(key),
+                        'buckets': dict(zip(
+                            [str(bound) for bound in DEFAULT_BUCKETS],
+                            counts
+                        )),
+                        'count': count,
+                        'sum': total,
+                    }
+                    for key, (counts, count, total) in sorted(
+                        by_labels.items()
+                    )
+                ]
+                for name, by_labels in snapshot['histograms'].items()
+            },
+            'counters': {
+                name: [
+                    {'labels': dict(key), 'value': value}
+                    for key, value in sorted(by_labels.items())
+                ]
+                for name, by_labels in snapshot['counters'].items()
+            },
+        }
+
+    def to_prometheus(self):
+        """Render all metrics in Prometheus text exposition format."""
+        out = io.StringIO()
+        with self._lock:
+            for name in sorted(self._counters):
+                if name in self._help:
+                    out.write('# HELP {} {}\n'.format(name, self._help[name]))
+                out.write('# TYPE {} counter\n'.format(name))
+                by_labels = self._counters[name]
+                for key in sorted(by_labels):
+                    out.write('{}{} {}\n'.format(
+                        name, _format_labels(key), by_labels[key]
+                    ))
+            for name in sorted(self._histograms):
+                if name in self._help:
+                    out.write('# HELP {} {}\n'.format(name, self._help[name]))
+                out.write('# TYPE {} histogram\n'.format(name))
+                by_labels = self._histograms[name]
+                for key in sorted(by_labels):
+                    hist = by_labels[key]
+                    cumulative = 0
+                    for bound, count in zip(hist.buckets, hist.counts):
+                        cumulative += count
+                        out.write('{}_bucket{} {}\n'.format(
+                            name,
+                            _format_labels(key, ('le', repr(bound))),
+                            cumulative
+                        ))
+                    out.write('{}_bucket{} {}\n'.format(
+                        name, _format_labels(key, ('le', '+Inf')), hist.count
+                    ))
+                    out.write('{}_sum{} {}\n'.format(
+                        name, _format_labels(key), repr(hist.total)
+                    ))
+                    out.write('{}_count{} {}\n'.format(
+                        name, _format_labels(key), hist.count
+                    ))
+        return out.getvalue()
+
+    def write_textfile(self, path):
+        """Atomically write metrics to file (node exporter textfile format).
+        """
+        content = self.to_prometheus()
+        dirname = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=dirname, prefix='.metrics-')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(content)
+            os.chmod(tmp_path, 0o644)
+            os.rename(tmp_path, path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+
+def serve_http(registry, port, address=''):
+    """Serve registry metrics on http://<address>:<port>/metrics.
+
+    Server runs in a daemon thread, returns the server instance.
+    """
+    import http.server
+
+    class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+        """Metrics request handler."""
+
+        def do_GET(self):  # pylint: disable=invalid-name
+            """Handle GET request."""
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+
+            body = registry.to_prometheus().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):  # pylint: disable=arguments-differ
+            """Silence per-request logging."""
+            pass
+
+    server = http.server.HTTPServer((address, port), _MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    _LOGGER.info('Serving metrics on port %d', port)
+    return server
+
+
+GLOBAL = Registry()
+GLOBAL.describe(PHASE_SECONDS, 'Time spent in provisioning phase (seconds).')
@@ -0,0 +1,29 @@
+"""Provisioning configuration version.
+
+Cell and partition provisioning data (image, subnets, instance types, etc.)
+is cached by the autoscaler. Commands modifying the data bump the version
+node in Zookeeper, cache entries loaded under an older version are reloaded.
+"""
+
+import logging
+import time
+
+from treadmill import zkutils
+
+
+_LOGGER = logging.getLogger(__name__)
+
+CONFIG_VERSION = '/provisioning-config-version'
+
+
+def notify_changed(zkclient):
+    """Bump provisioning configuration version."""
+    zkutils.put(zkclient, CONFIG_VERSION, {'modified': int(time.time())})
+
+
+def config_version(zkclient):
+    """Return provisioning configuration version (None if never bumped)."""
+    stat = zkclient.exists(CONFIG_VERSION)
+    if not stat:
+        return None
+    return stat.mzxid
@@ -0,0 +1,247 @@
+"""Spot instance interruption notices.
+
+Node side agent polls instance metadata for the two minute spot interruption
+notice, publishes it to Zookeeper and blacks out the node. Autoscaler watches
+the notices to replace interrupted servers without waiting for them to be
+reported down, and tracks interruption rates per (instance type, subnet) to
+prefer spot pools that are reclaimed less often (see spotranking).
+"""
+
+import logging
+import math
+import threading
+import time
+
+import kazoo
+import requests
+
+from six.moves import http_client
+
+from treadmill import zknamespace as z
+from treadmill import zkutils
+
+from treadmill_aws import blackout
+from treadmill_aws import metrics
+
+
+_LOGGER = logging.getLogger(__name__)
+
+SPOT_INTERRUPTIONS = '/spot-interruptions'
+
+SPOT_INTERRUPTIONS_TOTAL = 'treadmill_aws_spot_interruptions_total'
+
+_METADATA_URL = 'http://169.254.169.254/latest/meta-data/'
+_INSTANCE_ACTION_URL = _METADATA_URL + 'spot/instance-action'
+_TOKEN_URL = 'http://169.254.169.254/latest/api/token'
+
+_METADATA_TIMEOUT = 2
+
+# IMDSv2 session token TTL, token is renewed a minute before expiry.
+_TOKEN_TTL = 6 * 60 * 60
+
+_TOKEN = {'token': None, 'expires': 0}
+
+# Interruption and launch counts halve every 24 hours.
+_DEFAULT_HALF_LIFE = 24 * 60 * 60
+
+
+def _metadata_token(refresh=False):
+    """Return IMDSv2 session token, None if IMDSv2 is not available."""
+    now = time.time()
+    if not refresh and now < _TOKEN['expires']:
+        return _TOKEN['token']
+
+    try:
+        resp = requests.put(
+            _TOKEN_URL,
+            headers={'X-aws-ec2-metadata-token-ttl-seconds': str(_TOKEN_TTL)},
+            timeout=_METADATA_TIMEOUT
+        )
+        resp.raise_for_status()
+    except requests.RequestException as err:
+        _LOGGER.warning('Unable to get IMDSv2 token, using IMDSv1: %s', err)
+        return None
+
+    _TOKEN['token'] = resp.text
+    _TOKEN['expires'] = now + _TOKEN_TTL - 60
+    return _TOKEN['token']
+
+
+def _get_metadata(url, refresh=False):
+    """Get instance metadata url, with IMDSv2 token if available."""
+    token = _metadata_token(refresh=refresh)
+    headers = {'X-aws-ec2-metadata-token': token} if token else {}
+    return requests.get(url, headers=headers, timeout=_METADATA_TIMEOUT)
+
+
+def _get_metadata_value(path):
+    """Return instance metadata value, renew token if rejected."""
+    resp = _get_metadata(_METADATA_URL + path)
+    if resp.status_code == http_client.UNAUTHORIZED:
+        resp = _get_metadata(_METADATA_URL + path, refresh=True)
+    resp.raise_for_status()
+    return resp.text.strip()
+
+
+def get_instance_placement():
+    """Return instance type and subnet id of the instance.
+
+    Read once at startup, attached to the interruption notice.
+    """
+    mac = _get_metadata_value('mac')
+    return {
+        'instance_type': _get_metadata_value('instance-type'),
+        'subnet': _get_metadata_value(
+            'network/interfaces/macs/{}/subnet-id'.format(mac)
+        ),
+    }
+
+
+def get_instance_action():
+    """Return spot interruption notice from instance metadata or None.
+
+    Notice is a dict, e.g. {'action': 'terminate', 'time': '...Z'}.
+    """
+    resp = _get_metadata(_INSTANCE_ACTION_URL)
+    if resp.status_code == http_client.UNAUTHORIZED:
+        # Token expired or revoked.
+        resp = _get_metadata(_INSTANCE_ACTION_URL, refresh=True)
+    if resp.status_code == http_client.NOT_FOUND:
+        return None
+    resp.raise_for_status()
+    return resp.json()
+
+
+def publish(zkclient, hostname, notice):
+    """Publish interruption notice and blackout the server."""
+    _LOGGER.warning('Spot interruption notice for %s: %r', hostname, notice)
+    zkutils.put(
+        zkclient, z.join_zookeeper_path(SPOT_INTERRUPTIONS, hostname), notice
+    )
+    blackout.put(zkclient, hostname, 'spot interruption')
+
+
+def remove(zkclient, hostname):
+    """Remove interruption notice (server has been deleted)."""
+    zkutils.ensure_deleted(
+        zkclient, z.join_zookeeper_path(SPOT_INTERRUPTIONS, hostname)
+    )
+
+
+class InterruptionWatcher:
+    """Watches interruption notices published by nodes."""
+
+    def __init__(self, zkclient):
+        self.zkclient = zkclient
+        self.notices = {}
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start watching notices."""
+        zkutils.ensure_exists(self.zkclient, SPOT_INTERRUPTIONS)
+
+        @self.zkclient.ChildrenWatch(SPOT_INTERRUPTIONS)
+        @zkutils.exit_on_unhandled
+        def _watch_notices(hostnames):
+            """Load new notices, wake up autoscaler if there are any."""
+            new = False
+            with self._lock:
+                for hostname in set(self.notices) - set(hostnames):
+                    del self.notices[hostname]
+                for hostname in hostnames:
+                    if hostname in self.notices:
+                        continue
+                    try:
+                        self.notices[hostname] = zkutils.get(
+                            self.zkclient,
+                            z.join_zookeeper_path(SPOT_INTERRUPTIONS, hostname)
+                        ) or {}
+                        new = True
+                    except kazoo.client.NoNodeError:
+                        pass
+            if new:
+                self._event.set()
+            return True
+
+    def current(self):
+        """Return current notices by hostname."""
+        with self._lock:
+            return dict(self.notices)
+
+    def wait(self, timeout):
+        """Wait for timeout or until new notice arrives (fast path)."""
+        woken = self._event.wait(timeout)
+        self._event.clear()
+        return woken
+
+
+class InterruptionRateTracker:
+    """Tracks spot interruption rate per (instance type, subnet).
+
+    Launch and interruption counts decay exponentially, rate is the ratio of
+    decayed interruptions to decayed launches.
+    """
+
+    def __init__(self, half_life=_DEFAULT_HALF_LIFE, registry=None):
+        self.half_life = half_life
+        self.registry = registry or metrics.GLOBAL
+        self._launches = {}
+        self._interruptions = {}
+        self._last_decay = time.time()
+        self._seen = set()
+
+    def _decay(self):
+        """Decay counts according to time since last decay."""
+        now = time.time()
+        factor = math.pow(0.5, (now - self._last_decay) / self.half_life)
+        self._last_decay = now
+        for counts in (self._launches, self._interruptions):
+            for key in counts:
+                counts[key] *= factor
+
+    def record_launch(self, instance_type, subnet):
+        """Record spot instance launch."""
+        self._decay()
+        key = (instance_type, subnet)
+        self._launches[key] = self._launches.get(key, 0.0) + 1
+
+    def record_interruption(self, hostname, instance_type, subnet):
+        """Record interruption (once per server)."""
+        if hostname in self._seen:
+            return False
+        self._seen.add(hostname)
+
+        self._decay()
+        key = (instance_type, subnet)
+        self._interruptions[key] = self._interruptions.get(key, 0.0) + 1
+        self.registry.inc(
+            SPOT_INTERRUPTIONS_TOTAL,
+            instance_type=instance_type, subnet=subnet
+        )
+        return True
+
+    def prune(self, hostnames):
+        """Forget interrupted servers not in hostnames (notice removed)."""
+        self._seen &= set(hostnames)
+
+    def rate(self, instance_type, subnet):
+        """Return interruption rate."""
+        key = (instance_type, subnet)
+        interruptions = self._interruptions.get(key, 0.0)
+        if not interruptions:
+            return 0.0
+        # Interruption of server launched before tracking started counts as
+        # a launch too, so that rate never exceeds 1.
+        return interruptions / max(interruptions, self._launches.get(key, 0))
+
+    def rates(self):
+        """Return non-zero rates as (instance type, subnet) -> rate dict."""
+        return {
+            key: self.rate(*key)
+            for key in self._interruptions if self.rate(*key)
+        }
+
+
+metrics.GLOBAL.describe(SPOT_INTERRUPTIONS_TOTAL,
+                        'Number of spot interruption notices.')
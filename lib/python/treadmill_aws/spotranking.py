@@ -0,0 +1,170 @@
+"""Rank instance types and subnets by spot capacity, price and failures.
+
+Spot prices (describe_spot_price_history), spot placement scores and subnet
+availability zones are cached with a TTL, so ranking is cheap enough to be
+done for every launch. Ranking falls back to configured order when the data
+is not available (e.g. missing permissions).
+"""
+
+import logging
+
+from treadmill_aws import cache
+from treadmill_aws import ec2client
+
+
+_LOGGER = logging.getLogger(__name__)
+
+_PRICES_TTL = 5 * 60
+_SCORES_TTL = 10 * 60
+_SUBNETS_TTL = 60 * 60
+
+# Failed lookups are retried after this long.
+_ERROR_TTL = 30
+
+# Placement scores are 1 (unlikely) to 10 (very likely to succeed).
+_UNKNOWN_SCORE = 5
+
+_PRICES = cache.TTLCache(_PRICES_TTL)
+_SCORES = cache.TTLCache(_SCORES_TTL)
+_SUBNETS = cache.TTLCache(_SUBNETS_TTL)
+
+
+def _load(data, key, what, loader):
+    """Return cached AWS data, empty result on error (cached briefly)."""
+    try:
+        return data.get(key, loader)
+    except Exception as err:  # pylint: disable=broad-except
+        _LOGGER.warning('Failed to get %s, retry in %ds: %r',
+                        what, _ERROR_TTL, err)
+        data.put(key, {}, ttl=_ERROR_TTL)
+        return {}
+
+
+def _spot_prices(ec2_conn, instance_types):
+    """Return {(instance type, AZ): price}."""
+    def _loader():
+        return {
+            (price['InstanceType'], price['AvailabilityZone']):
+            float(price['SpotPrice'])
+            for price in ec2client.list_spot_prices(
+                ec2_conn, list(instance_types)
+            )
+        }
+
+    return _load(
+        _PRICES, tuple(sorted(instance_types)), 'spot prices', _loader
+    )
+
+
+def _placement_scores(ec2_conn, instance_types):
+    """Return {AZ id: score} for the instance types (single call).
+
+    Score is for launching any of the types, the API does not break it
+    down per type.
+    """
+    region = ec2_conn.meta.region_name
+    instance_types = sorted(instance_types)
+
+    def _loader():
+        return {
+            score['AvailabilityZoneId']: score['Score']
+            for score in ec2client.list_spot_placement_scores(
+                ec2_conn, instance_types, region
+            )
+        }
+
+    return _load(
+        _SCORES, (region, tuple(instance_types)), 'spot placement scores',
+        _loader
+    )
+
+
+def _subnet_zones(ec2_conn, subnets):
+    """Return {subnet: (AZ, AZ id)}."""
+    def _loader():
+        return {
+            subnet['SubnetId']: (
+                subnet['AvailabilityZone'], subnet.get('AvailabilityZoneId')
+            )
+            for subnet in ec2client.list_subnets(ec2_conn, ids=list(subnets))
+        }
+
+    return _load(_SUBNETS, tuple(sorted(subnets)), 'subnets', _loader)
+
+
+def clear_cache():
+    """Drop cached ranking data."""
+    for data in (_PRICES, _SCORES, _SUBNETS):
+        data.clear()
+
+
+class InstanceRanker:
+    """Orders launch candidates, best first.
+
+    Spot candidates are ordered by placement score, discounted by observed
+    interruption rate, then by price. Candidates the feasibility tracker
+    has excluded go last. On-demand candidates keep configured order.
+    """
+
+    def __init__(self, ec2_conn, tracker, instance_types, subnets,
+                 interruption_rates=None):
+        self.ec2_conn = ec2_conn
+        self.tracker = tracker
+        self.instance_types = instance_types
+        self.spot_types = [itype for itype, spot in instance_types if spot]
+        self.subnets = subnets
+        self.interruption_rates = interruption_rates or {}
+
+    def _score(self, instance_type, subnet):
+        """Return expected spot launch success score for type/subnet."""
+        zones = _subnet_zones(self.ec2_conn, self.subnets)
+        _zone, zone_id = zones.get(subnet, (None, None))
+        score = _placement_scores(self.ec2_conn, self.spot_types).get(
+            zone_id, _UNKNOWN_SCORE
+        )
+        rate = self.interruption_rates.get((instance_type, subnet), 0.0)
+        return score * (1.0 - rate)
+
+    def _price(self, instance_type, subnet):
+        """Return spot price for type/subnet (inf if unknown)."""
+        zones = _subnet_zones(self.ec2_conn, self.subnets)
+        zone, _zone_id = zones.get(subnet, (None, None))
+        prices = _spot_prices(self.ec2_conn, self.spot_types)
+        return prices.get((instance_type, zone), float('inf'))
+
+    def _subnet_key(self, instance_type, spot, subnet):
+        """Return sort key of the subnet for given type (lower is better)."""
+        infeasible = not self.tracker.feasible(instance_type, spot, subnet)
+        if not spot:
+            return (infeasible, 0.0, 0.0)
+        return (
+            infeasible,
+            -self._score(instance_type, subnet),
+            self._price(instance_type, subnet),
+        )
+
+    def rank_instance_types(self):
+        """Order (instance type, spot) pairs, spot ones before on-demand."""
+        if not self.spot_types:
+            return self.instance_types
+
+        def _key(pair):
+            instance_type, spot = pair
+            # Rank type by its best subnet.
+            best = min(
+                [
+                    self._subnet_key(instance_type, spot, subnet)
+                    for subnet in self.subnets
+                ],
+                default=(True, 0.0, 0.0)
+            )
+            return (not spot,) + best
+
+        return sorted(self.instance_types, key=_key)
+
+    def rank_subnets(self, instance_type, spot, subnets):
+        """Order subnets for the instance type (stable for on-demand)."""
+        return sorted(
+            subnets,
+            key=lambda subnet: self._subnet_key(instance_type, spot, subnet)
+        )
@@ -1,8 +1,6 @@
 """Syncronize dns app groups with IPA dns."""
 
 import logging
-import os
-import time
 
 import click
 
@@ -35,50 +33,57 @@ def init():
         help='Root file system directory to zk2fs',
         required=True
     )
+    @click.option(
+        '--cells',
+        help='Other cells to sync, cell=zk2fs root.',
+        type=cli.DICT
+    )
+    @click.option(
+        '--zones',
+        help='Cell DNS zones, cell=zone (default: DNS domain).',
+        type=cli.DICT
+    )
     @click.option('--scopes', help='List of cell DNS scopes.', type=cli.DICT)
+    @click.option(
+        '--checkpoint',
+        help='DNS state checkpoint file prefix (suffixed with cell name).'
+    )
     @click.option(
         '--no-lock',
         is_flag=True,
         default=False,
         help='Run without lock.'
     )
-    def appdns(fs_root, scopes, no_lock):
+    def appdns(fs_root, cells, zones, scopes, checkpoint, no_lock):
         """Start Treadmill App DNS"""
-        cell = context.GLOBAL.cell
-        if not scopes:
-            scopes = {}
+        cell_roots = {context.GLOBAL.cell: fs_root}
+        cell_roots.update(cells or {})
+        zones = zones or {}
 
         # keep sleeping until zksync ready
-        modified = zksync_utils.wait_for_ready(fs_root)
+        for cell_root in cell_roots.values():
+            zksync_utils.wait_for_ready(cell_root)
 
-        sync = dns_sync.DnsSync(
+        # Cells share IPA client (session) and snapshot of each zone.
+        syncs = dns_sync.cell_syncs(
             awscontext.GLOBAL.ipaclient,
-            cell,
-            context.GLOBAL.dns_domain,
-            fs_root,
-            scopes
+            {
+                cell: (zones.get(cell, context.GLOBAL.dns_domain), cell_root)
+                for cell, cell_root in cell_roots.items()
+            },
+            scopes=scopes,
+            checkpoint=checkpoint
         )
 
-        def _run():
-            """Run sync process."""
-            modified_at = 0
-            while True:
-                new_modified = os.stat(modified).st_mtime
-                if new_modified > modified_at:
-                    sync.sync()
-                    modified_at = new_modified
-
-                time.sleep(5)
-
         if not no_lock:
             lock = zkutils.make_lock(context.GLOBAL.zk.conn,
                                      z.path.election(__name__))
 
             _LOGGER.info('Waiting for leader lock.')
             with lock:
-                _run()
+                dns_sync.run_all(syncs)
         else:
             _LOGGER.info('Running without lock.')
-            _run()
+            dns_sync.run_all(syncs)
 
     return appdns
@@ -2,8 +2,8 @@
 
 import logging
 import multiprocessing
-import time
 import collections
+import time
 
 import click
 
@@ -12,6 +12,8 @@ from treadmill import zkutils
 
 from treadmill_aws import cli as aws_cli
 from treadmill_aws import autoscale
+from treadmill_aws import metrics
+from treadmill_aws import spotinterruption
 
 
 _LOGGER = logging.getLogger(__name__)
@@ -22,6 +24,8 @@ _DEFAULT_SERVER_APP_RATIO = 0.5
 
 _DEFAULT_IDLE_SERVER_TTL = 5 * 60
 
+_DEFAULT_RECONCILE_INTERVAL = 10 * 60
+
 
 def init():
     """Autoscale Treadmill cell capacity."""
@@ -52,21 +56,58 @@ def init():
         '--workers', required=False, type=int,
         help='Number of worker processes to use to create hosts in parallel.'
     )
-    def autoscale_cmd(interval, server_app_ratio, idle_server_ttl, workers):
+    @click.option(
+        '--reconcile-interval', required=False, type=int,
+        default=_DEFAULT_RECONCILE_INTERVAL,
+        help='Time interval to register running servers missing in LDAP '
+             '(seconds, 0 to disable).'
+    )
+    @click.option(
+        '--metrics-file', required=False,
+        help='Write metrics to file (Prometheus text format) after each run.'
+    )
+    @click.option(
+        '--metrics-port', required=False, type=int,
+        help='Serve metrics (Prometheus text format) on local HTTP port.'
+    )
+    def autoscale_cmd(interval, server_app_ratio, idle_server_ttl, workers,
+                      reconcile_interval, metrics_file, metrics_port):
         """Autoscale Treadmill cell based on scheduler queue."""
         pool = None
         if workers:
             pool = multiprocessing.Pool(processes=workers)
             pool.workers = workers
 
+        if metrics_port:
+            metrics.serve_http(metrics.GLOBAL, metrics_port)
+
         context.GLOBAL.zk.add_listener(zkutils.exit_on_lost)
 
+        # New spot interruption notice cuts the sleep short (fast path).
+        interruption_watcher = spotinterruption.InterruptionWatcher(
+            context.GLOBAL.zk.conn
+        )
+        interruption_watcher.start()
+        interruption_tracker = spotinterruption.InterruptionRateTracker()
+
         idle_servers_tracker = collections.defaultdict(dict)
+        last_reconciled = 0
         while True:
-            autoscale.scale(
-                server_app_ratio, idle_server_ttl, pool=pool,
-                idle_servers_tracker=idle_servers_tracker
-            )
-            time.sleep(interval)
+            if reconcile_interval and (
+                    time.time() - last_reconciled >= reconcile_interval):
+                autoscale.reconcile_servers()
+                last_reconciled = time.time()
+
+            with metrics.GLOBAL.timer(metrics.PHASE_SECONDS, phase='cycle'):
+                autoscale.scale(
+                    server_app_ratio, idle_server_ttl, pool=pool,
+                    idle_servers_tracker=idle_servers_tracker,
+                    interruptions=interruption_watcher.current(),
+                    interruption_tracker=interruption_tracker
+                )
+            if metrics_file:
+                metrics.GLOBAL.write_textfile(metrics_file)
+            if interruption_watcher.wait(interval):
+                _LOGGER.info('Spot interruption notice, scaling now')
 
     return autoscale_cmd
@@ -1,57 +1,41 @@
 """Garbage collector."""
 
 import logging
-import time
 
 import click
-import jmespath
 
 from treadmill import cli
 from treadmill import plugin_manager
 
 from treadmill_aws import cli as aws_cli
 from treadmill_aws import awscontext
+from treadmill_aws import gc_engine
 
 
 _LOGGER = logging.getLogger(__name__)
 _MODULE = 'treadmill_aws.garbage_collector'
 
 
-def _ec2_instances():
-    """Return a set of all ec2 instance hostnames."""
-    instance_name = jmespath.compile(
-        "Reservations[].Instances[].[Tags[?Key=='Name'].Value][][]"
-    )
-
-    _LOGGER.info('Fetching valid instances from AWS')
-    instances = instance_name.search(
-        awscontext.GLOBAL.ec2.describe_instances()
-    )
-    _LOGGER.debug("%d valid instances found", len(instances))
-
-    return set(instances)
-
-
-def _run_gc(gc_plugins, interval):
+def _run_gc(gc_plugins, interval, delete_rates, generational):
     """Garbage collector plugins executor."""
     plugins = {name: plugin_manager.load(_MODULE, name) for name in gc_plugins}
-    servers = {name: set() for name in gc_plugins}
-    while True:
-        for name, plugin in plugins.items():
-            servers[name] = plugin.list()
-
-        _LOGGER.info('Snoozing for %d seconds', interval)
-        time.sleep(interval)
-
-        for name, plugin in plugins.items():
-            _LOGGER.info('%s cleanup started', name.upper())
-            if isinstance(servers[name], dict):
-                for server in set(servers[name]) - _ec2_instances():
-                    plugin.delete(server, servers[name][server])
-            else:
-                for server in servers[name] - _ec2_instances():
-                    plugin.delete(server)
-            _LOGGER.info('%s cleanup completed', name.upper())
+    rates = {
+        name: float(rate) for name, rate in (delete_rates or {}).items()
+    }
+    if generational:
+        engine = gc_engine.GenerationalCollector(
+            plugins,
+            awscontext.GLOBAL.ec2,
+            rates=rates,
+            **generational
+        )
+    else:
+        engine = gc_engine.GarbageCollector(
+            plugins,
+            awscontext.GLOBAL.ec2,
+            rates=rates
+        )
+    engine.run(interval)
 
 
 def init():
@@ -64,6 +48,17 @@ def init():
                   help='List of available plugins.')
     @click.option('--gc-plugins', default=None, type=cli.LIST,
                   help='Comma separated list of plugins to run.')
+    @click.option('--delete-rate', type=cli.DICT, default=None,
+                  help='Max deletes per second, plugin=rate.')
+    @click.option('--observations', type=int, default=None,
+                  help='Delete orphans observed missing this many times '
+                  '(mark and sweep, interval is time between cycles).')
+    @click.option('--min-age', type=int, default=1800,
+                  help='Mark and sweep: min orphan age to delete (seconds).')
+    @click.option('--full-interval', type=int, default=3600,
+                  help='Mark and sweep: full listing interval (seconds).')
+    @click.option('--state-file', default=None,
+                  help='Mark and sweep: file to persist orphans.')
     @click.option('--ipa-domain', required=False,
                   envvar='IPA_DOMAIN',
                   callback=aws_cli.handle_context_opt,
@@ -74,13 +69,23 @@ def init():
                   callback=aws_cli.handle_context_opt,
                   is_eager=True,
                   expose_value=False)
-    def top(interval, list_plugins, gc_plugins):
+    def top(interval, list_plugins, gc_plugins, delete_rate, observations,
+            min_age, full_interval, state_file):
         """Garbage collector top command handler."""
         if list_plugins:
             print(", ".join(plugin_manager.names(_MODULE)))
             return
         _LOGGER.info('Running garbage collector')
-        _run_gc(gc_plugins or plugin_manager.names(_MODULE), interval)
+        generational = None
+        if observations:
+            generational = {
+                'observations': observations,
+                'min_age': min_age,
+                'full_interval': full_interval,
+                'state_file': state_file,
+            }
+        _run_gc(gc_plugins or plugin_manager.names(_MODULE), interval,
+                delete_rate, generational)
         _LOGGER.info('Cleanup completed')
 
     return top
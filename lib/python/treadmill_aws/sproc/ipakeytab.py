@@ -36,8 +36,36 @@ def init():
                   envvar='IPAKEYTAB_ADMIN_GROUP',
                   required=False,
                   help='IPA Keytab admin group (unix group)')
-    def ipakeytabserver(port, realm, admin, admin_group):
+    @click.option('--workers',
+                  envvar='IPAKEYTAB_WORKERS',
+                  type=int,
+                  help='Number of worker threads (default: CPU count)')
+    @click.option('--max-queue',
+                  envvar='IPAKEYTAB_MAX_QUEUE',
+                  type=int,
+                  default=32,
+                  help='Max requests waiting for a worker')
+    @click.option('--timeout',
+                  envvar='IPAKEYTAB_TIMEOUT',
+                  type=int,
+                  default=60,
+                  help='Request timeout (seconds)')
+    @click.option('--cache-ttl',
+                  envvar='IPAKEYTAB_CACHE_TTL',
+                  type=int,
+                  default=600,
+                  help='Keytab cache TTL (seconds), 0 disables the cache')
+    @click.option('--kvno-interval',
+                  envvar='IPAKEYTAB_KVNO_INTERVAL',
+                  type=int,
+                  default=30,
+                  help='Max age of cached keytab kvno check (seconds)')
+    def ipakeytabserver(port, realm, admin, admin_group, workers, max_queue,
+                        timeout, cache_ttl, kvno_interval):
         """Run IPA keytab daemon."""
-        ipakeytab.run_server(port, realm, admin, admin_group)
+        ipakeytab.run_server(port, realm, admin, admin_group,
+                             workers=workers, max_queue=max_queue,
+                             timeout=timeout, cache_ttl=cache_ttl,
+                             kvno_interval=kvno_interval)
 
     return ipakeytabserver
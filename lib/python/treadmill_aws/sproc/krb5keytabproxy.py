@@ -5,13 +5,18 @@ import json
 import logging
 import os
 import sys
+import threading
+import time
 
 import click
 import dns.resolver
 
+from twisted.internet import defer
 from twisted.internet import reactor
 from twisted.internet import protocol
 from twisted.internet import task
+from twisted.internet import threads
+from twisted.python import failure
 
 from treadmill import gssapiprotocol
 from treadmill import fs
@@ -31,6 +36,9 @@ _DEFAULT_SOCK_PATH = '/var/run/krb5keytab.sock'
 
 _DEFAULT_KEYTAB_DIR = '/var/spool/keytabs'
 
+# Keytab responses are served from cache for this long after fetch.
+_KEYTAB_CACHE_TTL = 60
+
 
 def _request_keytab(server, port, principal):
     """Request keytab from keytab server."""
@@ -46,13 +54,129 @@ def _request_keytab(server, port, principal):
     return json.loads(line)
 
 
+class KeytabClient:
+    """Fetches keytabs from keytab servers, outside of the reactor thread.
+
+    Concurrent requests for the same principal share single upstream fetch,
+    successful responses are cached for cache_ttl seconds. Keytab servers,
+    if not configured, are looked up in DNS and cached for the SRV TTL.
+
+    Deferreds returned by get fire in the reactor thread.
+    """
+
+    def __init__(self, domain, krb5keytab_servers=None,
+                 cache_ttl=_KEYTAB_CACHE_TTL):
+        self.domain = domain
+        self.krb5keytab_servers = list(krb5keytab_servers or [])
+        self.cache_ttl = cache_ttl
+        # Accessed in the reactor thread only.
+        self._cache = {}
+        self._inflight = {}
+        # SRV cache is accessed by fetching threads.
+        self._srv_lock = threading.Lock()
+        self._srv = (0, [])
+
+    def endpoints(self):
+        """Return keytab server endpoints, SRV records cached for TTL."""
+        if self.krb5keytab_servers:
+            return self.krb5keytab_servers
+
+        with self._srv_lock:
+            expiration, endpoints = self._srv
+            if time.time() < expiration:
+                return endpoints
+
+            # SRV records can change during the run, NXDOMAIN is not
+            # cached.
+            try:
+                srvrecs = dns.resolver.query(
+                    '_ipakeytab._tcp.{}'.format(self.domain), 'SRV'
+                )
+            except dns.resolver.NXDOMAIN:
+                return []
+
+            endpoints = []
+            for result in srvrecs:
+                _, _, port, server = result.to_text().split()
+                endpoints.append('{}:{}'.format(server, port))
+            self._srv = (srvrecs.expiration, endpoints)
+            return endpoints
+
+    def _fetch(self, principal):
+        """Request keytab from the first keytab server responding.
+
+        Retryable failures are tried on the next server, returned only if
+        no server succeeds.
+        """
+        retry_response = None
+        last_err = ConnectionError('No keytab servers found')
+        for endpoint in self.endpoints():
+            _LOGGER.info('Connecting to %s', endpoint)
+            server, port = endpoint.split(':')
+            try:
+                response = _request_keytab(server, int(port), principal)
+            except ConnectionError as conn_err:
+                last_err = conn_err
+                _LOGGER.error(
+                    'Error requesting keytab from %s - %s',
+                    endpoint,
+                    str(conn_err)
+                )
+                continue
+
+            if not response:
+                continue
+            if (response.get('status') != 'success' and
+                    (response.get('result') or {}).get('retry')):
+                _LOGGER.warning('Keytab server %s asked to retry', endpoint)
+                retry_response = response
+                continue
+            return response
+
+        if retry_response:
+            return retry_response
+        raise last_err
+
+    def _done(self, result, principal):
+        """Cache successful response, fire all waiters of principal."""
+        waiters = self._inflight.pop(principal)
+        if isinstance(result, failure.Failure):
+            for waiter in waiters:
+                waiter.errback(result)
+            return
+
+        if self.cache_ttl > 0 and result['status'] == 'success':
+            self._cache[principal] = (time.time() + self.cache_ttl, result)
+        for waiter in waiters:
+            waiter.callback(result)
+
+    def get(self, principal):
+        """Return deferred keytab server response for principal."""
+        expiration, response = self._cache.get(principal, (0, None))
+        if time.time() < expiration:
+            _LOGGER.info('Keytab for %s served from cache', principal)
+            return defer.succeed(response)
+        self._cache.pop(principal, None)
+
+        waiter = defer.Deferred()
+        if principal in self._inflight:
+            _LOGGER.info('Waiting for pending request: %s', principal)
+            self._inflight[principal].append(waiter)
+            return waiter
+
+        self._inflight[principal] = [waiter]
+        threads.deferToThread(self._fetch, principal).addBoth(
+            self._done, principal
+        )
+        return waiter
+
+
 class Krb5KeytabProxy(peercredprotocol.PeerCredLineServer):
     """Proxy krb5keytab requests to krb5keytab server."""
 
-    def __init__(self, hostname, domain, krb5keytab_servers, keytab_dir):
+    def __init__(self, hostname, client, keytab_dir):
         self.hostname = hostname
-        self.domain = domain
-        self.krb5keytab_servers = krb5keytab_servers
+        self.client = client
         self.keytab_dir = keytab_dir
         super().__init__()
 
@@ -112,61 +236,41 @@ class Krb5KeytabProxy(peercredprotocol.PeerCredLineServer):
         principal = '{}/{}'.format(username, self.hostname)
         _LOGGER.info('Requesting keytab: %s', principal)
 
-        endpoints = list(self.krb5keytab_servers)
-        if not endpoints:
-            # Try to get servers on each request, as srv records can change
-            # during the run.
-            try:
-                srvrecs = dns.resolver.query(
-                    '_ipakeytab._tcp.{}'.format(self.domain), 'SRV'
-                )
-            except dns.resolver.NXDOMAIN:
-                srvrecs = []
-            for result in srvrecs:
-                _, _, port, server = result.to_text().split()
-                endpoints.append('{}:{}'.format(server, port))
+        deferred = self.client.get(principal)
+        deferred.addCallback(self._got_response, keytab)
+        deferred.addErrback(self._failed)
 
-        last_err = None
-        for endpoint in endpoints:
-            _LOGGER.info('Connecting to %s', endpoint)
-            server, port = endpoint.split(':')
-            try:
-                response = _request_keytab(server, int(port), principal)
-                if response:
-                    self._handle(response)
-                    if keytab:
-                        # Write keytab to the disk.
-                        self._write_keytab(response)
-                    break
-            except ConnectionError as conn_err:
-                last_err = conn_err
-                _LOGGER.error(
-                    'Error requesting keytab from %s - %s',
-                    endpoint,
-                    str(conn_err)
-                )
+    def _got_response(self, response, keytab):
+        """Reply to the client, write keytab to the disk if requested."""
+        if keytab and response['status'] == 'success':
+            self._write_keytab(response)
+        self._handle(response)
 
-        if last_err:
-            self._handle_error('Error requesting keytabs', last_err)
+    def _failed(self, reason):
+        """Reply with the upstream error."""
+        self._handle_error('Error requesting keytabs', reason.value)
+        self.transport.loseConnection()
 
 
 class Krb5KeytabProxyFactory(protocol.Factory):
     """Krb5KeytabProxy protocol factory."""
 
-    def __init__(self, krb5keytab_servers, keytab_dir):
+    def __init__(self, krb5keytab_servers, keytab_dir,
+                 cache_ttl=_KEYTAB_CACHE_TTL):
         self.hostname = sysinfo.hostname()
         self.keytab_dir = keytab_dir
-        self.domain = awscontext.GLOBAL.ipa_domain
-
-        self.krb5keytab_servers = krb5keytab_servers
+        self.client = KeytabClient(
+            awscontext.GLOBAL.ipa_domain,
+            krb5keytab_servers,
+            cache_ttl=cache_ttl
+        )
 
         super().__init__()
 
     def buildProtocol(self, addr):  # pylint: disable=C0103
         return Krb5KeytabProxy(
             hostname=self.hostname,
-            domain=self.domain,
-            krb5keytab_servers=self.krb5keytab_servers,
+            client=self.client,
             keytab_dir=self.keytab_dir
         )
 
@@ -186,7 +290,11 @@ def init():
     @click.option('--keytab-dir',
                   required=False,
                   help='Directory to store keytabs.')
-    def krb5keytabproxy(sock_path, krb5keytab_server, keytab_dir):
+    @click.option('--cache-ttl',
+                  type=int,
+                  default=_KEYTAB_CACHE_TTL,
+                  help='Keytab cache TTL (seconds), 0 disables the cache.')
+    def krb5keytabproxy(sock_path, krb5keytab_server, keytab_dir, cache_ttl):
         """Run krb5keytab proxy server."""
         if not sock_path:
             sock_path = _DEFAULT_SOCK_PATH
@@ -213,7 +321,9 @@ def init():
         task.LoopingCall(_refresh_krbcc).start(_HOST_CREDS_REFRESH_INTERVAL)
         reactor.listenUNIX(
             sock_path,
-            Krb5KeytabProxyFactory(list(krb5keytab_server), keytab_dir)
+            Krb5KeytabProxyFactory(
+                list(krb5keytab_server), keytab_dir, cache_ttl=cache_ttl
+            )
         )
         reactor.run()
 
@@ -0,0 +1,64 @@
+"""Watch for spot interruption notice and publish it to Zookeeper."""
+
+import logging
+import time
+
+import click
+
+from treadmill import context
+from treadmill import sysinfo
+from treadmill import zkutils
+
+from treadmill_aws import spotinterruption
+
+
+_LOGGER = logging.getLogger(__name__)
+
+# Notice is given two minutes before the instance is reclaimed.
+_DEFAULT_INTERVAL = 5
+
+
+def init():
+    """Spot interruption watcher."""
+
+    @click.command(name='spot-interruption')
+    @click.option(
+        '--interval', required=False, default=_DEFAULT_INTERVAL, type=int,
+        help='Instance metadata poll interval (seconds).'
+    )
+    @click.option(
+        '--hostname', required=False,
+        help='Server name, defaults to local hostname.'
+    )
+    def spot_interruption_cmd(interval, hostname):
+        """Publish spot interruption notice and blackout the node."""
+        hostname = hostname or sysinfo.hostname()
+
+        context.GLOBAL.zk.add_listener(zkutils.exit_on_lost)
+
+        # Read upfront, there is no time to spare once notice is given.
+        placement = {'instance_type': None, 'subnet': None}
+        try:
+            placement = spotinterruption.get_instance_placement()
+        except Exception as err:  # pylint: disable=broad-except
+            _LOGGER.warning('Failed to query instance placement: %r', err)
+
+        while True:
+            try:
+                notice = spotinterruption.get_instance_action()
+            except Exception as err:  # pylint: disable=broad-except
+                _LOGGER.warning('Failed to query instance metadata: %r', err)
+                notice = None
+
+            if notice:
+                notice.update(placement)
+                spotinterruption.publish(
+                    context.GLOBAL.zk.conn, hostname, notice
+                )
+                # Node is going away, nothing left to do.
+                while True:
+                    time.sleep(interval)
+
+            time.sleep(interval)
+
+    return spot_interruption_cmd
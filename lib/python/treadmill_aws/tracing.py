@@ -0,0 +1,190 @@
+"""Low overhead function tracing: nested spans, call counters and latency.
+
+Tracing is disabled by default, decorated functions then only pay for a
+single attribute check. Enable it with tracing.GLOBAL.enable() or by setting
+TREADMILL_AWS_TRACE to the sample rate (e.g. TREADMILL_AWS_TRACE=0.1).
+
+When enabled, every call is counted (treadmill_aws_calls_total, errors in
+treadmill_aws_call_errors_total) and timed (treadmill_aws_call_seconds).
+Sampling only decides which calls are recorded as spans; the most recent
+root spans are kept with their children for the JSON dump (printed to
+stderr on exit with --aws-metrics).
+"""
+
+import collections
+import contextlib
+import functools
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+from treadmill_aws import metrics
+
+
+_LOGGER = logging.getLogger(__name__)
+
+CALLS_TOTAL = 'treadmill_aws_calls_total'
+CALL_ERRORS_TOTAL = 'treadmill_aws_call_errors_total'
+CALL_SECONDS = 'treadmill_aws_call_seconds'
+
+_MAX_TRACES = 100
+
+
+class Span:
+    """Single timed operation, with nested child spans."""
+
+    __slots__ = (
+        'name',
+        'start',
+        'duration',
+        'error',
+        'children',
+    )
+
+    def __init__(self, name):
+        self.name = name
+        self.start = time.time()
+        self.duration = None
+        self.error = None
+        self.children = []
+
+    def to_dict(self):
+        """Return span tree as dict."""
+        return {
+            'name': self.name,
+            'start': self.start,
+            'duration': self.duration,
+            'error': self.error,
+            'children': [child.to_dict() for child in self.children],
+        }
+
+
+class Tracer:
+    """Collects spans and call metrics into metrics registry."""
+
+    def __init__(self, registry, max_traces=_MAX_TRACES):
+        self.registry = registry
+        self.enabled = False
+        self.sample_rate = 1.0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._traces = collections.deque(maxlen=max_traces)
+
+    def enable(self, sample_rate=1.0):
+        """Enable tracing, sample given fraction of root spans."""
+        self.sample_rate = float(sample_rate)
+        self.enabled = True
+
+    def disable(self):
+        """Disable tracing."""
+        self.enabled = False
+
+    def _stack(self):
+        """Return thread local stack of active spans (None if not sampled).
+        """
+        try:
+            return self._local.stack
+        except AttributeError:
+            self._local.stack = []
+            return self._local.stack
+
+    @contextlib.contextmanager
+    def span(self, name):
+        """Trace the block as span with given name."""
+        if not self.enabled:
+            yield None
+            return
+
+        self.registry.inc(CALLS_TOTAL, func=name)
+
+        stack = self._stack()
+        if stack:
+            # Nested span inherits sampling decision of the root span.
+            sampled = stack[-1] is not None
+        else:
+            sampled = random.random() < self.sample_rate
+
+        current = None
+        if sampled:
+            current = Span(name)
+            if stack:
+                stack[-1].children.append(current)
+        stack.append(current)
+
+        start_time = time.monotonic()
+        try:
+            yield current
+        except Exception as err:
+            self.registry.inc(CALL_ERRORS_TOTAL, func=name)
+            if current is not None:
+                current.error = type(err).__name__
+            raise
+        finally:
+            duration = time.monotonic() - start_time
+            stack.pop()
+            self.registry.observe(CALL_SECONDS, duration, func=name)
+            if current is not None:
+                current.duration = duration
+                if not stack:
+                    with self._lock:
+                        self._traces.append(current)
+
+    def traces(self):
+        """Return recent root spans."""
+        with self._lock:
+            return list(self._traces)
+
+    def dump_json(self):
+        """Dump metrics and recent traces as JSON."""
+        return json.dumps({
+            'metrics': self.registry.to_dict(),
+            'traces': [span.to_dict() for span in self.traces()],
+        })
+
+
+def trace(func=None, name=None):
+    """Decorator to trace function calls.
+
+    Span name defaults to <module>.<qualified function name>. When tracing
+    is disabled, exec time is logged at debug level as before.
+    """
+    if func is None:
+        return functools.partial(trace, name=name)
+
+    span_name = name or '{}.{}'.format(func.__module__, func.__qualname__)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        """Wrapper function."""
+        tracer = GLOBAL
+        if tracer.enabled:
+            with tracer.span(span_name):
+                return func(*args, **kwargs)
+
+        if not _LOGGER.isEnabledFor(logging.DEBUG):
+            return func(*args, **kwargs)
+
+        start_time = time.time()
+        res = func(*args, **kwargs)
+        _LOGGER.debug('%s exec time: %s', func.__name__,
+                      time.time() - start_time)
+        return res
+    return wrapper
+
+
+def span(name):
+    """Trace the block as span in global tracer."""
+    return GLOBAL.span(name)
+
+
+GLOBAL = Tracer(metrics.GLOBAL)
+GLOBAL.registry.describe(CALLS_TOTAL, 'Number of traced calls.')
+GLOBAL.registry.describe(CALL_ERRORS_TOTAL,
+                         'Number of traced calls that raised.')
+GLOBAL.registry.describe(CALL_SECONDS, 'Traced call latency (seconds).')
+
+if os.environ.get('TREADMILL_AWS_TRACE'):
+    GLOBAL.enable(os.environ['TREADMILL_AWS_TRACE'])
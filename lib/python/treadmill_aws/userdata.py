@@ -6,9 +6,13 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import collections
+import functools
 import gzip
+import hashlib
+import io
 import logging
 import os
+import re
 import sys
 
 import email
@@ -59,6 +63,19 @@ _PARTS_ORDER = [
 ]
 
 
+class UserDataTooLarge(ValueError):
+    """User data exceeds EC2 limit."""
+
+
+# EC2 limit, applies to user data before base64 encoding.
+MAX_USER_DATA_SIZE = 16 * 1024
+
+# Compression levels tried in turn until user data fits the size limit.
+_COMPRESS_LEVELS = (1, 6, 9)
+
+_INCLUDE_TYPES = ('text/x-include-url', 'text/x-include-once-url')
+
+
 def _guess_content_type(payload):
     """Guess cloud-init content type based on content."""
     for begins_with, content_type in _PAYLOAD_2_MIMETYPE.items():
@@ -96,19 +113,109 @@ def _iterate_cloud_init(content):
         yield (name, content_type, payload)
 
 
+@functools.lru_cache(maxsize=128)
+def _parse_cloud_init(content):
+    """Return parsed cloud_init parts (cached, same content is often added
+    again, e.g. for every host or image build).
+    """
+    return tuple(_iterate_cloud_init(content))
+
+
+def _digest(payload):
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
 class CloudInit:
     """Manage cloud-init data."""
 
     def __init__(self, content=None):
         self.content_by_mimetype = collections.defaultdict(list)
+        self.duplicates = 0
+        self._digests = set()
 
         if content:
-            for name, content_type, payload in _iterate_cloud_init(content):
-                self.content_by_mimetype[content_type].append((name, payload))
+            self.add(content)
+
+    def userdata(self, max_size=None, store=None):
+        """Return cloud-init compressed and encoded.
+
+        If max_size is given, see build().
+        """
+        if max_size is None:
+            return gzip.compress(self.as_bytes())
+        user_data, _report = self.build(max_size, store=store)
+        return user_data
 
-    def userdata(self):
-        """Return cloud-init compressed and encoded."""
-        return gzip.compress(self.as_bytes())
+    def build(self, max_size=MAX_USER_DATA_SIZE, store=None):
+        """Return compressed user data fitting max_size and size report.
+
+        Compression level is increased until the data fits. If it still does
+        not, largest parts are moved to the store (see DirectoryStore) and
+        replaced with #include URLs. Raises UserDataTooLarge if that is not
+        possible.
+        """
+        cloud_init = self
+        offloaded = []
+        while True:
+            raw = cloud_init.as_bytes()
+            for level in _COMPRESS_LEVELS:
+                user_data = gzip.compress(raw, compresslevel=level)
+                if len(user_data) <= max_size:
+                    report = {
+                        'raw_size': len(raw),
+                        'size': len(user_data),
+                        'max_size': max_size,
+                        'headroom': max_size - len(user_data),
+                        'compress_level': level,
+                        'duplicates': self.duplicates,
+                        'offloaded': offloaded,
+                    }
+                    _LOGGER.info('User data size: %r', report)
+                    return user_data, report
+
+            if store is None:
+                break
+            cloud_init, name = cloud_init.offload_largest(store)
+            if name is None:
+                break
+            offloaded.append(name)
+
+        raise UserDataTooLarge(
+            'User data size %s exceeds %s bytes' % (len(user_data), max_size)
+        )
+
+    def offload_largest(self, store):
+        """Return copy with largest part moved to store and part name."""
+        candidates = [
+            (len(payload), mime_type, idx)
+            for mime_type, parts in self.content_by_mimetype.items()
+            if mime_type not in _INCLUDE_TYPES
+            for idx, (_name, payload) in enumerate(parts)
+        ]
+        if not candidates:
+            return self, None
+
+        _size, mime_type, idx = max(candidates)
+        name, payload = self.content_by_mimetype[mime_type][idx]
+        url = store.put(_digest(payload), payload.encode())
+
+        cloud_init = CloudInit()
+        cloud_init.duplicates = self.duplicates
+        for part_type, parts in self.content_by_mimetype.items():
+            cloud_init.content_by_mimetype[part_type] = [
+                part for part_idx, part in enumerate(parts)
+                if (part_type, part_idx) != (mime_type, idx)
+            ]
+
+        # Included URLs are listed in one part.
+        includes = cloud_init.content_by_mimetype['text/x-include-url']
+        if includes and includes[-1][0] == 'offloaded':
+            includes[-1] = ('offloaded', includes[-1][1] + url + '\n')
+        else:
+            includes.append(('offloaded', '#include\n' + url + '\n'))
+
+        _LOGGER.info('Moved %s (%s) to %s', name, mime_type, url)
+        return cloud_init, name
 
     def as_str(self):
         """Render as string."""
@@ -141,12 +248,141 @@ class CloudInit:
 
         return combined_message.as_bytes()
 
+    def _add_part(self, name, content_type, payload):
+        """Add part, skip if identical part was already added."""
+        digest = (content_type, _digest(payload))
+        if digest in self._digests:
+            _LOGGER.debug('Skipping duplicate part: %s', name)
+            self.duplicates += 1
+            return
+        self._digests.add(digest)
+        self.content_by_mimetype[content_type].append((name, payload))
+
     def add(self, content):
         """Add payload."""
-        for name, content_type, payload in _iterate_cloud_init(content):
-            self.content_by_mimetype[content_type].append((name, payload))
+        for name, content_type, payload in _parse_cloud_init(content):
+            self._add_part(name, content_type, payload)
 
     def add_cloud_config(self, obj):
         """Add object as cloud-config payload."""
         content = '#cloud-config\n\n{}'.format(yaml.dump(obj))
-        self.content_by_mimetype['text/cloud-config'].append(('-', content))
+        self._add_part('-', 'text/cloud-config', content)
+
+
+class DirectoryStore:
+    """Store for user data parts moved out to #include URLs.
+
+    Files are written to a local directory, served as base_url (e.g. by a
+    web server or a synced bucket).
+    """
+
+    def __init__(self, path, base_url):
+        self.path = path
+        self.base_url = base_url.rstrip('/')
+
+    def put(self, key, data):
+        """Store data, return URL."""
+        os.makedirs(self.path, exist_ok=True)
+        with io.open(os.path.join(self.path, key), 'wb') as f:
+            f.write(data)
+        return '{}/{}'.format(self.base_url, key)
+
+
+class S3Store:
+    """Store user data parts in S3, included with presigned URLs."""
+
+    def __init__(self, s3_conn, bucket, prefix='', expires=24 * 60 * 60):
+        self.s3_conn = s3_conn
+        self.bucket = bucket
+        self.prefix = prefix
+        self.expires = expires
+
+    def put(self, key, data):
+        """Store data, return URL."""
+        if self.prefix:
+            key = '{}/{}'.format(self.prefix.rstrip('/'), key)
+        self.s3_conn.put_object(Bucket=self.bucket, Key=key, Body=data)
+        return self.s3_conn.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': self.bucket, 'Key': key},
+            ExpiresIn=self.expires
+        )
+
+
+_TEMPLATE_FIELDS = ('hostname', 'otp')
+
+_PLACEHOLDER = '@@{}@@'
+
+# Values substituted into the template must render as plain single quoted
+# YAML scalars (no escaping, line folding or MIME encoding needed).
+_SAFE_VALUE_RE = re.compile(r'^[\x21-\x7e]*$')
+
+
+class UserDataTemplate:
+    """Pre-rendered cloud-config user data with per host fields.
+
+    Instance vars are rendered once; render() only substitutes hostname and
+    otp. The result is the same as rendering all vars with yaml.dump, or,
+    if multipart is set, the gzip compressed cloud-init multipart message.
+    """
+
+    def __init__(self, instance_vars, multipart=False):
+        self.multipart = multipart
+
+        key_value_pairs = dict(instance_vars)
+        for field in _TEMPLATE_FIELDS:
+            key_value_pairs[field] = _PLACEHOLDER.format(field)
+
+        content = '#cloud-config\n' + yaml.dump(
+            key_value_pairs, default_flow_style=False, default_style='\''
+        )
+        if multipart:
+            cloud_init = CloudInit()
+            cloud_init.add(content)
+            content = cloud_init.as_str()
+
+        # Split into static parts and fields: [part, field, part, ...]
+        self._parts = re.split(
+            '\'{}\''.format(_PLACEHOLDER.format('(\\w+)')), content
+        )
+        if sorted(self._parts[1::2]) != sorted(_TEMPLATE_FIELDS):
+            raise ValueError('Unable to render user data template')
+
+    def render(self, **values):
+        """Render user data for given hostname and otp."""
+        fields = self._parts[1::2]
+        if set(fields) != set(values):
+            raise ValueError(
+                'Expected fields: %s, got: %s' % (fields, sorted(values))
+            )
+
+        parts = list(self._parts)
+        for idx in range(1, len(parts), 2):
+            parts[idx] = _scalar(parts[idx], values[parts[idx]])
+
+        user_data = ''.join(parts)
+        if self.multipart:
+            user_data = gzip.compress(user_data.encode())
+
+        check_size(user_data)
+        return user_data
+
+
+def _scalar(field, value):
+    """Render value as single quoted YAML scalar."""
+    if not isinstance(value, str):
+        # E.g. otp is None if host is not enrolled.
+        return yaml.dump(value, default_style='\'').strip()
+    if not _SAFE_VALUE_RE.match(value):
+        raise ValueError('Invalid %s: %r' % (field, value))
+    return '\'{}\''.format(value.replace('\'', '\'\''))
+
+
+def check_size(user_data):
+    """Raise UserDataTooLarge if user data exceeds EC2 limit."""
+    size = len(user_data.encode() if isinstance(user_data, str) else user_data)
+    if size > MAX_USER_DATA_SIZE:
+        raise UserDataTooLarge(
+            'User data size %s exceeds %s bytes' % (size, MAX_USER_DATA_SIZE)
+        )
+    return size
@@ -0,0 +1,242 @@
+"""Quorum aware rolling replacement of the Zookeeper ensemble.
+
+Ensemble state is read with the "srvr"/"mntr" four letter words, or from
+the AdminServer (admin port) if configured. Followers are replaced first,
+the leader last; each member must rejoin and catch up with the leader
+before the next one is replaced.
+"""
+
+import logging
+import socket
+import time
+
+import requests
+
+from treadmill import exc
+
+from treadmill_aws import ec2client
+from treadmill_aws import hostmanager
+
+
+_LOGGER = logging.getLogger(__name__)
+
+_DEFAULT_CLIENT_PORT = 2181
+
+_CONNECT_TIMEOUT = 5
+
+_POLL_INTERVAL = 10
+
+_REJOIN_TIMEOUT = 20 * 60
+
+
+class ZkRolloutError(Exception):
+    """Ensemble is not healthy, rollout stopped."""
+
+
+def four_letter_word(host, port, cmd, timeout=_CONNECT_TIMEOUT):
+    """Send four letter word command, return response."""
+    with socket.create_connection((host, port), timeout=timeout) as sock:
+        sock.sendall(cmd.encode())
+        chunks = []
+        while True:
+            chunk = sock.recv(4096)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    return b''.join(chunks).decode()
+
+
+def _stats_4lw(host, port):
+    """Return server state, zxid and synced followers (leader only)."""
+    srvr = dict(
+        line.split(': ', 1)
+        for line in four_letter_word(host, port, 'srvr').splitlines()
+        if ': ' in line
+    )
+    stats = {
+        'state': srvr['Mode'].strip(),
+        'zxid': int(srvr['Zxid'], 16),
+        'synced_followers': None,
+    }
+    if stats['state'] == 'leader':
+        mntr = dict(
+            line.split('\t', 1)
+            for line in four_letter_word(host, port, 'mntr').splitlines()
+            if '\t' in line
+        )
+        stats['synced_followers'] = int(mntr['zk_synced_followers'])
+    return stats
+
+
+def _stats_admin(host, admin_port):
+    """Return server stats from the AdminServer."""
+    url = 'http://{}:{}/commands/'.format(host, admin_port)
+    srvr = requests.get(
+        url + 'srvr', timeout=_CONNECT_TIMEOUT
+    ).json()['server_stats']
+    stats = {
+        'state': srvr['server_state'],
+        'zxid': srvr['last_processed_zxid'],
+        'synced_followers': None,
+    }
+    if stats['state'] == 'leader':
+        mntr = requests.get(url + 'mntr', timeout=_CONNECT_TIMEOUT).json()
+        stats['synced_followers'] = mntr['synced_followers']
+    return stats
+
+
+def server_stats(master, admin_port=None):
+    """Return ensemble member stats, None if not serving."""
+    host = master['hostname']
+    try:
+        if admin_port:
+            return _stats_admin(host, admin_port)
+        return _stats_4lw(
+            host, master.get('zk-client-port', _DEFAULT_CLIENT_PORT)
+        )
+    except (OSError, ValueError, KeyError,
+            requests.exceptions.RequestException) as err:
+        _LOGGER.debug('%s not serving: %r', host, err)
+        return None
+
+
+def ensemble_stats(masters, admin_port=None):
+    """Return {hostname: stats} of all ensemble members."""
+    return {
+        master['hostname']: server_stats(master, admin_port)
+        for master in masters
+    }
+
+
+def check_quorum(masters, stats):
+    """Return leader hostname if all members are in sync, None otherwise.
+
+    All members must be serving, with one leader and the others synced
+    followers caught up with the leader zxid (zxid read before the
+    followers', so followers can only be ahead).
+    """
+    leaders = [
+        hostname for hostname, member in stats.items()
+        if member and member['state'] == 'leader'
+    ]
+    if len(leaders) != 1:
+        return None
+
+    leader = stats[leaders[0]]
+    if leader['synced_followers'] != len(masters) - 1:
+        return None
+
+    for hostname, member in stats.items():
+        if hostname == leaders[0]:
+            continue
+        if not member or member['state'] != 'follower':
+            return None
+        if member['zxid'] < leader['zxid']:
+            return None
+
+    return leaders[0]
+
+
+def _ordered_stats(masters, admin_port):
+    """Return member stats, followers queried after the leader."""
+    stats = ensemble_stats(masters, admin_port)
+    if any(member and member['state'] == 'leader'
+           for member in stats.values()):
+        stats.update(ensemble_stats(
+            [master for master in masters
+             if (stats[master['hostname']] or {}).get('state') != 'leader'],
+            admin_port
+        ))
+    return stats
+
+
+def quorum_leader(masters, admin_port=None):
+    """Return leader hostname if the ensemble is in sync, None otherwise."""
+    return check_quorum(masters, _ordered_stats(masters, admin_port))
+
+
+def wait_for_quorum(masters, admin_port=None, timeout=_REJOIN_TIMEOUT,
+                    poll_interval=_POLL_INTERVAL):
+    """Wait until all members are in sync, return the leader hostname."""
+    deadline = time.time() + timeout
+    while True:
+        leader = quorum_leader(masters, admin_port)
+        if leader:
+            return leader
+        if time.time() >= deadline:
+            raise ZkRolloutError('Ensemble not in sync after %ss' % timeout)
+        time.sleep(poll_interval)
+
+
+def rollout(masters, replace, admin_port=None, timeout=_REJOIN_TIMEOUT,
+            poll_interval=_POLL_INTERVAL):
+    """Replace all ensemble members, one at a time.
+
+    replace(master) replaces the member's instance. Nothing is replaced
+    unless the ensemble is healthy; followers go first, the leader last.
+    Returns list of replaced hostnames.
+    """
+    if len(masters) < 3:
+        raise ZkRolloutError('Replacing a member would break quorum')
+
+    leader = quorum_leader(masters, admin_port)
+    if not leader:
+        raise ZkRolloutError('Ensemble not healthy, not rolling out')
+
+    replaced = []
+    while len(replaced) < len(masters):
+        # Leader might have moved, pick by current leader every time.
+        master = min(
+            [m for m in masters if m['hostname'] not in replaced],
+            key=lambda m: (m['hostname'] == leader, m['idx'])
+        )
+        _LOGGER.info('Replacing %s, leader: %s', master['hostname'], leader)
+        replace(master)
+        replaced.append(master['hostname'])
+
+        leader = wait_for_quorum(masters, admin_port, timeout, poll_interval)
+        _LOGGER.info('%s rejoined, ensemble in sync', master['hostname'])
+
+    return replaced
+
+
+def rollout_ensemble(ec2_conn, ipa_client, masters, image,
+                     instance_profile=None, admin_port=None,
+                     timeout=_REJOIN_TIMEOUT, poll_interval=_POLL_INTERVAL,
+                     on_replaced=None):
+    """Replace all ensemble members' instances with the given image.
+
+    Instance type and subnet are copied from the old instances, looked up
+    (with the image) before anything is replaced to keep the time a member
+    is down short. on_replaced(hostname) is called after each replacement.
+    """
+    if not image.startswith('ami-'):
+        image = ec2client.get_image(
+            ec2_conn, owners=['self'], name=image
+        )['ImageId']
+
+    instances = {}
+    for master in masters:
+        try:
+            instances[master['hostname']] = ec2client.get_instance(
+                ec2_conn, hostnames=[master['hostname']]
+            )
+        except exc.NotFoundError:
+            raise ZkRolloutError(
+                '%s EC2 instance does not exist' % master['hostname']
+            )
+
+    def _replace(master):
+        hostmanager.replace_zk(
+            ec2_conn=ec2_conn,
+            instance_profile=instance_profile,
+            ipa_client=ipa_client,
+            master=master,
+            old_master=instances[master['hostname']],
+            image_id=image
+        )
+        if on_replaced:
+            on_replaced(master['hostname'])
+
+    return rollout(masters, _replace, admin_port=admin_port,
+                   timeout=timeout, poll_interval=poll_interval)
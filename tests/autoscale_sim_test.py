@@ -0,0 +1,129 @@
+"""Autoscaler simulation and benchmark tests."""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from treadmill_aws import autoscale_sim
+
+
+class AutoscaleSimTest(unittest.TestCase):
+    """Tests autoscaler against simulated cell."""
+
+    def test_burst(self):
+        """Test pending apps are placed once servers boot."""
+        simulation = autoscale_sim.Simulation(
+            partitions={'part': {
+                'autoscale': {'min_servers': 0, 'max_servers': 20},
+            }},
+            workload=autoscale_sim.synthetic_workload(
+                'part', [(0, 20)], duration=1200
+            ),
+            boot_delay=(60, 60),
+            apps_per_server=4,
+        )
+        report = simulation.run(1800)
+
+        self.assertEqual(report['apps_placed'], 20)
+        self.assertEqual(report['apps_pending'], 0)
+        # Boot delay plus at most one scale interval and one tick.
+        self.assertLessEqual(report['time_to_capacity']['max'], 60 + 60 + 5)
+        self.assertGreater(report['node_hours'], 0)
+        # Idle servers are deleted after apps are gone.
+        self.assertEqual(report['servers'], 0)
+
+    def test_capacity_errors(self):
+        """Test exhausted instance types fall back to other types/subnets."""
+        simulation = autoscale_sim.Simulation(
+            partitions={'part': {
+                'autoscale': {'min_servers': 0, 'max_servers': 20},
+                'instance_types': ['m5.large', 'm5.xlarge'],
+            }},
+            workload=autoscale_sim.synthetic_workload(
+                'part', [(0, 8)], duration=3600
+            ),
+            exhausted={
+                ('m5.large', 'on-demand', subnet)
+                for subnet in ('subnet-a', 'subnet-b', 'subnet-c')
+            },
+        )
+        report = simulation.run(600)
+
+        self.assertEqual(report['apps_pending'], 0)
+        types = {
+            instance['InstanceType']
+            for instance in simulation.ec2.instances.values()
+        }
+        self.assertEqual(types, {'m5.xlarge'})
+
+    def test_replay(self):
+        """Test replay of recorded apps snapshots."""
+        apps_state = {
+            'columns': ['instance', 'partition', 'server'],
+            'data': [['proid.foo#1', 'part', None],
+                     ['proid.foo#2', 'part', None]],
+        }
+        later_state = dict(apps_state, data=apps_state['data'][:1])
+        workload = autoscale_sim.replay_workload([
+            {'time': 0, 'apps': apps_state},
+            {'time': 300, 'apps': later_state},
+        ])
+        self.assertEqual(
+            [(offset, action, names) for offset, action, _, names in workload],
+            [(0, 'add', ['proid.foo#1', 'proid.foo#2']),
+             (300, 'remove', ['proid.foo#2'])]
+        )
+
+    def test_load_scenario(self):
+        """Test recorded scenario with exhausted capacity is loaded."""
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        path = os.path.join(root, 'scenario.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'partitions': {'part': {
+                    'autoscale': {'min_servers': 0, 'max_servers': 4},
+                }},
+                'snapshots': [{'time': 0, 'apps': {
+                    'columns': ['instance', 'partition', 'server'],
+                    'data': [['proid.foo#1', 'part', None]],
+                }}],
+                'exhausted': [['m5.large', 'on-demand', 'subnet-a']],
+                'duration': 600,
+            }, f)
+
+        simulation, duration = autoscale_sim.load_scenario(path)
+        self.assertEqual(duration, 600)
+        self.assertEqual(simulation.ec2.exhausted,
+                         {('m5.large', 'on-demand', 'subnet-a')})
+
+    def test_deterministic(self):
+        """Test runs with the same seed give the same report."""
+        def _run():
+            report = autoscale_sim.Simulation(
+                partitions={'part': {
+                    'autoscale': {'min_servers': 0, 'max_servers': 20},
+                }},
+                workload=autoscale_sim.synthetic_workload(
+                    'part', [(0, 30), (300, 10)], duration=600
+                ),
+                seed=42,
+            ).run(1200)
+            del report['cycle_cpu']
+            return report
+
+        self.assertEqual(_run(), _run())
+
+    def test_benchmarks(self):
+        """Run benchmark suite, check cycle CPU time budget."""
+        reports = autoscale_sim.run_benchmarks()
+        for name, report in reports.items():
+            self.assertEqual(report['apps_pending'], 0, name)
+            # Generous budget, catches accidental O(n^2) regressions only.
+            self.assertLess(report['cycle_cpu']['mean'], 0.5, name)
+
+
+if __name__ == '__main__':
+    unittest.main()
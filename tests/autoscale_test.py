@@ -3,6 +3,7 @@
 #
 # pylint: disable=C0302
 
+import datetime
 import time
 import collections
 import unittest
@@ -11,9 +12,12 @@ import mock
 from botocore import exceptions as botoexc
 
 from treadmill import context
+from treadmill.admin import exc as admin_exceptions
 
 from treadmill_aws import autoscale
 from treadmill_aws import awscontext
+from treadmill_aws import metrics
+from treadmill_aws import spotinterruption
 
 
 def _mock_cell(admin_mock, stateapi_mock,
@@ -49,6 +53,7 @@ class AutoscaleTest(unittest.TestCase):
         context.GLOBAL.ldap_suffix = 'dc=test'
         context.GLOBAL.dns_domain = 'foo.com'
         awscontext.GLOBAL.ipa_domain = 'foo.com'
+        autoscale.clear_provisioning_context()
 
     @mock.patch('treadmill_aws.autoscale.create_n_servers', mock.Mock())
     @mock.patch('treadmill_aws.autoscale.delete_servers_by_name', mock.Mock())
@@ -647,6 +652,79 @@ class AutoscaleTest(unittest.TestCase):
             ['server1'], pool=None
         )
 
+    @mock.patch('treadmill_aws.autoscale.create_n_servers', mock.Mock())
+    @mock.patch('treadmill_aws.autoscale.delete_servers_by_name', mock.Mock())
+    @mock.patch('treadmill_aws.autoscale._query_stateapi')
+    @mock.patch('treadmill.context.Context.admin')
+    @mock.patch('time.time', mock.Mock(return_value=1000.0))
+    def test_scale_interrupted(self, admin_mock, stateapi_mock):
+        """Test replacing servers with spot interruption notice."""
+
+        mock_zkclient = context.GLOBAL.zk.conn
+        mock_zkclient.get_children.return_value = []
+
+        # Ratio: 1.0, apps on interrupted server1 count as pending - create 2
+        # servers, delete empty interrupted server3.
+        _mock_cell(
+            admin_mock, stateapi_mock,
+            partitions=[
+                {'_id': 'partition',
+                 'data': {'autoscale': {'min_servers': 0, 'max_servers': 9}}},
+            ],
+            servers=[
+                {'_id': 'server1', 'partition': 'partition',
+                 '_create_timestamp': 100.0,
+                 'data': {'type': 'm5.large', 'lifecycle': 'spot',
+                          'subnet': 'subnet-a'}},
+                {'_id': 'server2', 'partition': 'partition',
+                 '_create_timestamp': 100.0},
+                {'_id': 'server3', 'partition': 'partition',
+                 '_create_timestamp': 100.0,
+                 'data': {'type': 'm5.large', 'lifecycle': 'spot',
+                          'subnet': 'subnet-b'}},
+            ],
+            servers_state=[
+                ('server1', 'up', 100, 100, 100),
+                ('server2', 'up', 100, 100, 100),
+                ('server3', 'up', 100, 100, 100),
+            ],
+            apps_state=[
+                ('proid.app#001', 'partition', 'server1'),
+                ('proid.app#002', 'partition', 'server1'),
+                ('proid.app#003', 'partition', 'server2'),
+            ],
+        )
+        autoscale.create_n_servers.return_value = [
+            {'hostname': 'server4', 'type': 'm5.large', 'lifecycle': 'spot',
+             'subnet': 'subnet-c'},
+            {'hostname': 'server5', 'type': 'm5.large', 'lifecycle': 'spot',
+             'subnet': 'subnet-c'},
+        ]
+        tracker = spotinterruption.InterruptionRateTracker(
+            registry=metrics.Registry()
+        )
+
+        autoscale.scale(
+            0.5, 0,
+            interruptions={
+                'server1': {'action': 'terminate'},
+                'server3': {'action': 'terminate', 'subnet': 'subnet-c'},
+            },
+            interruption_tracker=tracker
+        )
+
+        autoscale.create_n_servers.assert_called_once_with(
+            2, 'partition', pool=None,
+            interruption_rates={
+                ('m5.large', 'subnet-a'): 1.0,
+                ('m5.large', 'subnet-c'): 1.0,
+            }
+        )
+        autoscale.delete_servers_by_name.assert_called_once_with(
+            ['server3'], pool=None
+        )
+        self.assertEqual(tracker.rate('m5.large', 'subnet-c'), 0.5)
+
     @mock.patch('treadmill.context.Context.ldap',
                 mock.Mock(url=['ldap://foo:1234']))
     @mock.patch('treadmill.context.Context.admin')
@@ -1049,6 +1127,58 @@ class AutoscaleTest(unittest.TestCase):
 
         create_host_mock.reset_mock()
 
+    @mock.patch('treadmill.context.Context.ldap',
+                mock.Mock(url=['ldap://foo:1234']))
+    @mock.patch('treadmill.context.Context.admin')
+    @mock.patch('treadmill.syscall.krb5.get_host_realm',
+                mock.Mock(return_value=['FOO.COM']))
+    @mock.patch('treadmill_aws.hostmanager.create_host', mock.Mock())
+    @mock.patch('treadmill_aws.hostmanager.create_otp', mock.Mock())
+    @mock.patch('treadmill_aws.ec2client.get_image')
+    @mock.patch('treadmill_aws.awscontext.AWSContext.ec2', mock.Mock())
+    @mock.patch('treadmill_aws.awscontext.AWSContext.ipaclient', mock.Mock())
+    @mock.patch('time.time', mock.Mock(return_value=1000.0))
+    def test_provisioning_context_cache(self, get_image_mock, admin_mock):
+        """Test provisioning context is cached until config is modified."""
+        admin_cell_mock = admin_mock.cell.return_value
+        admin_cell_mock.get.return_value = {
+            'data': {
+                'image': 'foo-image',
+                'size': 'm5.large',
+                'subnets': ['subnet-4c76610a'],
+                'secgroup': 'test',
+                'hostgroups': ['test'],
+                'instance_profile': 'test',
+                'disk_size': '100',
+                'aws_account': 'test',
+            }
+        }
+        admin_part_mock = admin_mock.partition.return_value
+        admin_part_mock.get.return_value = {'data': {}}
+        get_image_mock.return_value = {'ImageId': 'ami-foo'}
+        mock_zkclient = context.GLOBAL.zk.conn
+        mock_zkclient.exists.return_value = mock.Mock(mzxid=1)
+
+        autoscale.create_n_servers(1, 'partition')
+        autoscale.create_n_servers(1, 'partition')
+
+        self.assertEqual(admin_cell_mock.get.call_count, 1)
+        self.assertEqual(admin_part_mock.get.call_count, 1)
+        get_image_mock.assert_called_once_with(
+            mock.ANY, owners=['self'], name='foo-image'
+        )
+        mock_zkclient.exists.assert_called_with(
+            '/provisioning-config-version'
+        )
+
+        # Configuration modified.
+        mock_zkclient.exists.return_value = mock.Mock(mzxid=2)
+        autoscale.create_n_servers(1, 'partition')
+
+        self.assertEqual(admin_cell_mock.get.call_count, 2)
+        self.assertEqual(get_image_mock.call_count, 2)
+
+    @mock.patch('treadmill_aws.blackout.remove')
     @mock.patch('treadmill.presence.kill_node')
     @mock.patch('treadmill.context.Context.ldap',
                 mock.Mock(url=['ldap://foo:1234']))
@@ -1057,7 +1187,7 @@ class AutoscaleTest(unittest.TestCase):
     @mock.patch('treadmill_aws.awscontext.AWSContext.ec2', mock.Mock())
     @mock.patch('treadmill_aws.awscontext.AWSContext.ipaclient', mock.Mock())
     def test_delete_servers_by_name(self, delete_hosts_mock, admin_mock,
-                                    kill_node_mock):
+                                    kill_node_mock, blackout_remove_mock):
         """Test deleting servers by name."""
         admin_srv_mock = admin_mock.server.return_value
 
@@ -1075,6 +1205,7 @@ class AutoscaleTest(unittest.TestCase):
                 'test-partition-dq2opbqskkq.foo.com',
                 'test-partition-dq2opc7ao37.foo.com',
             ],
+            on_terminated=mock.ANY,
         )
         admin_srv_mock.delete.assert_has_calls([
             mock.call('test-partition-dq2opb2qrfj.foo.com'),
@@ -1086,6 +1217,12 @@ class AutoscaleTest(unittest.TestCase):
             mock.call(mock.ANY, 'test-partition-dq2opbqskkq.foo.com'),
             mock.call(mock.ANY, 'test-partition-dq2opc7ao37.foo.com'),
         ])
+        # Blackout of deleted servers is cleared.
+        blackout_remove_mock.assert_has_calls([
+            mock.call(mock.ANY, 'test-partition-dq2opb2qrfj.foo.com'),
+            mock.call(mock.ANY, 'test-partition-dq2opbqskkq.foo.com'),
+            mock.call(mock.ANY, 'test-partition-dq2opc7ao37.foo.com'),
+        ])
 
     @mock.patch('treadmill.presence.kill_node')
     @mock.patch('treadmill.context.Context.ldap',
@@ -1113,6 +1250,7 @@ class AutoscaleTest(unittest.TestCase):
                 'test-partition-dq2opb2qrfj.foo.com',
                 'test-partition-dq2opbqskkq.foo.com',
             ],
+            on_terminated=mock.ANY,
         )
         admin_srv_mock.delete.assert_has_calls([
             mock.call('test-partition-dq2opb2qrfj.foo.com'),
@@ -1122,3 +1260,209 @@ class AutoscaleTest(unittest.TestCase):
             mock.call(mock.ANY, 'test-partition-dq2opb2qrfj.foo.com'),
             mock.call(mock.ANY, 'test-partition-dq2opbqskkq.foo.com'),
         ])
+
+    @mock.patch('treadmill.presence.kill_node', mock.Mock())
+    @mock.patch('treadmill.context.Context.ldap',
+                mock.Mock(url=['ldap://foo:1234']))
+    @mock.patch('treadmill.context.Context.admin')
+    @mock.patch('treadmill_aws.hostmanager.delete_hosts')
+    @mock.patch('treadmill_aws.awscontext.AWSContext.ec2', mock.Mock())
+    @mock.patch('treadmill_aws.awscontext.AWSContext.ipaclient', mock.Mock())
+    def test_delete_servers_pipelined(self, delete_hosts_mock, admin_mock):
+        """Test servers are unregistered as their instances are terminated."""
+        admin_srv_mock = admin_mock.server.return_value
+        # Already unregistered server is ignored.
+        admin_srv_mock.delete.side_effect = lambda hostname: _raise_if(
+            hostname == 'host2.foo.com',
+            admin_exceptions.NoSuchObjectResult(hostname)
+        )
+
+        def _delete_hosts(hostnames, on_terminated, **_kwargs):
+            on_terminated(hostnames[:1])
+            raise Exception('Termination failed')
+
+        delete_hosts_mock.side_effect = _delete_hosts
+
+        with self.assertRaises(Exception):
+            autoscale.delete_servers_by_name(
+                ['host1.foo.com', 'host2.foo.com']
+            )
+
+        # Only terminated server is unregistered.
+        admin_srv_mock.delete.assert_called_once_with('host1.foo.com')
+
+        delete_hosts_mock.side_effect = None
+        admin_srv_mock.delete.reset_mock()
+        autoscale.delete_servers_by_name(['host1.foo.com', 'host2.foo.com'])
+
+        admin_srv_mock.delete.assert_has_calls([
+            mock.call('host1.foo.com'),
+            mock.call('host2.foo.com'),
+        ])
+
+    @mock.patch('treadmill.context.Context.ldap',
+                mock.Mock(url=['ldap://foo:1234']))
+    @mock.patch('treadmill.context.Context.admin')
+    @mock.patch('treadmill_aws.ec2client.list_instances')
+    @mock.patch('treadmill_aws.awscontext.AWSContext.ec2', mock.Mock())
+    @mock.patch('treadmill_aws.awscontext.AWSContext.sts', mock.Mock())
+    @mock.patch('time.time', mock.Mock(return_value=1000000.0))
+    def test_reconcile_servers(self, list_instances_mock, admin_mock):
+        """Test registering running servers missing in LDAP."""
+        admin_srv_mock = admin_mock.server.return_value
+        admin_srv_mock.list.return_value = [{'_id': 'host1.foo.com'}]
+        admin_srv_mock.create.side_effect = lambda hostname, _data: _raise_if(
+            hostname == 'host3.foo.com',
+            admin_exceptions.AlreadyExistsResult(hostname)
+        )
+
+        def _instance(hostname, age, **kwargs):
+            instance = {
+                'Tags': [
+                    {'Key': 'Name', 'Value': hostname},
+                    {'Key': 'Partition', 'Value': 'partition'},
+                ],
+                'InstanceType': 'm5.large',
+                'SubnetId': 'subnet-a',
+                'LaunchTime': datetime.datetime.fromtimestamp(
+                    1000000.0 - age, tz=datetime.timezone.utc
+                ),
+            }
+            instance.update(kwargs)
+            return instance
+
+        list_instances_mock.return_value = [
+            _instance('host1.foo.com', 3600),
+            _instance('host2.foo.com', 3600, InstanceLifecycle='spot'),
+            _instance('host3.foo.com', 3600),
+            # Just launched, may still be registered by the autoscaler.
+            _instance('host4.foo.com', 10),
+        ]
+
+        self.assertEqual(
+            autoscale.reconcile_servers(),
+            ['host2.foo.com', 'host3.foo.com']
+        )
+
+        list_instances_mock.assert_called_once_with(
+            mock.ANY, tags={'Cell': 'test', 'Role': 'node'}
+        )
+        data = {
+            'cell': 'test',
+            'partition': 'partition',
+            'data': {
+                'type': 'm5.large',
+                'lifecycle': 'spot',
+                'subnet': 'subnet-a',
+            },
+        }
+        admin_srv_mock.create.assert_has_calls([
+            mock.call('host2.foo.com', data),
+            mock.call('host3.foo.com', mock.ANY),
+        ])
+        # Existing server object is updated.
+        admin_srv_mock.update.assert_called_once_with(
+            'host3.foo.com', mock.ANY
+        )
+
+    @mock.patch('treadmill.zkutils.put')
+    @mock.patch('treadmill_aws.autoscale._get_state')
+    @mock.patch('treadmill_aws.autoscale.create_n_servers')
+    @mock.patch('treadmill_aws.autoscale.delete_servers_by_name')
+    @mock.patch('time.sleep', mock.Mock())
+    def test_rotate_servers(self, delete_mock, create_mock, get_state_mock,
+                            zkput_mock):
+        """Test rolling rotation of servers."""
+        servers = {
+            'server1': {'state': 'up', 'num_apps': 2},
+            'server2': {'state': 'up', 'num_apps': 0},
+            'server3': {'state': 'down', 'num_apps': 0},
+            'server4': {'state': 'up', 'num_apps': 1},
+        }
+        blackedout = set()
+        new_servers = iter(['new1', 'new2', 'new3', 'new4'])
+
+        def _create(count, _partition):
+            hostnames = [next(new_servers) for _ in range(count)]
+            # Not up until the next state poll.
+            for hostname in hostnames:
+                servers[hostname] = {'state': 'new', 'num_apps': 0}
+            return [{'hostname': hostname} for hostname in hostnames]
+
+        def _get_state():
+            state = [
+                {'name': name, 'create_timestamp': 0, **server}
+                for name, server in sorted(servers.items())
+            ]
+            # Apps move off blacked out servers, new ones come up.
+            for name, server in servers.items():
+                if name in blackedout:
+                    server['num_apps'] = 0
+                if server['state'] == 'new':
+                    server['state'] = 'up'
+            return {}, {'partition': state}
+
+        create_mock.side_effect = _create
+        get_state_mock.side_effect = _get_state
+        zkput_mock.side_effect = lambda _zk, path, _data: blackedout.add(
+            path.split('/')[-1]
+        )
+
+        rotated = autoscale.rotate_servers(
+            4, 'partition', wave_size=2, poll_interval=0
+        )
+
+        # Broken first, then least busy.
+        self.assertEqual(rotated, ['server3', 'server2', 'server4', 'server1'])
+        create_mock.assert_has_calls([
+            mock.call(2, 'partition'),
+            mock.call(2, 'partition'),
+        ])
+        delete_mock.assert_has_calls([
+            mock.call(['server3', 'server2']),
+            mock.call(['server4', 'server1']),
+        ])
+        self.assertEqual(
+            blackedout, {'server1', 'server2', 'server3', 'server4'}
+        )
+
+        # New servers not up, old ones are kept, next waves cancelled.
+        servers = {
+            'server1': {'state': 'up', 'num_apps': 2},
+            'server2': {'state': 'up', 'num_apps': 0},
+        }
+        new_servers = iter(['new5', 'new6'])
+        create_mock.reset_mock()
+        delete_mock.reset_mock()
+        create_mock.side_effect = lambda count, _partition: [
+            {'hostname': next(new_servers)} for _ in range(count)
+        ]
+
+        with self.assertRaises(autoscale.RotationError):
+            autoscale.rotate_servers(
+                2, 'partition', poll_interval=0, up_timeout=0
+            )
+
+        create_mock.assert_called_once_with(1, 'partition')
+        delete_mock.assert_not_called()
+
+        # Apps not moved off, old server is left blacked out.
+        servers = {'server1': {'state': 'up', 'num_apps': 2}}
+        new_servers = iter(['new7'])
+        blackedout.clear()
+        create_mock.side_effect = _create
+        get_state_mock.side_effect = lambda: (
+            {}, {'partition': [
+                {'name': name, 'create_timestamp': 0,
+                 **dict(server, state='up')}
+                for name, server in sorted(servers.items())
+            ]}
+        )
+
+        with self.assertRaises(autoscale.RotationError):
+            autoscale.rotate_servers(
+                1, 'partition', poll_interval=0, drain_timeout=0
+            )
+
+        self.assertEqual(blackedout, {'server1'})
+        delete_mock.assert_not_called()
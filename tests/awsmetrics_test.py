@@ -0,0 +1,111 @@
+"""Tests for AWS API call metrics."""
+
+import unittest
+
+import boto3
+from botocore import stub
+
+from treadmill_aws import awsmetrics
+from treadmill_aws import metrics
+
+
+def _counter(registry, name, **labels):
+    """Return counter value."""
+    key = tuple(sorted(labels.items()))
+    return registry.snapshot()['counters'].get(name, {}).get(key, 0)
+
+
+class BotoMetricsTest(unittest.TestCase):
+    """Tests botocore event handlers."""
+
+    def setUp(self):
+        self.registry = metrics.Registry()
+        session = boto3.Session(
+            region_name='us-east-1',
+            aws_access_key_id='foo',
+            aws_secret_access_key='bar',
+        )
+        awsmetrics.BotoMetrics(self.registry).register(session.events)
+        self.ec2 = session.client('ec2')
+
+    def test_calls(self):
+        """Test call counts, latency, retries and errors."""
+        with stub.Stubber(self.ec2) as stubber:
+            stubber.add_response(
+                'describe_instances',
+                {'Reservations': [],
+                 'ResponseMetadata': {'RetryAttempts': 2}}
+            )
+            stubber.add_response('describe_instances', {'Reservations': []})
+            stubber.add_client_error(
+                'run_instances', service_error_code='InsufficientCapacity'
+            )
+            self.ec2.describe_instances()
+            self.ec2.describe_instances()
+            with self.assertRaises(Exception):
+                self.ec2.run_instances(
+                    ImageId='ami-1', MinCount=1, MaxCount=1
+                )
+
+        self.assertEqual(
+            _counter(self.registry, awsmetrics.API_CALLS_TOTAL,
+                     service='ec2', operation='DescribeInstances'),
+            2
+        )
+        self.assertEqual(
+            _counter(self.registry, awsmetrics.API_RETRIES_TOTAL,
+                     service='ec2', operation='DescribeInstances'),
+            2
+        )
+        self.assertEqual(
+            _counter(self.registry, awsmetrics.API_ERRORS_TOTAL,
+                     service='ec2', operation='RunInstances',
+                     code='InsufficientCapacity'),
+            1
+        )
+        histograms = self.registry.snapshot()['histograms']
+        key = (('operation', 'DescribeInstances'), ('service', 'ec2'))
+        self.assertEqual(histograms[awsmetrics.API_CALL_SECONDS][key][1], 2)
+
+        summary = awsmetrics.summary(self.registry)
+        self.assertEqual(
+            [(entry['operation'], entry['calls'], entry['errors'])
+             for entry in summary],
+            [('DescribeInstances', 2, 0), ('RunInstances', 1, 1)]
+        )
+        self.assertIn('DescribeInstances', awsmetrics.format_summary(
+            self.registry
+        ))
+
+    def test_throttles(self):
+        """Test throttled attempts are counted, retry is not affected."""
+        handlers = awsmetrics.BotoMetrics(self.registry)
+        event_name = 'needs-retry.ec2.DescribeInstances'
+
+        self.assertIsNone(handlers.needs_retry(
+            event_name=event_name,
+            response=(None, {'Error': {'Code': 'RequestLimitExceeded'}})
+        ))
+        self.assertIsNone(handlers.needs_retry(
+            event_name=event_name,
+            response=(None, {'Error': {'Code': 'InvalidParameter'}})
+        ))
+        self.assertIsNone(handlers.needs_retry(
+            event_name=event_name, response=None
+        ))
+        handlers.before_send(event_name='before-send.ec2.DescribeInstances')
+
+        self.assertEqual(
+            _counter(self.registry, awsmetrics.API_THROTTLES_TOTAL,
+                     service='ec2', operation='DescribeInstances'),
+            1
+        )
+        self.assertEqual(
+            _counter(self.registry, awsmetrics.API_REQUESTS_TOTAL,
+                     service='ec2', operation='DescribeInstances'),
+            1
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+"""CLI startup (cold import) budget check, using python -X importtime."""
+
+import os
+import subprocess
+import sys
+import unittest
+
+
+# Modules loaded by the common commands (admin aws/cell, krb5keytab).
+_COMMANDS = [
+    'treadmill_aws.cli',
+    'treadmill_aws.cli.admin.aws',
+    'treadmill_aws.cli.admin.cell',
+    'treadmill_aws.cli.admin.krb5keytab',
+    'treadmill_aws.formatter',
+]
+
+# Dependencies only needed by the subcommands using them.
+_HEAVY = ['boto3', 'jinja2', 'yaml', 'dns', 'jmespath', 'twisted']
+
+# Cumulative import time budget, per command module.
+_BUDGET_MS = int(os.environ.get('TREADMILL_AWS_IMPORT_BUDGET_MS', 1000))
+
+
+def importtime(module):
+    """Return ({imported module: cumulative us}) of cold import of module.
+
+    Raises ImportError with the interpreter error if module can not be
+    imported.
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(sys.path)
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=False
+    )
+    if proc.returncode:
+        raise ImportError(proc.stderr.strip().splitlines()[-1])
+
+    imported = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        if not cumulative_us.strip().isdigit():
+            # Header line.
+            continue
+        imported[name.strip()] = int(cumulative_us)
+    return imported
+
+
+class CliStartupTest(unittest.TestCase):
+    """Tests cold start of the common commands stays within budget."""
+
+    def test_startup(self):
+        """Test heavy dependencies not imported, import time in budget."""
+        checked = 0
+        failed = {}
+        for module in _COMMANDS:
+            try:
+                imported = importtime(module)
+            except ImportError as err:
+                failed[module] = str(err)
+                continue
+            checked += 1
+
+            self.assertEqual(
+                [heavy for heavy in _HEAVY if heavy in imported], [],
+                module
+            )
+            self.assertLess(
+                imported[module] / 1000, _BUDGET_MS,
+                '{} import time over budget'.format(module)
+            )
+
+        if not checked:
+            self.skipTest(
+                'Command modules can not be imported: {!r}'.format(failed)
+            )
+        self.assertEqual(failed, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,381 @@
+"""Tests for dns_sync."""
+
+import io
+import os
+import shutil
+import socket
+import tempfile
+import time
+import unittest
+
+import mock
+import yaml
+
+from treadmill_aws import dns_sync
+
+
+_SRV = '_http._tcp.foo.test.cell'
+
+
+def _raise_if(check, err):
+    if check:
+        raise err
+
+
+# pylint: disable=protected-access
+def _benchmark(records=50000, servers=2000, other_hosts=500,
+               resolve_delay=0.002):
+    """Time loading current state of synthetic zone, return report.
+
+    Zone records point to cell servers and other hosts (every other one
+    does not resolve), resolver latency is simulated.
+    """
+    cell_servers = ['server{}.foo.com'.format(idx) for idx in range(servers)]
+    targets = cell_servers + [
+        'other{}.foo.com'.format(idx) for idx in range(other_hosts)
+    ]
+    ipaclient = mock.Mock()
+    ipaclient.list_dns_records.return_value = [
+        {
+            'idnsname': ['_http._tcp.app{}.bench.cell'.format(idx)],
+            'srvrecord': ['10 10 {} {}.'.format(
+                8000 + idx % 1000, targets[idx % len(targets)]
+            )],
+        }
+        for idx in range(records)
+    ]
+
+    lookups = []
+
+    def _resolver(host):
+        lookups.append(host)
+        time.sleep(resolve_delay)
+        if host.startswith('other') and int(host[5:].split('.')[0]) % 2:
+            raise socket.gaierror(host)
+        return '192.168.0.1'
+
+    sync = dns_sync.DnsSync(ipaclient, 'bench', 'foo.com', '/', {})
+    sync.servers = set(cell_servers)
+    sync.resolver = _resolver
+
+    start = time.perf_counter()
+    current = sync._current_records()
+    cold = time.perf_counter() - start
+
+    start = time.perf_counter()
+    sync._current_records()
+    warm = time.perf_counter() - start
+
+    return {
+        'records': records,
+        'current_records': len(current),
+        'lookups': len(lookups),
+        'seconds': cold,
+        'warm_seconds': warm,
+        'serial_seconds_estimate': records * resolve_delay,
+    }
+
+
+class DnsSyncTest(unittest.TestCase):
+    """Tests DnsSync."""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        for subdir in ('app-groups', 'endpoints/proid1', 'servers'):
+            os.makedirs(os.path.join(self.root, subdir))
+        self.ipaclient = mock.Mock()
+        self.ipaclient.list_dns_records.return_value = []
+        self.ipaclient.update_dns_records.return_value = {}
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def _appgroup(self, name, pattern, endpoints, alias):
+        path = os.path.join(self.root, 'app-groups', name)
+        with open(path, 'w') as f:
+            yaml.dump({
+                'group-type': 'dns',
+                'pattern': pattern,
+                'endpoints': endpoints,
+                'data': ['alias={}'.format(alias)],
+            }, f)
+        return path
+
+    def _endpoint(self, name, hostport):
+        path = os.path.join(self.root, 'endpoints', 'proid1', name)
+        with open(path, 'w') as f:
+            f.write(hostport)
+        return path
+
+    def test_incremental_sync(self):
+        """Test only srv records affected by changes are updated."""
+        appgroup = self._appgroup('proid1.foo', 'proid1.app*', ['http'], 'foo')
+        self._endpoint('app1#0000000001:tcp:http', 'host1.foo.com:8000')
+
+        sync = dns_sync.DnsSync(
+            self.ipaclient, 'test', 'foo.com', self.root, {}
+        )
+        sync.sync()
+        self.ipaclient.update_dns_records.assert_called_once_with(
+            'srvrecord', add=[(_SRV, '10 10 8000 host1.foo.com.')],
+            delete=[], dns_zone='foo.com'
+        )
+
+        # New endpoint, only the new record is added.
+        self.ipaclient.reset_mock()
+        sync.endpoint_changed(
+            self._endpoint('app2#0000000002:tcp:http', 'host2.foo.com:8000')
+        )
+        sync.endpoint_changed(
+            self._endpoint('bar#0000000003:tcp:http', 'host3.foo.com:8000')
+        )
+        sync.flush()
+        self.ipaclient.update_dns_records.assert_called_once_with(
+            'srvrecord', add=[(_SRV, '10 10 8000 host2.foo.com.')],
+            delete=[], dns_zone='foo.com'
+        )
+
+        # Endpoint removed.
+        self.ipaclient.reset_mock()
+        path = os.path.join(
+            self.root, 'endpoints', 'proid1', 'app1#0000000001:tcp:http'
+        )
+        os.unlink(path)
+        sync.endpoint_changed(path)
+        sync.flush()
+        self.ipaclient.update_dns_records.assert_called_once_with(
+            'srvrecord', add=[],
+            delete=[(_SRV, '10 10 8000 host1.foo.com.')], dns_zone='foo.com'
+        )
+
+        # Second appgroup with same alias, record is kept until both are gone.
+        self.ipaclient.reset_mock()
+        sync.appgroup_changed(
+            self._appgroup('proid1.foo2', 'proid1.*', ['http'], 'foo')
+        )
+        os.unlink(appgroup)
+        sync.appgroup_changed(appgroup)
+        sync.flush()
+        self.ipaclient.update_dns_records.assert_called_once_with(
+            'srvrecord', add=[(_SRV, '10 10 8000 host3.foo.com.')],
+            delete=[], dns_zone='foo.com'
+        )
+
+        self.assertEqual(
+            sync.state,
+            {
+                (_SRV, '10 10 8000 host2.foo.com.'),
+                (_SRV, '10 10 8000 host3.foo.com.'),
+            }
+        )
+        # Incremental state same as after full sync.
+        self.assertEqual(sync.state, sync._target_records())
+        # No DNS rescan.
+        self.ipaclient.list_dns_records.assert_not_called()
+
+    def test_endpoint_index(self):
+        """Test endpoints are scanned once and read once per version."""
+        self._appgroup('proid1.foo', 'proid1.app*', ['http'], 'foo')
+        self._appgroup('proid1.foo2', 'proid1.app1', ['http', 'ssh'], 'foo')
+        self._appgroup('proid1.bar', 'proid1.b?r', ['http'], 'bar')
+        self._endpoint('app1#0000000001:tcp:http', 'host1.foo.com:8000')
+        self._endpoint('app1#0000000001:tcp:ssh', 'host1.foo.com:22')
+        self._endpoint('app2#0000000002:tcp:http', 'host2.foo.com:8000')
+        self._endpoint('bar#0000000003:tcp:http', 'host3.foo.com:8000')
+        self._endpoint('.app3#0000000004:tcp:http', 'host4.foo.com:8000')
+
+        sync = dns_sync.DnsSync(
+            self.ipaclient, 'test', 'foo.com', self.root, {}
+        )
+        with mock.patch('os.scandir', side_effect=os.scandir) as scandir, \
+                mock.patch('io.open', side_effect=io.open) as io_open:
+            target = sync._target_records()
+            scanned = [
+                os.path.relpath(call[0][0], self.root)
+                for call in scandir.call_args_list
+                if 'endpoints' in call[0][0]
+            ]
+            self.assertEqual(scanned, ['endpoints', 'endpoints/proid1'])
+            self.assertEqual(io_open.call_count, 3 + 4)
+
+            io_open.reset_mock()
+            self.assertEqual(sync._target_records(), target)
+            # Only appgroups are read again.
+            self.assertEqual(io_open.call_count, 3)
+
+        self.assertEqual(
+            target,
+            {
+                (_SRV, '10 10 8000 host1.foo.com.'),
+                (_SRV, '10 10 8000 host2.foo.com.'),
+                ('_ssh._tcp.foo.test.cell', '10 10 22 host1.foo.com.'),
+                ('_http._tcp.bar.test.cell', '10 10 8000 host3.foo.com.'),
+            }
+        )
+
+    def test_current_records(self):
+        """Test cell servers are not resolved, others resolved once."""
+        self.ipaclient.list_dns_records.return_value = [
+            {'idnsname': ['_http._tcp.foo.test.cell'],
+             'srvrecord': ['10 10 8000 host1.foo.com.',
+                           '10 10 8001 host1.foo.com.',
+                           '10 10 8000 other.foo.com.',
+                           '10 10 8000 gone.foo.com.']},
+            {'idnsname': ['foo'], 'arecord': ['192.168.0.1']},
+        ]
+        resolver = mock.Mock(side_effect=lambda host: _raise_if(
+            host == 'gone.foo.com', socket.gaierror(host)
+        ))
+        sync = dns_sync.DnsSync(
+            self.ipaclient, 'test', 'foo.com', self.root, {}
+        )
+        sync.resolver = resolver
+        sync.servers = {'host1.foo.com'}
+
+        current = {
+            (_SRV, '10 10 8000 host1.foo.com.'),
+            (_SRV, '10 10 8001 host1.foo.com.'),
+            # Stale, host does not exist.
+            (_SRV, '10 10 8000 gone.foo.com.'),
+        }
+        self.assertEqual(sync._current_records(), current)
+        self.assertEqual(sync._current_records(), current)
+        self.assertEqual(
+            sorted(resolver.call_args_list),
+            [mock.call('gone.foo.com'), mock.call('other.foo.com')]
+        )
+
+    def test_checkpoint(self):
+        """Test applied state is restored from checkpoint on restart."""
+        self._appgroup('proid1.foo', 'proid1.app*', ['http'], 'foo')
+        self._endpoint('app1#0000000001:tcp:http', 'host1.foo.com:8000')
+        checkpoint = os.path.join(self.root, 'checkpoint')
+        self.ipaclient.get_dns_zone_serial.return_value = 100
+
+        sync = dns_sync.DnsSync(
+            self.ipaclient, 'test', 'foo.com', self.root, {},
+            checkpoint=checkpoint
+        )
+        sync.sync()
+        record = (_SRV, '10 10 8000 host1.foo.com.')
+
+        # Zone not changed, no DNS scan.
+        self.ipaclient.reset_mock()
+        sync = dns_sync.DnsSync(
+            self.ipaclient, 'test', 'foo.com', self.root, {},
+            checkpoint=checkpoint
+        )
+        sync.sync()
+        self.assertEqual(sync.state, {record})
+        self.ipaclient.list_dns_records.assert_not_called()
+        self.ipaclient.update_dns_records.assert_not_called()
+
+        # Zone changed, checkpointed records are not resolved again.
+        self.ipaclient.reset_mock()
+        self.ipaclient.get_dns_zone_serial.return_value = 101
+        self.ipaclient.list_dns_records.return_value = [
+            {'idnsname': [_SRV], 'srvrecord': [record[1]]},
+        ]
+        resolver = mock.Mock()
+        sync = dns_sync.DnsSync(
+            self.ipaclient, 'test', 'foo.com', self.root, {},
+            checkpoint=checkpoint
+        )
+        sync.resolver = resolver
+        sync.sync()
+        self.assertEqual(sync.state, {record})
+        self.ipaclient.list_dns_records.assert_called_once_with(
+            dns_zone='foo.com'
+        )
+        self.ipaclient.update_dns_records.assert_not_called()
+        resolver.assert_not_called()
+
+        # Checkpoint of another cell is ignored.
+        sync = dns_sync.DnsSync(
+            self.ipaclient, 'test2', 'foo.com', self.root, {},
+            checkpoint=checkpoint
+        )
+        self.assertIsNone(sync._load_checkpoint())
+
+    @mock.patch('treadmill.dirwatch.DirWatcher')
+    def test_watch_not_synced(self, watcher_cls):
+        """Test directories created after start are watched."""
+        shutil.rmtree(os.path.join(self.root, 'endpoints'))
+        sync = dns_sync.DnsSync(
+            self.ipaclient, 'test', 'foo.com', self.root, {}
+        )
+        sync.endpoint_changed = mock.Mock()
+        watch = sync._watch()
+        self.assertIs(watch, watcher_cls.return_value)
+        watch.add_dir.assert_has_calls([
+            mock.call(sync.fs_root),
+            mock.call(os.path.join(sync.fs_root, 'app-groups')),
+            mock.call(os.path.join(sync.fs_root, 'servers')),
+        ])
+
+        os.makedirs(os.path.join(self.root, 'endpoints', 'proid1'))
+        self._endpoint('foo.test#1:tcp:http', 'host1.foo.com:8000')
+        watch.add_dir.reset_mock()
+        watch.on_created(os.path.join(sync.fs_root, 'endpoints'))
+
+        watch.add_dir.assert_has_calls([
+            mock.call(os.path.join(sync.fs_root, 'endpoints')),
+            mock.call(os.path.join(sync.fs_root, 'endpoints', 'proid1')),
+        ])
+        sync.endpoint_changed.assert_called_once_with(os.path.join(
+            sync.fs_root, 'endpoints', 'proid1', 'foo.test#1:tcp:http'
+        ))
+
+    def test_cell_syncs(self):
+        """Test cells share zone scan, records partitioned by cell."""
+        self.ipaclient.list_dns_records.return_value = [
+            {'idnsname': ['_http._tcp.foo.cell1.cell'],
+             'srvrecord': ['10 10 8000 host1.foo.com.',
+                           '10 10 8000 gone.foo.com.']},
+            {'idnsname': ['_http._tcp.foo.cell2.cell'],
+             'srvrecord': ['10 10 8000 host2.foo.com.']},
+        ]
+        cells = {}
+        for cell, host in (('cell1', 'host1.foo.com'),
+                           ('cell2', 'host2.foo.com')):
+            fs_root = os.path.join(self.root, cell)
+            os.makedirs(os.path.join(fs_root, 'servers'))
+            io.open(os.path.join(fs_root, 'servers', host), 'w').close()
+            cells[cell] = ('foo.com', fs_root)
+
+        syncs = dns_sync.cell_syncs(self.ipaclient, cells)
+        resolver = mock.Mock(side_effect=socket.gaierror())
+        for sync in syncs:
+            sync.resolver = resolver
+            sync.sync()
+
+        self.ipaclient.list_dns_records.assert_called_once_with(
+            dns_zone='foo.com'
+        )
+        resolver.assert_called_once_with('gone.foo.com')
+        # No appgroups, each cell removes its own records, stale records
+        # are removed once.
+        self.assertEqual(
+            self.ipaclient.update_dns_records.call_args_list,
+            [
+                mock.call('srvrecord', add=[], delete=[
+                    ('_http._tcp.foo.cell1.cell', '10 10 8000 gone.foo.com.'),
+                    ('_http._tcp.foo.cell1.cell', '10 10 8000 host1.foo.com.'),
+                ], dns_zone='foo.com'),
+                mock.call('srvrecord', add=[], delete=[
+                    ('_http._tcp.foo.cell2.cell', '10 10 8000 host2.foo.com.'),
+                ], dns_zone='foo.com'),
+            ]
+        )
+
+    def test_benchmark(self):
+        """Test current records benchmark with synthetic zone."""
+        report = _benchmark(
+            records=1000, servers=10, other_hosts=10, resolve_delay=0
+        )
+        self.assertEqual(report['lookups'], 10)
+        self.assertEqual(report['current_records'], 750)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+"""Tests for garbage collector plugins."""
+
+import unittest
+
+import mock
+
+from treadmill_aws import garbage_collector
+from treadmill_aws import ipaclient
+
+
+def _zone(name, serial):
+    return {'idnsname': [name], 'idnssoaserial': [serial]}
+
+
+def _ptr(idnsname, hostname):
+    return {'idnsname': [idnsname], 'ptrrecord': [hostname + '.']}
+
+
+# pylint: disable=protected-access
+class AccountTest(unittest.TestCase):
+    """Tests cell account lookup."""
+
+    def setUp(self):
+        garbage_collector._account.cache_clear()
+
+    def tearDown(self):
+        garbage_collector._account.cache_clear()
+
+    @mock.patch('treadmill.context.GLOBAL')
+    @mock.patch('treadmill_aws.awscontext.GLOBAL')
+    def test_account(self, aws_ctx, ctx):
+        """Test account from cell data, alias fallback is memoized."""
+        ctx.admin.cell.return_value.get.return_value = {
+            'data': {'aws_account': 'foo-account'}
+        }
+        self.assertEqual(garbage_collector._account(), 'foo-account')
+        aws_ctx.iam.list_account_aliases.assert_not_called()
+
+        garbage_collector._account.cache_clear()
+        ctx.admin.cell.return_value.get.return_value = {'data': {}}
+        aws_ctx.iam.list_account_aliases.return_value = {
+            'AccountAliases': ['bar-alias']
+        }
+        self.assertEqual(garbage_collector._account(), 'bar-alias')
+        self.assertEqual(garbage_collector._account(), 'bar-alias')
+        aws_ctx.iam.list_account_aliases.assert_called_once_with()
+
+
+class DNSTest(unittest.TestCase):
+    """Tests DNS plugin."""
+
+    def setUp(self):
+        garbage_collector._REVERSE_ZONES.clear()
+        self.ipa_client = mock.Mock()
+
+    def test_scan_reverse_zones(self):
+        """Test reverse zones fetched in batch, unchanged zones skipped."""
+        zone1 = '1.168.192.in-addr.arpa.'
+        zone2 = '2.168.192.in-addr.arpa.'
+        self.ipa_client.list_dns_zones.return_value = [
+            _zone(zone1, '100'), _zone(zone2, '200'),
+        ]
+        self.ipa_client.batch.return_value = [
+            {'result': [_ptr('1', 'cell-1.foo.com'),
+                        _ptr('2', 'other-2.foo.com'),
+                        {'idnsname': ['@']}]},
+            {'result': [_ptr('1', 'cell-3.foo.com')]},
+        ]
+
+        self.assertEqual(
+            garbage_collector._scan_reverse_zones(
+                self.ipa_client, 'cell-', 'foo.com'
+            ),
+            {
+                'cell-1.foo.com': ('1', zone1, 'cell-1.foo.com.'),
+                'cell-3.foo.com': ('1', zone2, 'cell-3.foo.com.'),
+            }
+        )
+        self.ipa_client.batch.assert_called_once_with([
+            ('dnsrecord_find', [zone1], {'sizelimit': 0}),
+            ('dnsrecord_find', [zone2], {'sizelimit': 0}),
+        ])
+
+        # Zone 2 changed and failed to list, zone 1 removed.
+        self.ipa_client.batch.reset_mock()
+        self.ipa_client.list_dns_zones.return_value = [
+            _zone(zone2, '201'), _zone('3.168.192.in-addr.arpa.', '300')
+        ]
+        self.ipa_client.batch.return_value = [
+            ipaclient.ExecutionError('failed'),
+            {'result': []},
+        ]
+        self.assertEqual(
+            garbage_collector._scan_reverse_zones(
+                self.ipa_client, 'cell-', 'foo.com'
+            ),
+            {}
+        )
+
+        # Only zone 2 is fetched again.
+        self.ipa_client.batch.reset_mock()
+        self.ipa_client.batch.return_value = [
+            {'result': [_ptr('1', 'cell-3.foo.com')]},
+        ]
+        self.assertEqual(
+            garbage_collector._scan_reverse_zones(
+                self.ipa_client, 'cell-', 'foo.com'
+            ),
+            {'cell-3.foo.com': ('1', zone2, 'cell-3.foo.com.')}
+        )
+        self.ipa_client.batch.assert_called_once_with([
+            ('dnsrecord_find', [zone2], {'sizelimit': 0}),
+        ])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+"""Tests for garbage collector engine."""
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+import mock
+
+from treadmill_aws import gc_engine
+
+
+def _page(*hostnames):
+    return {
+        'Reservations': [
+            {'Instances': [{'Tags': [{'Key': 'Name', 'Value': hostname}]}]}
+            for hostname in hostnames
+        ]
+    }
+
+
+class GarbageCollectorTest(unittest.TestCase):
+    """Tests garbage collector engine."""
+
+    def setUp(self):
+        self.ec2_conn = mock.Mock()
+        self.ec2_conn.get_paginator.return_value.paginate.return_value = [
+            _page('host1.foo.com', 'host2.foo.com'),
+            _page('host3.foo.com'),
+            {'Reservations': []},
+        ]
+
+    def test_ec2_hostnames(self):
+        """Test all pages are read."""
+        self.assertEqual(
+            gc_engine.ec2_hostnames(self.ec2_conn),
+            {'host1.foo.com', 'host2.foo.com', 'host3.foo.com'}
+        )
+        self.ec2_conn.get_paginator.assert_called_once_with(
+            'describe_instances'
+        )
+
+    @mock.patch('time.sleep', mock.Mock())
+    def test_cycle(self):
+        """Test single ec2 snapshot, stale servers deleted."""
+        ldap = mock.Mock()
+        ldap.list.return_value = {'host1.foo.com', 'host4.foo.com'}
+        dns = mock.Mock()
+        dns.list.return_value = {
+            'host2.foo.com': None,
+            'host5.foo.com': ('5', '0.168.192.in-addr.arpa.', 'host5.'),
+            'host6.foo.com': None,
+        }
+        dns_threads = set()
+
+        def _dns_delete(server, data=None):
+            del data
+            dns_threads.add(threading.get_ident())
+            if server == 'host6.foo.com':
+                raise Exception('DNS down')
+
+        dns.delete.side_effect = _dns_delete
+        ipa = mock.Mock()
+        ipa.list.side_effect = Exception('IPA down')
+
+        engine = gc_engine.GarbageCollector(
+            {'ldap': ldap, 'dns': dns, 'ipa': ipa}, self.ec2_conn,
+            rates={'dns': 1000}
+        )
+        report = engine.cycle(60)
+
+        self.ec2_conn.get_paginator.assert_called_once_with(
+            'describe_instances'
+        )
+        ldap.delete.assert_called_once_with('host4.foo.com')
+        dns.delete.assert_has_calls([
+            mock.call('host5.foo.com', ('5', '0.168.192.in-addr.arpa.',
+                                        'host5.')),
+            mock.call('host6.foo.com'),
+        ], any_order=True)
+        ipa.delete.assert_not_called()
+        # Plugin deletes are not concurrent.
+        self.assertEqual(len(dns_threads), 1)
+
+        self.assertEqual(report['instances'], 3)
+        self.assertEqual(
+            {
+                name: (plugin['listed'], plugin['stale'], plugin['deleted'],
+                       plugin['failed'], plugin['list_failed'])
+                for name, plugin in report['plugins'].items()
+            },
+            {
+                'ldap': (2, 1, 1, 0, False),
+                'dns': (3, 2, 1, 1, False),
+                'ipa': (0, 0, 0, 0, True),
+            }
+        )
+
+    @mock.patch('time.time')
+    def test_generational(self, time_mock):
+        """Test orphans deleted after observations, only orphans verified."""
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        state_file = os.path.join(root, 'gc.json')
+
+        ldap = mock.Mock()
+        ldap.list.return_value = {
+            'host1.foo.com', 'host4.foo.com', 'host5.foo.com'
+        }
+        paginate = self.ec2_conn.get_paginator.return_value.paginate
+
+        def _engine():
+            return gc_engine.GenerationalCollector(
+                {'ldap': ldap}, self.ec2_conn, state_file=state_file,
+                observations=3, min_age=600, full_interval=3600
+            )
+
+        time_mock.return_value = 1000
+        report = _engine().cycle()
+        self.assertTrue(report['full'])
+        self.assertEqual(report['plugins']['ldap']['stale'], 2)
+        ldap.delete.assert_not_called()
+
+        # Restarted, only orphans are looked up, host5 instance is up.
+        paginate.reset_mock()
+        paginate.return_value = [_page('host5.foo.com')]
+        time_mock.return_value = 1300
+        engine = _engine()
+        report = engine.cycle()
+        self.assertFalse(report['full'])
+        paginate.assert_called_once_with(Filters=[{
+            'Name': 'tag:Name', 'Values': ['host4.foo.com', 'host5.foo.com']
+        }])
+        self.assertEqual(list(engine.candidates['ldap']), ['host4.foo.com'])
+        ldap.list.assert_called_once_with()
+
+        # Observed 3 times, but not old enough.
+        paginate.return_value = []
+        time_mock.return_value = 1500
+        engine.cycle()
+        ldap.delete.assert_not_called()
+
+        time_mock.return_value = 1600
+        report = engine.cycle()
+        ldap.delete.assert_called_once_with('host4.foo.com')
+        self.assertEqual(report['plugins']['ldap']['deleted'], 1)
+        self.assertEqual(engine.candidates, {'ldap': {}})
+
+    @mock.patch('time.monotonic', mock.Mock(return_value=100))
+    @mock.patch('time.sleep')
+    def test_rate_limiter(self, sleep_mock):
+        """Test calls are spaced by the rate."""
+        limiter = gc_engine.RateLimiter(4)
+        for _ in range(3):
+            limiter.wait()
+        self.assertEqual(
+            sleep_mock.call_args_list, [mock.call(0.25), mock.call(0.5)]
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+"""Tests treadmill_aws modules do no network I/O at import time."""
+
+import os
+import subprocess
+import sys
+import unittest
+
+import treadmill_aws
+
+
+# Imports all modules in a fresh interpreter with sockets and AWS API calls
+# disabled, prints "io <module>" for modules attempting I/O on import and
+# "ok <module>" for modules imported.
+_AUDIT = '''
+import importlib
+import socket
+import sys
+
+import botocore.client
+
+attempts = []
+
+
+def _deny(*args, **kwargs):
+    attempts.append(args)
+    raise OSError('Network I/O at import time')
+
+
+socket.socket.connect = _deny
+socket.socket.connect_ex = _deny
+socket.create_connection = _deny
+socket.getaddrinfo = _deny
+botocore.client.BaseClient._make_api_call = _deny
+
+for name in sys.argv[1:]:
+    try:
+        importlib.import_module(name)
+        print('ok', name)
+    except Exception:  # pylint: disable=broad-except
+        # Missing optional dependencies are not the concern here.
+        pass
+    if attempts:
+        print('io', name)
+        del attempts[:]
+'''
+
+
+def _modules():
+    """Return names of all treadmill_aws modules."""
+    root = os.path.dirname(treadmill_aws.__path__[0])
+    names = []
+    for dirpath, _dirs, filenames in os.walk(treadmill_aws.__path__[0]):
+        package = os.path.relpath(dirpath, root).replace(os.sep, '.')
+        for filename in sorted(filenames):
+            if not filename.endswith('.py'):
+                continue
+            if filename == '__init__.py':
+                names.append(package)
+            else:
+                names.append(package + '.' + filename[:-3])
+    return sorted(names)
+
+
+class ImportIOTest(unittest.TestCase):
+    """Tests modules can be imported without network access."""
+
+    def test_no_import_io(self):
+        """Test no module does network I/O at import time."""
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join(sys.path)
+        output = subprocess.check_output(
+            [sys.executable, '-c', _AUDIT] + _modules(),
+            env=env,
+            universal_newlines=True
+        )
+        results = [line.split() for line in output.splitlines()]
+        self.assertEqual(
+            [name for result, name in results if result == 'io'], []
+        )
+
+        imported = [name for result, name in results if result == 'ok']
+        if 'treadmill_aws.garbage_collector' not in imported:
+            self.skipTest('treadmill_aws.garbage_collector can not be '
+                          'imported, dependencies missing.')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,6 @@
 """ Test ipaclient functions
 """
+import threading
 import unittest
 
 import mock
@@ -303,6 +304,62 @@ class IPAClientTest(unittest.TestCase):
                          'version': '2.28'}]}
         )
 
+    def test_update_dns_records(self):
+        """ Test that record changes are sent in batch, errors returned """
+        self.test_client._post = mock.MagicMock(return_value={
+            'count': 3,
+            'results': [
+                {'error': None, 'result': {}},
+                {'error': 'no modifications to be performed',
+                 'error_code': 4202, 'error_name': 'EmptyModlist'},
+                {'error': 'Insufficient access',
+                 'error_code': 2100, 'error_name': 'ACIError'},
+            ]
+        })
+        errors = self.test_client.update_dns_records(
+            'srvrecord',
+            add=[('_http._tcp.a', '10 10 80 h1.'),
+                 ('_http._tcp.b', '10 10 80 h2.')],
+            delete=[('_http._tcp.c', '10 10 80 h3.')]
+        )
+        self.assertEqual(list(errors), [('_http._tcp.b', '10 10 80 h2.')])
+        self.assertIsInstance(
+            errors[('_http._tcp.b', '10 10 80 h2.')],
+            ipaclient.AuthorizationError
+        )
+        self.assertEqual(errors[('_http._tcp.b', '10 10 80 h2.')].code, 2100)
+        self.test_client._post.assert_called_once_with(
+            mock.ANY,
+            {'id': 0,
+             'method': 'batch',
+             'params': [
+                 [{'method': 'dnsrecord_del',
+                   'params': [['foo.com', '_http._tcp.c'],
+                              {'srvrecord': '10 10 80 h3.'}]},
+                  {'method': 'dnsrecord_add',
+                   'params': [['foo.com', '_http._tcp.a'],
+                              {'srvrecord': '10 10 80 h1.',
+                               'dnsttl': 5}]},
+                  {'method': 'dnsrecord_add',
+                   'params': [['foo.com', '_http._tcp.b'],
+                              {'srvrecord': '10 10 80 h2.',
+                               'dnsttl': 5}]}],
+                 {'version': '2.28'}]}
+        )
+
+    @mock.patch('requests_kerberos.HTTPKerberosAuth', mock.Mock())
+    def test_session_per_thread(self):
+        """Test each thread uses own HTTP session."""
+        sessions = []
+        thread = threading.Thread(
+            target=lambda: sessions.append(self.test_client._session())
+        )
+        thread.start()
+        thread.join()
+
+        self.assertIs(self.test_client._session(), self.test_client._session())
+        self.assertIsNot(self.test_client._session(), sessions[0])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,55 @@
+"""Tests for ipakeytab keytab cache."""
+
+import unittest
+
+import mock
+
+from treadmill_aws import ipakeytab
+
+
+# pylint: disable=protected-access
+class KeytabCacheTest(unittest.TestCase):
+    """Tests keytab cache."""
+
+    @mock.patch('time.time')
+    def test_get(self, time_mock):
+        """Test keytab regenerated on kvno change or expiry only."""
+        kvnos = {'foo/host@REALM': 1}
+        generate = mock.Mock(side_effect=['kt1', 'kt2', 'kt3'])
+        cache = ipakeytab.KeytabCache(ttl=600, kvno_interval=30,
+                                      kvno=kvnos.get)
+
+        time_mock.return_value = 0
+        self.assertEqual(cache.get('foo/host@REALM', generate), 'kt1')
+        time_mock.return_value = 10
+        self.assertEqual(cache.get('foo/host@REALM', generate), 'kt1')
+
+        # Key changed, not noticed until kvno check is due.
+        kvnos['foo/host@REALM'] = 2
+        time_mock.return_value = 20
+        self.assertEqual(cache.get('foo/host@REALM', generate), 'kt1')
+        time_mock.return_value = 40
+        self.assertEqual(cache.get('foo/host@REALM', generate), 'kt2')
+
+        time_mock.return_value = 700
+        self.assertEqual(cache.get('foo/host@REALM', generate), 'kt3')
+        self.assertEqual(generate.call_count, 3)
+
+    @mock.patch('time.time')
+    def test_sweep(self, time_mock):
+        """Test expired keytabs and unused locks are dropped."""
+        cache = ipakeytab.KeytabCache(ttl=600, kvno=lambda _principal: 1)
+
+        time_mock.return_value = 0
+        cache.get('foo/host@REALM', lambda _principal: 'kt1')
+        time_mock.return_value = 300
+        cache.get('bar/host@REALM', lambda _principal: 'kt2')
+        self.assertEqual(cache._locks, {})
+
+        time_mock.return_value = 700
+        cache.sweep()
+        self.assertEqual(list(cache._entries), ['bar/host@REALM'])
+
+
+if __name__ == '__main__':
+    unittest.main()
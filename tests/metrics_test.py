@@ -0,0 +1,116 @@
+"""Tests for metrics."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from treadmill_aws import metrics
+
+
+class MetricsTest(unittest.TestCase):
+    """Tests metrics registry."""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        if self.root and os.path.isdir(self.root):
+            shutil.rmtree(self.root)
+
+    def test_observe(self):
+        """Test recording observations into histogram buckets."""
+        registry = metrics.Registry()
+        registry.observe('foo_seconds', 0.003, phase='a')
+        registry.observe('foo_seconds', 0.2, phase='a')
+        registry.observe('foo_seconds', 1000, phase='a')
+        registry.observe('foo_seconds', 0.2, phase='b', subnet=None)
+
+        snapshot = registry.snapshot()
+        counts, count, total = snapshot['histograms']['foo_seconds'][
+            (('phase', 'a'),)
+        ]
+        self.assertEqual(count, 3)
+        self.assertAlmostEqual(total, 1000.203)
+        self.assertEqual(counts[0], 1)
+        self.assertEqual(sum(counts), 2)
+        self.assertIn(
+            (('phase', 'b'),), snapshot['histograms']['foo_seconds']
+        )
+
+    def test_timer(self):
+        """Test timer with labels updated inside the block."""
+        registry = metrics.Registry()
+        with registry.timer('foo_seconds', subnet=None) as labels:
+            labels['subnet'] = 'subnet-1'
+
+        snapshot = registry.snapshot()
+        self.assertEqual(
+            list(snapshot['histograms']['foo_seconds']),
+            [(('subnet', 'subnet-1'),)]
+        )
+
+    def test_merge(self):
+        """Test merging snapshot from another registry."""
+        registry = metrics.Registry()
+        registry.observe('foo_seconds', 1.0, phase='a')
+
+        other = metrics.Registry()
+        other.observe('foo_seconds', 2.0, phase='a')
+        other.observe('bar_seconds', 2.0)
+        other.inc('foo_total', status='ok')
+
+        registry.merge(other.snapshot())
+        registry.merge(other.snapshot())
+        snapshot = registry.snapshot()
+        self.assertEqual(
+            snapshot['histograms']['foo_seconds'][(('phase', 'a'),)][1], 3
+        )
+        self.assertEqual(snapshot['histograms']['bar_seconds'][()][1], 2)
+        self.assertEqual(
+            snapshot['counters']['foo_total'][(('status', 'ok'),)], 2
+        )
+
+    def test_to_prometheus(self):
+        """Test rendering in Prometheus text format."""
+        registry = metrics.Registry()
+        registry.describe('foo_seconds', 'Foo latency.')
+        registry.observe('foo_seconds', 0.5, phase='a"b')
+
+        text = registry.to_prometheus()
+        self.assertIn('# HELP foo_seconds Foo latency.\n', text)
+        self.assertIn('# TYPE foo_seconds histogram\n', text)
+        self.assertIn('foo_seconds_bucket{phase="a\\"b",le="0.5"} 1\n', text)
+        self.assertIn('foo_seconds_bucket{phase="a\\"b",le="0.25"} 0\n', text)
+        self.assertIn('foo_seconds_bucket{phase="a\\"b",le="+Inf"} 1\n', text)
+        self.assertIn('foo_seconds_count{phase="a\\"b"} 1\n', text)
+
+    def test_counters(self):
+        """Test counters rendering."""
+        registry = metrics.Registry()
+        registry.inc('foo_total', func='a')
+        registry.inc('foo_total', 2, func='a')
+
+        text = registry.to_prometheus()
+        self.assertIn('# TYPE foo_total counter\n', text)
+        self.assertIn('foo_total{func="a"} 3\n', text)
+        self.assertEqual(
+            registry.to_dict()['counters'],
+            {'foo_total': [{'labels': {'func': 'a'}, 'value': 3}]}
+        )
+
+    def test_write_textfile(self):
+        """Test writing metrics to file."""
+        registry = metrics.Registry()
+        registry.observe('foo_seconds', 0.5)
+
+        path = os.path.join(self.root, 'autoscale.prom')
+        registry.write_textfile(path)
+
+        with open(path) as f:
+            self.assertEqual(f.read(), registry.to_prometheus())
+        self.assertEqual(os.listdir(self.root), ['autoscale.prom'])
+
+
+if __name__ == '__main__':
+    unittest.main()
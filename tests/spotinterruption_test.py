@@ -0,0 +1,147 @@
+"""Tests for spot interruption notices."""
+
+import unittest
+
+import mock
+import requests
+
+from treadmill_aws import metrics
+from treadmill_aws import spotinterruption
+
+
+# pylint: disable=protected-access
+class SpotInterruptionTest(unittest.TestCase):
+    """Tests spot interruption notices and rate tracking."""
+
+    def setUp(self):
+        spotinterruption._TOKEN.update(token=None, expires=0)
+
+    @mock.patch('requests.put')
+    @mock.patch('requests.get')
+    def test_get_instance_action(self, get_mock, put_mock):
+        """Test reading interruption notice from instance metadata."""
+        put_mock.return_value = mock.Mock(text='token1')
+        get_mock.return_value = mock.Mock(status_code=404)
+        self.assertIsNone(spotinterruption.get_instance_action())
+        get_mock.assert_called_once_with(
+            spotinterruption._INSTANCE_ACTION_URL,
+            headers={'X-aws-ec2-metadata-token': 'token1'},
+            timeout=mock.ANY
+        )
+
+        get_mock.return_value = mock.Mock(status_code=200)
+        get_mock.return_value.json.return_value = {
+            'action': 'terminate', 'time': '2018-01-01T00:02:00Z'
+        }
+        self.assertEqual(
+            spotinterruption.get_instance_action(),
+            {'action': 'terminate', 'time': '2018-01-01T00:02:00Z'}
+        )
+        # Token is reused.
+        put_mock.assert_called_once_with(
+            spotinterruption._TOKEN_URL, headers=mock.ANY, timeout=mock.ANY
+        )
+
+    @mock.patch('requests.put')
+    @mock.patch('requests.get')
+    def test_get_instance_action_token(self, get_mock, put_mock):
+        """Test token renewed on 401, IMDSv1 used if no token."""
+        put_mock.side_effect = [mock.Mock(text='token1'),
+                                mock.Mock(text='token2')]
+        get_mock.side_effect = [mock.Mock(status_code=401),
+                                mock.Mock(status_code=404)]
+        self.assertIsNone(spotinterruption.get_instance_action())
+        self.assertEqual(
+            get_mock.call_args[1]['headers'],
+            {'X-aws-ec2-metadata-token': 'token2'}
+        )
+
+        spotinterruption._TOKEN.update(token=None, expires=0)
+        put_mock.side_effect = requests.ConnectionError('no IMDSv2')
+        get_mock.side_effect = None
+        get_mock.return_value = mock.Mock(status_code=404)
+        self.assertIsNone(spotinterruption.get_instance_action())
+        self.assertEqual(get_mock.call_args[1]['headers'], {})
+
+    @mock.patch('requests.put', mock.Mock(return_value=mock.Mock(text='t')))
+    @mock.patch('requests.get')
+    def test_get_instance_placement(self, get_mock):
+        """Test reading instance type and subnet from instance metadata."""
+        values = {
+            'mac': '0e:00:00:00:00:01\n',
+            'instance-type': 'm5.large',
+            'network/interfaces/macs/0e:00:00:00:00:01/subnet-id': 'subnet-1',
+        }
+
+        def _get(url, **_kwargs):
+            return mock.Mock(
+                status_code=200,
+                text=values[url[len(spotinterruption._METADATA_URL):]]
+            )
+
+        get_mock.side_effect = _get
+        self.assertEqual(
+            spotinterruption.get_instance_placement(),
+            {'instance_type': 'm5.large', 'subnet': 'subnet-1'}
+        )
+
+    @mock.patch('treadmill.zkutils.put')
+    @mock.patch('time.time', mock.Mock(return_value=1000.0))
+    def test_publish(self, put_mock):
+        """Test publishing notice blacks out the server."""
+        zkclient = mock.Mock()
+        spotinterruption.publish(zkclient, 'host1', {'action': 'terminate'})
+
+        put_mock.assert_has_calls([
+            mock.call(zkclient, '/spot-interruptions/host1',
+                      {'action': 'terminate'}),
+            mock.call(zkclient, '/blackedout.servers/host1',
+                      {'since': 1000, 'reason': 'spot interruption'}),
+        ])
+
+    @mock.patch('time.time', mock.Mock(return_value=1000.0))
+    def test_rate_tracker(self):
+        """Test interruption rates are tracked once per server."""
+        tracker = spotinterruption.InterruptionRateTracker(
+            registry=metrics.Registry()
+        )
+        for _ in range(4):
+            tracker.record_launch('m5.large', 'subnet-a')
+
+        self.assertTrue(
+            tracker.record_interruption('host1', 'm5.large', 'subnet-a')
+        )
+        self.assertFalse(
+            tracker.record_interruption('host1', 'm5.large', 'subnet-a')
+        )
+        tracker.record_interruption('host2', 'm5.xlarge', 'subnet-b')
+
+        self.assertEqual(tracker.rate('m5.large', 'subnet-a'), 0.25)
+        self.assertEqual(tracker.rate('m5.large', 'subnet-b'), 0.0)
+        self.assertEqual(
+            tracker.rates(),
+            {('m5.large', 'subnet-a'): 0.25, ('m5.xlarge', 'subnet-b'): 1.0}
+        )
+
+        tracker.prune(['host2'])
+        self.assertTrue(
+            tracker.record_interruption('host1', 'm5.large', 'subnet-a')
+        )
+
+    def test_rate_decay(self):
+        """Test counts decay over time."""
+        with mock.patch('time.time', mock.Mock(return_value=1000.0)):
+            tracker = spotinterruption.InterruptionRateTracker(
+                half_life=100, registry=metrics.Registry()
+            )
+            for _ in range(4):
+                tracker.record_launch('m5.large', 'subnet-a')
+
+        # Launches halved, 1 interruption out of 2 launches.
+        with mock.patch('time.time', mock.Mock(return_value=1100.0)):
+            tracker.record_interruption('host1', 'm5.large', 'subnet-a')
+        self.assertEqual(tracker.rate('m5.large', 'subnet-a'), 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+"""Tests for spot instance ranking."""
+
+import unittest
+
+import mock
+
+from treadmill_aws import autoscale
+from treadmill_aws import spotranking
+
+
+def _ec2_conn():
+    """Return EC2 client mock with two subnets/zones."""
+    ec2_conn = mock.Mock()
+    ec2_conn.meta.region_name = 'us-east-1'
+    ec2_conn.describe_subnets.return_value = {'Subnets': [
+        {'SubnetId': 'subnet-a', 'AvailabilityZone': 'us-east-1a',
+         'AvailabilityZoneId': 'use1-az1'},
+        {'SubnetId': 'subnet-b', 'AvailabilityZone': 'us-east-1b',
+         'AvailabilityZoneId': 'use1-az2'},
+    ]}
+    ec2_conn.describe_spot_price_history.return_value = {'SpotPriceHistory': [
+        {'InstanceType': 'm5.large', 'AvailabilityZone': 'us-east-1a',
+         'SpotPrice': '0.04'},
+        {'InstanceType': 'm5.large', 'AvailabilityZone': 'us-east-1b',
+         'SpotPrice': '0.03'},
+        {'InstanceType': 'c5.large', 'AvailabilityZone': 'us-east-1a',
+         'SpotPrice': '0.05'},
+        {'InstanceType': 'c5.large', 'AvailabilityZone': 'us-east-1b',
+         'SpotPrice': '0.05'},
+    ]}
+    scores = {
+        'm5.large': {'use1-az1': 2, 'use1-az2': 9},
+        'c5.large': {'use1-az1': 9, 'use1-az2': 9},
+    }
+    # Single score per zone for all requested types.
+    ec2_conn.get_spot_placement_scores.side_effect = (
+        lambda InstanceTypes, **_kwargs: {'SpotPlacementScores': [
+            {'AvailabilityZoneId': zone_id,
+             'Score': min(scores[itype][zone_id] for itype in InstanceTypes)}
+            for zone_id in ('use1-az1', 'use1-az2')
+        ]}
+    )
+    return ec2_conn
+
+
+class InstanceRankerTest(unittest.TestCase):
+    """Tests instance type/subnet ranking."""
+
+    def setUp(self):
+        spotranking.clear_cache()
+
+    def test_rank(self):
+        """Test ranking by placement score, then price."""
+        ec2_conn = _ec2_conn()
+        tracker = autoscale.InstanceFeasibilityTracker()
+        ranker = spotranking.InstanceRanker(
+            ec2_conn, tracker,
+            [('c5.large', True), ('m5.large', True), ('m5.large', False)],
+            ['subnet-a', 'subnet-b']
+        )
+
+        # Both spot types score 9 at best, m5.large is cheaper.
+        self.assertEqual(
+            ranker.rank_instance_types(),
+            [('m5.large', True), ('c5.large', True), ('m5.large', False)]
+        )
+        self.assertEqual(
+            ranker.rank_subnets('m5.large', True, ['subnet-a', 'subnet-b']),
+            ['subnet-b', 'subnet-a']
+        )
+        # On-demand subnets keep (shuffled) order.
+        self.assertEqual(
+            ranker.rank_subnets('m5.large', False, ['subnet-b', 'subnet-a']),
+            ['subnet-b', 'subnet-a']
+        )
+
+        # Failed launches go last.
+        tracker.exclude_instance('m5.large', True, 'subnet-b')
+        self.assertEqual(
+            ranker.rank_instance_types(),
+            [('c5.large', True), ('m5.large', True), ('m5.large', False)]
+        )
+
+        # Interruption rate discounts placement score.
+        ranker = spotranking.InstanceRanker(
+            ec2_conn, autoscale.InstanceFeasibilityTracker(),
+            [('c5.large', True), ('m5.large', True)],
+            ['subnet-a', 'subnet-b'],
+            interruption_rates={('c5.large', 'subnet-b'): 0.9},
+        )
+        self.assertEqual(
+            ranker.rank_subnets('c5.large', True, ['subnet-b', 'subnet-a']),
+            ['subnet-a', 'subnet-b']
+        )
+
+        # Data is cached.
+        self.assertEqual(ec2_conn.describe_subnets.call_count, 1)
+        self.assertEqual(ec2_conn.describe_spot_price_history.call_count, 1)
+        ec2_conn.get_spot_placement_scores.assert_called_once_with(
+            InstanceTypes=['c5.large', 'm5.large'],
+            TargetCapacity=1,
+            SingleAvailabilityZone=True,
+            RegionNames=['us-east-1'],
+        )
+
+    @mock.patch('time.time', mock.Mock(return_value=1000))
+    def test_rank_no_data(self):
+        """Test configured order is kept if ranking data is not available."""
+        ec2_conn = _ec2_conn()
+        ec2_conn.get_spot_placement_scores.side_effect = Exception('denied')
+        ec2_conn.describe_spot_price_history.side_effect = Exception('denied')
+        ranker = spotranking.InstanceRanker(
+            ec2_conn, autoscale.InstanceFeasibilityTracker(),
+            [('c5.large', True), ('m5.large', True), ('m5.large', False)],
+            ['subnet-a', 'subnet-b']
+        )
+
+        self.assertEqual(
+            ranker.rank_instance_types(),
+            [('c5.large', True), ('m5.large', True), ('m5.large', False)]
+        )
+        self.assertEqual(
+            ranker.rank_subnets('m5.large', True, ['subnet-b', 'subnet-a']),
+            ['subnet-b', 'subnet-a']
+        )
+        ranker.rank_instance_types()
+        self.assertEqual(ec2_conn.get_spot_placement_scores.call_count, 1)
+
+        # Failures are retried after short time.
+        ec2_conn.get_spot_placement_scores.side_effect = None
+        ec2_conn.get_spot_placement_scores.return_value = {
+            'SpotPlacementScores': []
+        }
+        with mock.patch('time.time', mock.Mock(return_value=1031)):
+            ranker.rank_instance_types()
+        self.assertEqual(ec2_conn.get_spot_placement_scores.call_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,10 +6,30 @@ import unittest
 
 import mock
 
+from twisted.internet import defer
+
 import treadmill
 from treadmill_aws.sproc import krb5keytabproxy
 
 
+_SUCCESS = {
+    'status': 'success',
+    'result': {
+        'keytab_entries': base64.encodebytes(b'abc').decode()
+    }
+}
+
+
+def _srv(expiration, *records):
+    """Return mock SRV query answer."""
+    answer = mock.MagicMock()
+    answer.expiration = expiration
+    answer.__iter__.return_value = [
+        mock.Mock(**{'to_text.return_value': record}) for record in records
+    ]
+    return answer
+
+
 # pylint: disable=protected-access
 
 class Krb5keytabProxyTest(unittest.TestCase):
@@ -29,12 +49,17 @@ class Krb5keytabProxyTest(unittest.TestCase):
                     }
                 }).encode('utf8')))
     @mock.patch('treadmill.fs.write_safe', mock.Mock())
+    @mock.patch('twisted.internet.threads.deferToThread',
+                mock.Mock(side_effect=defer.maybeDeferred))
     def test_request_keytab(self):
         """Tests client request."""
         proxy = krb5keytabproxy.Krb5KeytabProxy(
             'my-hostname.my-domain',
-            'my-ipa.domain',
-            ['kt-srv1:1234', 'kt-srv2:1234'],
+            krb5keytabproxy.KeytabClient(
+                'my-ipa.domain',
+                ['kt-srv1:1234', 'kt-srv2:1234'],
+                cache_ttl=0
+            ),
             '/key/tab/dir'
         )
         proxy.uid = 1
@@ -65,8 +90,7 @@ class Krb5keytabProxyTest(unittest.TestCase):
         """Tests writing keytab."""
         proxy = krb5keytabproxy.Krb5KeytabProxy(
             'my-hostname.my-domain',
-            'my-ipa.domain',
-            ['kt-srv1:1234', 'kt-srv2:1234'],
+            mock.Mock(),
             '/key/tab/dir'
         )
         proxy.uid = 1
@@ -84,3 +108,73 @@ class Krb5keytabProxyTest(unittest.TestCase):
             mock.ANY,
             owner=(1, 2)
         )
+
+    @mock.patch('time.time', mock.Mock(return_value=100))
+    @mock.patch('treadmill_aws.sproc.krb5keytabproxy._request_keytab',
+                mock.Mock(return_value=_SUCCESS))
+    @mock.patch('twisted.internet.threads.deferToThread')
+    def test_coalesce(self, defer_to_thread):
+        """Tests concurrent requests share single fetch, then cached."""
+        upstream = defer.Deferred()
+        defer_to_thread.return_value = upstream
+        client = krb5keytabproxy.KeytabClient(
+            'my-ipa.domain', ['kt-srv1:1234'], cache_ttl=60
+        )
+
+        results = []
+        client.get('xxx/host').addCallback(results.append)
+        client.get('xxx/host').addCallback(results.append)
+        defer_to_thread.assert_called_once_with(client._fetch, 'xxx/host')
+        self.assertEqual(results, [])
+
+        upstream.callback(_SUCCESS)
+        self.assertEqual(results, [_SUCCESS, _SUCCESS])
+
+        client.get('xxx/host').addCallback(results.append)
+        self.assertEqual(len(results), 3)
+        self.assertEqual(defer_to_thread.call_count, 1)
+
+        # Failures are not cached.
+        defer_to_thread.return_value = defer.fail(ConnectionError('down'))
+        errors = []
+        client.get('yyy/host').addErrback(errors.append)
+        self.assertEqual(len(errors), 1)
+        self.assertNotIn('yyy/host', client._cache)
+        self.assertEqual(client._inflight, {})
+
+    @mock.patch('treadmill_aws.sproc.krb5keytabproxy._request_keytab')
+    def test_fetch_retry(self, request_keytab):
+        """Tests retryable failure is tried on the next server."""
+        retry = {'status': 'failure', 'result': {'retry': True}}
+        client = krb5keytabproxy.KeytabClient(
+            'my-ipa.domain', krb5keytab_servers=['kt1:1234', 'kt2:1234']
+        )
+
+        request_keytab.side_effect = [retry, _SUCCESS]
+        self.assertEqual(client._fetch('xxx/host'), _SUCCESS)
+        request_keytab.assert_called_with('kt2', 1234, 'xxx/host')
+
+        request_keytab.side_effect = [retry, ConnectionError('down')]
+        self.assertEqual(client._fetch('xxx/host'), retry)
+
+        request_keytab.side_effect = [ConnectionError('down')] * 2
+        with self.assertRaises(ConnectionError):
+            client._fetch('xxx/host')
+
+    @mock.patch('time.time')
+    @mock.patch('dns.resolver.query')
+    def test_endpoints(self, query, time_mock):
+        """Tests SRV records are cached for their TTL."""
+        query.return_value = _srv(160, '0 0 1234 kt-srv1.')
+        client = krb5keytabproxy.KeytabClient('my-ipa.domain')
+
+        time_mock.return_value = 100
+        self.assertEqual(client.endpoints(), ['kt-srv1.:1234'])
+        time_mock.return_value = 150
+        self.assertEqual(client.endpoints(), ['kt-srv1.:1234'])
+        query.assert_called_once_with('_ipakeytab._tcp.my-ipa.domain', 'SRV')
+
+        query.return_value = _srv(260, '0 0 1234 kt-srv2.')
+        time_mock.return_value = 200
+        self.assertEqual(client.endpoints(), ['kt-srv2.:1234'])
+        self.assertEqual(query.call_count, 2)
@@ -0,0 +1,118 @@
+"""Tests for tracing."""
+
+import json
+import unittest
+
+import mock
+
+from treadmill_aws import metrics
+from treadmill_aws import tracing
+
+
+class TracingTest(unittest.TestCase):
+    """Tests tracing decorator and spans."""
+
+    def setUp(self):
+        self.tracer = tracing.Tracer(metrics.Registry())
+        self.patcher = mock.patch('treadmill_aws.tracing.GLOBAL', self.tracer)
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+
+    def test_disabled(self):
+        """Test nothing is recorded when tracing is disabled."""
+
+        @tracing.trace
+        def _foo(arg):
+            return arg + 1
+
+        self.assertEqual(_foo(1), 2)
+        self.assertEqual(
+            self.tracer.registry.snapshot(),
+            {'histograms': {}, 'counters': {}}
+        )
+        self.assertEqual(self.tracer.traces(), [])
+
+    def test_nested_spans(self):
+        """Test nested spans are recorded as a tree."""
+
+        @tracing.trace(name='bar')
+        def _bar():
+            with tracing.span('baz'):
+                pass
+
+        @tracing.trace(name='foo')
+        def _foo():
+            _bar()
+            _bar()
+
+        self.tracer.enable()
+        _foo()
+
+        traces = self.tracer.traces()
+        self.assertEqual(len(traces), 1)
+        root = traces[0].to_dict()
+        self.assertEqual(root['name'], 'foo')
+        self.assertEqual([span['name'] for span in root['children']],
+                         ['bar', 'bar'])
+        self.assertEqual(root['children'][0]['children'][0]['name'], 'baz')
+
+        counters = self.tracer.registry.snapshot()['counters']
+        self.assertEqual(
+            counters[tracing.CALLS_TOTAL],
+            {(('func', 'foo'),): 1, (('func', 'bar'),): 2,
+             (('func', 'baz'),): 2}
+        )
+
+        dump = json.loads(self.tracer.dump_json())
+        self.assertEqual(dump['traces'][0]['name'], 'foo')
+
+    def test_errors(self):
+        """Test errors are counted and propagated."""
+
+        @tracing.trace(name='foo')
+        def _foo():
+            raise ValueError('foo')
+
+        self.tracer.enable()
+        with self.assertRaises(ValueError):
+            _foo()
+
+        counters = self.tracer.registry.snapshot()['counters']
+        self.assertEqual(
+            counters[tracing.CALL_ERRORS_TOTAL], {(('func', 'foo'),): 1}
+        )
+        self.assertEqual(self.tracer.traces()[0].error, 'ValueError')
+
+    def test_sampling(self):
+        """Test calls are counted and timed, but not traced if not sampled.
+        """
+
+        @tracing.trace(name='foo')
+        def _foo():
+            with tracing.span('bar'):
+                raise ValueError('bar')
+
+        self.tracer.enable(sample_rate=0)
+        with self.assertRaises(ValueError):
+            _foo()
+
+        snapshot = self.tracer.registry.snapshot()
+        self.assertEqual(
+            snapshot['counters'][tracing.CALLS_TOTAL],
+            {(('func', 'foo'),): 1, (('func', 'bar'),): 1}
+        )
+        self.assertEqual(
+            snapshot['counters'][tracing.CALL_ERRORS_TOTAL],
+            {(('func', 'foo'),): 1, (('func', 'bar'),): 1}
+        )
+        self.assertEqual(
+            set(snapshot['histograms'][tracing.CALL_SECONDS]),
+            {(('func', 'foo'),), (('func', 'bar'),)}
+        )
+        self.assertEqual(self.tracer.traces(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,10 +1,51 @@
 """Tests for aws/hostmanager."""
 
+import gzip
+import os
+import random
+import shutil
+import string
+import tempfile
+import time
 import unittest
 
+import mock
+import yaml
+
 from treadmill_aws import userdata
 
 
+def _benchmark(instance_vars, count=1000, multipart=False):
+    """Compare full render with template render, return seconds per host."""
+    def _full(hostname, otp):
+        key_value_pairs = dict(instance_vars)
+        key_value_pairs['hostname'] = hostname
+        key_value_pairs['otp'] = otp
+        content = '#cloud-config\n' + yaml.dump(
+            key_value_pairs, default_flow_style=False, default_style='\''
+        )
+        if multipart:
+            cloud_init = userdata.CloudInit()
+            cloud_init.add(content)
+            content = cloud_init.userdata()
+        return content
+
+    start = time.perf_counter()
+    for idx in range(count):
+        _full('host{}.foo.com'.format(idx), 'otp{}'.format(idx))
+    full = (time.perf_counter() - start) / count
+
+    start = time.perf_counter()
+    template = userdata.UserDataTemplate(instance_vars, multipart=multipart)
+    for idx in range(count):
+        template.render(
+            hostname='host{}.foo.com'.format(idx), otp='otp{}'.format(idx)
+        )
+    templated = (time.perf_counter() - start) / count
+
+    return {'full': full, 'template': templated}
+
+
 # pylint: disable=protected-access
 class UserdataTest(unittest.TestCase):
     """Tests userdata interface"""
@@ -48,3 +89,135 @@ class UserdataTest(unittest.TestCase):
             cloud_init.content_by_mimetype['text/x-shellscript'],
             [('-', '#!/bin/sh')]
         )
+
+    def test_cloud_init_dedup(self):
+        """Test identical parts are added once."""
+        cloud_init = userdata.CloudInit('#!/bin/sh\necho 1')
+        cloud_init.add('#!/bin/sh\necho 1')
+        cloud_init.add('#!/bin/sh\necho 2')
+        cloud_init.add_cloud_config({'a': 1})
+        cloud_init.add_cloud_config({'a': 1})
+        self.assertEqual(
+            cloud_init.content_by_mimetype['text/x-shellscript'],
+            [('-', '#!/bin/sh\necho 1'), ('-', '#!/bin/sh\necho 2')]
+        )
+        self.assertEqual(
+            len(cloud_init.content_by_mimetype['text/cloud-config']), 1
+        )
+        self.assertEqual(cloud_init.duplicates, 2)
+
+    def test_cloud_init_build(self):
+        """Test building user data within size limit."""
+        rand = random.Random(1)
+
+        def _script(size):
+            # Random data, does not compress well.
+            return '#!/bin/sh\n# ' + ''.join(
+                rand.choice(string.ascii_letters) for _ in range(size)
+            )
+
+        cloud_init = userdata.CloudInit()
+        cloud_init.add('#!/bin/sh\n' + 'echo hello\n' * 1000)
+        cloud_init.add_cloud_config({'a': 1})
+
+        # Compresses well, fastest level is enough.
+        user_data, report = cloud_init.build()
+        self.assertEqual(report['compress_level'], 1)
+        self.assertEqual(report['size'], len(user_data))
+        self.assertEqual(report['offloaded'], [])
+        self.assertEqual(
+            userdata.CloudInit(gzip.decompress(user_data).decode())
+            .content_by_mimetype,
+            cloud_init.content_by_mimetype
+        )
+
+        cloud_init.add(_script(20000))
+        with self.assertRaises(userdata.UserDataTooLarge):
+            cloud_init.build()
+
+        store_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, store_dir)
+        store = userdata.DirectoryStore(store_dir, 'http://foo.com/ud/')
+
+        user_data, report = cloud_init.build(store=store)
+        self.assertLessEqual(len(user_data), userdata.MAX_USER_DATA_SIZE)
+        self.assertEqual(len(report['offloaded']), 1)
+
+        built = userdata.CloudInit(gzip.decompress(user_data).decode())
+        (_name, include), = built.content_by_mimetype['text/x-include-url']
+        url = include.splitlines()[1]
+        self.assertTrue(url.startswith('http://foo.com/ud/'))
+        with open(os.path.join(store_dir, url.split('/')[-1])) as f:
+            self.assertTrue(f.read().startswith('#!/bin/sh\n# '))
+        # Original is not modified.
+        self.assertEqual(
+            len(cloud_init.content_by_mimetype['text/x-shellscript']), 2
+        )
+
+    def test_user_data_template(self):
+        """Test user data template renders same as full yaml dump."""
+        instance_vars = {
+            'treadmill_cell': 'foo',
+            'treadmill_ldap': 'ldap://foo:1234,ldap://bar:1234',
+            'treadmill_motd': 'It\'s a ' + 'long line ' * 20,
+        }
+
+        def _full(hostname, otp):
+            key_value_pairs = dict(instance_vars)
+            key_value_pairs['hostname'] = hostname
+            key_value_pairs['otp'] = otp
+            return '#cloud-config\n' + yaml.dump(
+                key_value_pairs, default_flow_style=False, default_style='\''
+            )
+
+        template = userdata.UserDataTemplate(instance_vars)
+        for hostname, otp in [('host1.foo.com', 'a\'b$c{d}'),
+                              ('host2.foo.com', None)]:
+            self.assertEqual(
+                template.render(hostname=hostname, otp=otp),
+                _full(hostname, otp)
+            )
+
+        with self.assertRaises(ValueError):
+            template.render(hostname='host1.foo.com')
+        with self.assertRaises(ValueError):
+            template.render(hostname='host1.foo.com\nfoo: bar', otp='x')
+
+        template = userdata.UserDataTemplate(instance_vars, multipart=True)
+        content = gzip.decompress(
+            template.render(hostname='host1.foo.com', otp='xyz')
+        ).decode()
+        cloud_init = userdata.CloudInit(content)
+        self.assertEqual(
+            cloud_init.content_by_mimetype['text/cloud-config'],
+            [('-', _full('host1.foo.com', 'xyz'))]
+        )
+
+    def test_check_size(self):
+        """Test user data size limit."""
+        self.assertEqual(userdata.check_size('x' * 16384), 16384)
+        with self.assertRaises(userdata.UserDataTooLarge):
+            userdata.check_size(b'x' * 16385)
+
+        template = userdata.UserDataTemplate({'data': 'x' * 16384})
+        with self.assertRaises(userdata.UserDataTooLarge):
+            template.render(hostname='host1.foo.com', otp='xyz')
+
+    def test_s3_store(self):
+        """Test S3 keys are stored under the prefix."""
+        s3_conn = mock.Mock()
+        for prefix in ('foo', 'foo/'):
+            userdata.S3Store(s3_conn, 'bucket', prefix).put('abc', b'data')
+            s3_conn.put_object.assert_called_with(
+                Bucket='bucket', Key='foo/abc', Body=b'data'
+            )
+
+        userdata.S3Store(s3_conn, 'bucket').put('abc', b'data')
+        s3_conn.put_object.assert_called_with(
+            Bucket='bucket', Key='abc', Body=b'data'
+        )
+
+    def test_benchmark(self):
+        """Test user data rendering micro-benchmark."""
+        timings = _benchmark({'treadmill_cell': 'foo'}, count=10)
+        self.assertEqual(sorted(timings), ['full', 'template'])
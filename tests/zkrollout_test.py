@@ -0,0 +1,173 @@
+"""Tests for Zookeeper ensemble rollout."""
+
+import unittest
+
+import mock
+
+from treadmill_aws import zkrollout
+
+
+_SRVR = """Zookeeper version: 3.5.7-f0fdd52973d373ffd9c86b81d99842dc2c7f660e
+Latency min/avg/max: 0/0/12
+Received: 1223
+Sent: 1222
+Connections: 3
+Outstanding: 0
+Zxid: 0x20000001a
+Mode: leader
+Node count: 131
+"""
+
+_MNTR = """zk_version\t3.5.7-f0fdd52973d373ffd9c86b81d99842dc2c7f660e
+zk_server_state\tleader
+zk_followers\t2
+zk_synced_followers\t2
+"""
+
+
+def _masters():
+    return [
+        {'hostname': 'zk1.foo.com', 'idx': 1},
+        {'hostname': 'zk2.foo.com', 'idx': 2},
+        {'hostname': 'zk3.foo.com', 'idx': 3},
+    ]
+
+
+class ZkRolloutTest(unittest.TestCase):
+    """Tests Zookeeper ensemble rollout."""
+
+    @mock.patch('treadmill_aws.zkrollout.four_letter_word')
+    def test_server_stats(self, flw_mock):
+        """Test parsing four letter words output."""
+        flw_mock.side_effect = lambda _host, _port, cmd: {
+            'srvr': _SRVR, 'mntr': _MNTR
+        }[cmd]
+
+        self.assertEqual(
+            zkrollout.server_stats({'hostname': 'zk1.foo.com', 'idx': 1}),
+            {'state': 'leader', 'zxid': 0x20000001a, 'synced_followers': 2}
+        )
+        flw_mock.assert_has_calls([
+            mock.call('zk1.foo.com', 2181, 'srvr'),
+            mock.call('zk1.foo.com', 2181, 'mntr'),
+        ])
+
+        flw_mock.side_effect = ConnectionRefusedError()
+        self.assertIsNone(
+            zkrollout.server_stats({'hostname': 'zk1.foo.com', 'idx': 1})
+        )
+
+    def test_check_quorum(self):
+        """Test ensemble sync check."""
+        masters = _masters()
+        stats = {
+            'zk1.foo.com': {'state': 'follower', 'zxid': 10,
+                            'synced_followers': None},
+            'zk2.foo.com': {'state': 'leader', 'zxid': 10,
+                            'synced_followers': 2},
+            'zk3.foo.com': {'state': 'follower', 'zxid': 11,
+                            'synced_followers': None},
+        }
+        self.assertEqual(zkrollout.check_quorum(masters, stats), 'zk2.foo.com')
+
+        # Follower behind the leader.
+        stats['zk1.foo.com']['zxid'] = 9
+        self.assertIsNone(zkrollout.check_quorum(masters, stats))
+
+        # Follower not synced.
+        stats['zk1.foo.com']['zxid'] = 10
+        stats['zk2.foo.com']['synced_followers'] = 1
+        self.assertIsNone(zkrollout.check_quorum(masters, stats))
+
+        # Member down.
+        stats['zk2.foo.com']['synced_followers'] = 2
+        stats['zk3.foo.com'] = None
+        self.assertIsNone(zkrollout.check_quorum(masters, stats))
+
+    @mock.patch('treadmill_aws.zkrollout.server_stats')
+    @mock.patch('time.sleep', mock.Mock())
+    def test_rollout(self, server_stats_mock):
+        """Test followers are replaced first, each rejoining before next."""
+        ensemble = {
+            'zk1.foo.com': 'follower',
+            'zk2.foo.com': 'leader',
+            'zk3.foo.com': 'follower',
+        }
+        # Replaced members are down until polled once.
+        down = set()
+
+        def _server_stats(master, _admin_port):
+            hostname = master['hostname']
+            if hostname in down:
+                down.remove(hostname)
+                return None
+            return {
+                'state': ensemble[hostname],
+                'zxid': 10,
+                'synced_followers': (
+                    2 if ensemble[hostname] == 'leader' else None
+                ),
+            }
+
+        def _replace(master):
+            hostname = master['hostname']
+            self.assertFalse(down, 'Previous member not rejoined')
+            down.add(hostname)
+            if ensemble[hostname] == 'leader':
+                ensemble[hostname] = 'follower'
+                ensemble['zk1.foo.com'] = 'leader'
+
+        server_stats_mock.side_effect = _server_stats
+        replace_mock = mock.Mock(side_effect=_replace)
+
+        self.assertEqual(
+            zkrollout.rollout(_masters(), replace_mock, poll_interval=0),
+            ['zk1.foo.com', 'zk3.foo.com', 'zk2.foo.com']
+        )
+
+        # Not healthy, nothing is replaced.
+        replace_mock.reset_mock()
+        ensemble['zk3.foo.com'] = 'looking'
+        with self.assertRaises(zkrollout.ZkRolloutError):
+            zkrollout.rollout(_masters(), replace_mock, poll_interval=0)
+        replace_mock.assert_not_called()
+
+    @mock.patch('treadmill_aws.ec2client.get_image',
+                mock.Mock(return_value={'ImageId': 'ami-1'}))
+    @mock.patch('treadmill_aws.ec2client.get_instance')
+    @mock.patch('treadmill_aws.hostmanager.replace_zk')
+    @mock.patch('treadmill_aws.zkrollout.rollout')
+    def test_rollout_ensemble(self, rollout_mock, replace_zk_mock,
+                              get_instance_mock):
+        """Test instances are looked up upfront and replaced with image."""
+        get_instance_mock.side_effect = lambda _conn, hostnames: {
+            'InstanceType': 't2.large', 'Hostname': hostnames[0]
+        }
+        rollout_mock.side_effect = (
+            lambda masters, replace, **_kwargs: [replace(m) for m in masters]
+        )
+        on_replaced = mock.Mock()
+
+        zkrollout.rollout_ensemble(
+            'ec2', 'ipa', _masters(), 'zk-image', on_replaced=on_replaced
+        )
+
+        self.assertEqual(get_instance_mock.call_count, 3)
+        replace_zk_mock.assert_any_call(
+            ec2_conn='ec2',
+            instance_profile=None,
+            ipa_client='ipa',
+            master={'hostname': 'zk2.foo.com', 'idx': 2},
+            old_master={'InstanceType': 't2.large',
+                        'Hostname': 'zk2.foo.com'},
+            image_id='ami-1'
+        )
+        on_replaced.assert_has_calls([
+            mock.call('zk1.foo.com'),
+            mock.call('zk2.foo.com'),
+            mock.call('zk3.foo.com'),
+        ])
+
+
+if __name__ == '__main__':
+    unittest.main()